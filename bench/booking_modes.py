@@ -0,0 +1,148 @@
+# bench/booking_modes.py
+"""
+Transactional vs single-update Mongo bookings under contention.
+
+Seeds a scratch database with a few showtimes (seed.py generators, either
+seat layout), then for each MONGO_BOOKING_MODE runs `--clients` concurrent
+bookers that keep grabbing random adjacent seat pairs on `--shows` hot
+showtimes for `--duration` seconds. Reports committed bookings per second,
+conflicts (seats already taken), errors (e.g. transaction write conflicts
+that gave up) and booking latency, then checks the result: no seat is in
+two bookings and every booked seat is marked unavailable. The scratch
+database is dropped afterwards.
+
+The transactional mode needs a replica set (a single-node one is enough).
+
+    python -m bench.booking_modes --mongo-uri mongodb://localhost:27017/?replicaSet=rs0
+                                  [--clients 50] [--shows 2] [--duration 10] [--layout embedded]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.load import print_table, summarize
+from booking import try_book_seats, try_book_seats_single
+from seatmap import screen_layout, seat_map_for
+from seed import MOVIES, SCREENS, gen_showtimes
+
+MODES = {"transaction": try_book_seats, "single": try_book_seats_single}
+
+async def reset(db, layout: str, shows: int):
+    await db.showtimes.delete_many({})
+    await db.bookings.delete_many({})
+    await db.screens.delete_many({})
+    screens = [dict(s, layout=screen_layout(s["rows"], s["cols"])) for s in SCREENS]
+    await db.screens.insert_many(screens)
+    docs = []
+    for doc in gen_showtimes(MOVIES, screens, days=1, layout=layout):
+        docs.append(doc)
+        if len(docs) == shows:
+            break
+    await db.showtimes.insert_many(docs)
+    by_screen = {s["_id"]: s for s in screens}
+    return [(doc["_id"], seat_map_for(by_screen[doc["screenId"]]["layout"])) for doc in docs]
+
+async def run_mode(db, mode: str, shows, clients: int, duration: float, compact: bool):
+    book = MODES[mode]
+    rng = random.Random(0)
+    latencies = []
+    outcomes = Counter()
+    stop = time.perf_counter() + duration
+
+    async def client(c):
+        while time.perf_counter() < stop:
+            showtime_id, seat_map = rng.choice(shows)
+            i = rng.randrange(len(seat_map.seats) - 1)
+            seats = seat_map.seats[i:i + 2]
+            t = time.perf_counter()
+            res = await book(db, showtime_id, seats, user_id=f"c{c}",
+                             seat_map=seat_map if compact else None)
+            latencies.append(time.perf_counter() - t)
+            if res.get("success"):
+                outcomes["committed"] += 1
+            elif "DB error" in res.get("message", ""):
+                outcomes["errors"] += 1
+            else:
+                outcomes["conflicts"] += 1
+            if outcomes["committed"] * 2 >= sum(len(m.seats) for _, m in shows) * 0.9:
+                return  # nearly sold out; contention no longer means anything
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(c) for c in range(clients)))
+    elapsed = time.perf_counter() - start
+    return summarize(f"book ({mode})", latencies, elapsed), outcomes, elapsed
+
+async def verify(db, shows) -> list:
+    """Problems found: seats booked twice, or booked but still marked free."""
+    problems = []
+    booked = Counter()
+    async for b in db.bookings.find({}, {"showtimeId": 1, "seats": 1}):
+        booked.update((b["showtimeId"], s) for s in b["seats"])
+    async for show in db.showtimes.find({"outbox.0": {"$exists": True}}, {"outbox": 1}):
+        for b in show["outbox"]:
+            booked.update((b["showtimeId"], s) for s in b["seats"])
+    problems += [f"{st}:{seat} booked {n} times" for (st, seat), n in booked.items() if n > 1]
+    for showtime_id, seat_map in shows:
+        doc = await db.showtimes.find_one({"_id": showtime_id}, {"seats": 1, "avail": 1})
+        if "avail" in doc:
+            free = dict(zip(seat_map.seats, seat_map.unpack(doc["avail"])))
+        else:
+            free = {s["seat"]: s["available"] for s in doc["seats"]}
+        problems += [f"{showtime_id}:{seat} booked but free" for (st, seat) in booked
+                     if st == showtime_id and free[seat]]
+        taken = sum(1 for v in free.values() if not v)
+        counted = sum(1 for (st, _) in booked if st == showtime_id)
+        if taken != counted:
+            problems.append(f"{showtime_id}: {taken} seats taken, {counted} in bookings")
+    return problems
+
+async def main_async(args):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(args.mongo_uri)
+    name = "moviedb_bench_booking"
+    db = client[name]
+    results, failed = [], False
+    try:
+        for mode in args.modes.split(","):
+            shows = await reset(db, args.layout, args.shows)
+            result, outcomes, elapsed = await run_mode(db, mode, shows, args.clients, args.duration,
+                                                       args.layout == "compact")
+            results.append(result)
+            problems = await verify(db, shows)
+            print(f"{mode:<12} committed {outcomes['committed'] / elapsed:8.1f}/s  "
+                  f"conflicts {outcomes['conflicts']:6d}  errors {outcomes['errors']:6d}  "
+                  f"{'OK' if not problems else 'INCONSISTENT'}")
+            for p in problems[:10]:
+                print("   ", p)
+            failed |= bool(problems)
+    finally:
+        await client.drop_database(name)
+        client.close()
+    print()
+    print_table(results)
+    return failed
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--mongo-uri", default=os.getenv("MONGO_URI"))
+    ap.add_argument("--modes", default="transaction,single")
+    ap.add_argument("--layout", choices=("embedded", "compact"), default="embedded")
+    ap.add_argument("--clients", type=int, default=50, help="concurrent bookers")
+    ap.add_argument("--shows", type=int, default=2, help="showtimes they compete for")
+    ap.add_argument("--duration", type=float, default=10.0, help="seconds per mode")
+    args = ap.parse_args()
+    if not args.mongo_uri:
+        raise SystemExit("Pass --mongo-uri or set MONGO_URI")
+    if asyncio.run(main_async(args)):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
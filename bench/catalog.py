@@ -0,0 +1,92 @@
+# bench/catalog.py
+"""
+Synthetic catalogs for benchmarks, built with the seed.py generators
+(the daily showtime schedule, priced through pricing.PriceTable) and written
+as a moviedb.xlsx-style workbook for the Excel backend.
+
+    python -m bench.catalog out.xlsx [--movies 20] [--screens 8] [--days 14]
+"""
+import os
+import sys
+import random
+import argparse
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from seed import MOVIES, SCREENS, gen_showtimes
+
+def make_movies(n: int, rng: random.Random) -> list:
+    movies = [dict(m) for m in MOVIES[:n]]
+    for i in range(len(movies) + 1, n + 1):
+        movies.append({"_id": f"m{i}", "title": f"Movie {i}", "durationMin": rng.randrange(100, 181, 5),
+                       "language": "Hindi", "genre": ["Drama"], "rating": round(rng.uniform(6, 9), 1)})
+    return movies
+
+def make_screens(n: int, rng: random.Random) -> list:
+    screens = [dict(s) for s in SCREENS[:n]]
+    for i in range(len(screens) + 1, n + 1):
+        screens.append({"_id": f"s{i}", "name": f"Screen {i}", "rows": rng.randint(6, 16),
+                        "cols": rng.randint(8, 24), "basePrice": rng.randrange(150, 301, 10)})
+    return screens
+
+def build_catalog(movies: int = 5, screens: int = 3, days: int = 7, users: int = 3,
+                  seed: int = 0) -> dict:
+    """Return {sheet_name: DataFrame} in the layout excel_store expects."""
+    rng = random.Random(seed)
+    movie_docs = make_movies(movies, rng)
+    screen_docs = make_screens(screens, rng)
+    titles = {m["_id"]: m["title"] for m in movie_docs}
+    names = {s["_id"]: s["name"] for s in screen_docs}
+
+    cols = {k: [] for k in ("showtimeId", "movieTitle", "screenName", "startTime",
+                            "duration", "seat", "type", "price", "available")}
+    shows = 0
+    for st in gen_showtimes(movie_docs, screen_docs, days=days):
+        shows += 1
+        start = st["startTime"].replace(tzinfo=None)  # the sheet stores naive local times
+        for seat in st["seats"]:
+            cols["showtimeId"].append(st["_id"])
+            cols["movieTitle"].append(titles[st["movieId"]])
+            cols["screenName"].append(names[st["screenId"]])
+            cols["startTime"].append(start)
+            cols["duration"].append(st["duration"])
+            cols["seat"].append(seat["seat"])
+            cols["type"].append(seat["type"])
+            cols["price"].append(seat["price"])
+            cols["available"].append(seat["available"])
+
+    movie_frame = pd.DataFrame(movie_docs)
+    movie_frame["genre"] = movie_frame["genre"].map(", ".join)
+    return {
+        "Moviename": movie_frame,
+        "screen": pd.DataFrame(screen_docs),
+        "user": pd.DataFrame([{"_id": f"u{i}", "name": f"User {i}", "email": f"user{i}@example.com",
+                               "phone": f"+9100000{i:05d}"} for i in range(1, users + 1)]),
+        "booking": pd.DataFrame(columns=["bookingId", "userId", "showtimeId", "seats",
+                                         "totalPrice", "status", "CreatedAt"]),
+        "showtime": pd.DataFrame(cols),
+    }
+
+def write_catalog(path: str, **scale) -> dict:
+    from excel_utils import write_workbook
+    frames = build_catalog(**scale)
+    write_workbook(frames, path)
+    return frames
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("path")
+    ap.add_argument("--movies", type=int, default=5)
+    ap.add_argument("--screens", type=int, default=3)
+    ap.add_argument("--days", type=int, default=7)
+    ap.add_argument("--users", type=int, default=3)
+    args = ap.parse_args()
+    frames = write_catalog(args.path, movies=args.movies, screens=args.screens,
+                           days=args.days, users=args.users)
+    show = frames["showtime"]
+    print(f"{args.path}: {show['showtimeId'].nunique()} showtimes, {len(show)} seats")
+
+if __name__ == "__main__":
+    main()
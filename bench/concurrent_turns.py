@@ -0,0 +1,128 @@
+# bench/concurrent_turns.py
+"""
+Concurrency check for the LLM path: N webhooks in flight at once finish in
+about one model call, not N of them.
+
+Starts the app on a synthetic catalog with a slow fake model
+(llm_provider.FakeProvider, `--latency` seconds per call), then posts
+`--turns` messages from different phones to /whatsapp all at once. Each is
+free text (distinct, so neither the fast path nor the reply cache answers
+it) and goes to the model. Checks that:
+
+  * every turn reached the model;
+  * the calls overlapped: the peak number in flight reached the concurrency
+    limit (LLM_MAX_CONCURRENCY, `--limit`);
+  * the wall time is close to ceil(turns / limit) calls, far below
+    `turns` sequential ones.
+
+Exits non-zero if any check fails.
+
+    python -m bench.concurrent_turns [--turns 16] [--latency 0.5] [--limit 16]
+"""
+import os
+import sys
+import math
+import time
+import asyncio
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def counting_provider(latency: float):
+    """A FakeProvider that records how many calls are in flight at once."""
+    from llm_provider import FakeProvider
+
+    class CountingProvider(FakeProvider):
+        inflight = 0
+        peak = 0
+
+        def _enter(self):
+            self.inflight += 1
+            self.peak = max(self.peak, self.inflight)
+
+        async def generate(self, prompt):
+            self._enter()
+            try:
+                return await super().generate(prompt)
+            finally:
+                self.inflight -= 1
+
+        async def stream(self, prompt):
+            self._enter()
+            try:
+                async for piece in super().stream(prompt):
+                    yield piece
+            finally:
+                self.inflight -= 1
+
+    return CountingProvider(latency, seed=0)
+
+async def run(args) -> list:
+    import logging
+    import httpx
+    import main
+    import chatbot
+
+    logging.getLogger().setLevel(logging.WARNING)
+    provider = chatbot.llm_client.provider = counting_provider(args.latency)
+
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            async def turn(i):
+                r = await client.post("/whatsapp", data={"Body": f"hello, what is on tonight? ({i})",
+                                                          "From": f"whatsapp:+1555{i:07d}"})
+                r.raise_for_status()
+
+            start = time.perf_counter()
+            await asyncio.gather(*(turn(i) for i in range(args.turns)))
+            elapsed = time.perf_counter() - start
+
+    waves = math.ceil(args.turns / args.limit)
+    expected = waves * args.latency
+    print(f"{args.turns} turns, model latency {args.latency:.3f}s, limit {args.limit}: "
+          f"{elapsed:.3f}s wall (~{expected:.3f}s expected, {args.turns * args.latency:.3f}s if serial), "
+          f"{provider.calls} model calls, peak {provider.peak} in flight")
+
+    problems = []
+    if provider.calls < args.turns:
+        problems.append(f"only {provider.calls} of {args.turns} turns reached the model")
+    if provider.peak < min(args.turns, args.limit):
+        problems.append(f"model calls did not overlap (peak {provider.peak} in flight)")
+    if elapsed > expected + args.latency * 0.5 + args.slack:
+        problems.append(f"took {elapsed:.3f}s, more than ~{waves} model call(s)")
+    return problems
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--turns", type=int, default=16, help="concurrent webhooks")
+    ap.add_argument("--latency", type=float, default=0.5, help="fake model seconds per call")
+    ap.add_argument("--limit", type=int, default=int(os.getenv("LLM_MAX_CONCURRENCY", 16)),
+                    help="LLM_MAX_CONCURRENCY for the run")
+    ap.add_argument("--slack", type=float, default=0.25, help="seconds allowed for the app's own work")
+    args = ap.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        from bench.catalog import write_catalog
+
+        path = os.path.join(tmp, "moviedb.xlsx")
+        write_catalog(path, movies=3, screens=2, days=1)
+        # Must be in place before the app modules read their configuration
+        os.environ.update(EXCEL_FILE=path, SESSION_BACKEND="memory", REPLY_MODE="sync",
+                          LLM_MAX_CONCURRENCY=str(args.limit), LLM_HEDGE="false")
+        os.chdir(tmp)  # journal, snapshot and LTM files stay in the temp directory
+        try:
+            problems = asyncio.run(run(args))
+        finally:
+            os.chdir(cwd)
+
+    for p in problems:
+        print("FAIL", p)
+    print("OK: turns ran concurrently" if not problems else f"{len(problems)} problems")
+    sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+    main()
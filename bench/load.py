@@ -0,0 +1,351 @@
+# bench/load.py
+"""
+Load test and hot-path benchmarks with local fakes.
+
+Builds a synthetic catalog (bench.catalog) in a temp directory, starts the
+app on the Excel backend with a fake LLM provider (llm_provider.FakeProvider,
+optionally with a slow tail) and a fake SMTP server, then:
+
+  * drives full conversations (greeting -> movie -> time -> seats -> confirm)
+    through the /whatsapp webhook at the given concurrency;
+  * drives browsing turns (greeting -> movie -> time, no booking) alone and
+    again while bookings stream in at `--booking-rate` per second, and
+    checks that their p99 stays within `--p99-tolerance` (plus
+    `--p99-slack-ms`) of the solo run: bookings, their journal writes and
+    the workbook compactions they trigger must stay off the event loop;
+  * times the hot paths on their own: ContextBuilder.build (make_context),
+    pick_best_seats, ExcelStore.book, mem0_set / mem0_get.
+
+For each it reports throughput, p50/p95/p99 latency and the peak memory
+allocated (tracemalloc, measured in a separate pass so it doesn't skew the
+timings). `--save` writes the results as JSON; `--baseline` compares p95s
+against a saved run. Exits non-zero on a regression or a failed p99 check.
+
+    python -m bench.load [--movies 5 --screens 3 --days 7] [--users 200]
+                         [--concurrency 50] [--llm-latency 0.05] [--iterations 2000]
+                         [--llm-tail-rate 0.05 --llm-tail-latency 1.0]
+                         [--booking-rate 200] [--p99-tolerance 1.0]
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# ---------------- Fakes ----------------
+
+_STAGE_RE = re.compile(r'"stage": "(\w+)"')
+
+def bench_reply(prompt: str) -> str:
+    """A plausible reply per stage: the confirm stage supplies name and email and books."""
+    m = _STAGE_RE.search(prompt)
+    if m and m.group(1) == "confirm":
+        out = {"reply": "Booking your seats now.",
+               "set": {"name": "Bench User", "email": "bench@example.com"},
+               "action": {"confirm_booking": True}}
+    else:
+        out = {"reply": "Hello! Which movie would you like to watch?", "set": {}, "action": {}}
+    return json.dumps(out) + "\n"
+
+class FakeSMTP:
+    """Accepts every message; enough of aiosmtplib.SMTP for MailQueue."""
+
+    sent = 0
+
+    def __init__(self):
+        self.is_connected = True
+
+    async def send_message(self, msg):
+        FakeSMTP.sent += 1
+
+    async def quit(self):
+        self.is_connected = False
+
+    def close(self):
+        self.is_connected = False
+
+async def _fake_connect():
+    return FakeSMTP()
+
+# ---------------- Measurement ----------------
+
+def _pct(samples, q):
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+def summarize(name: str, latencies, elapsed: float, peak_bytes: int = 0) -> dict:
+    s = sorted(latencies)
+    return {
+        "name": name,
+        "n": len(s),
+        "rps": len(s) / elapsed if elapsed else 0.0,
+        "p50_ms": _pct(s, 0.50) * 1000,
+        "p95_ms": _pct(s, 0.95) * 1000,
+        "p99_ms": _pct(s, 0.99) * 1000,
+        "mean_ms": statistics.fmean(s) * 1000,
+        "peak_kib": peak_bytes / 1024,
+    }
+
+async def measure(name: str, fn, n: int, mem_n: int) -> dict:
+    """Time `n` sequential calls of `fn(i)`, then find peak allocation over `mem_n` more."""
+    latencies = []
+    start = time.perf_counter()
+    for i in range(n):
+        t = time.perf_counter()
+        r = fn(i)
+        if asyncio.iscoroutine(r):
+            await r
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    for i in range(n, n + mem_n):
+        r = fn(i)
+        if asyncio.iscoroutine(r):
+            await r
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return summarize(name, latencies, elapsed, peak)
+
+def print_table(results):
+    print(f"{'component':<22}{'n':>7}{'req/s':>11}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak KiB':>11}")
+    for r in results:
+        print(f"{r['name']:<22}{r['n']:>7}{r['rps']:>11.1f}{r['p50_ms']:>10.3f}"
+              f"{r['p95_ms']:>10.3f}{r['p99_ms']:>10.3f}{r['peak_kib']:>11.1f}")
+
+def compare(results, baseline_path: str, tolerance: float) -> bool:
+    """True if no component's p95 got worse than `tolerance` (fraction) versus the baseline."""
+    with open(baseline_path) as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"]}
+    ok = True
+    for r in results:
+        b = baseline.get(r["name"])
+        if b and b["p95_ms"] > 0 and r["p95_ms"] > b["p95_ms"] * (1 + tolerance):
+            print(f"REGRESSION {r['name']}: p95 {b['p95_ms']:.3f} -> {r['p95_ms']:.3f} ms")
+            ok = False
+    return ok
+
+# ---------------- Workloads ----------------
+
+CONFIRM = "yes"  # the booking turn of a conversation
+
+def conversation_for(u: int, movies: int) -> list:
+    """Greeting, movie, showtime, 2 best seats, confirm; users are spread over movies and times."""
+    return ["hi", str(1 + u % movies), str(1 + (u // movies) % 5), "2", CONFIRM]
+
+def browse_for(u: int, movies: int) -> list:
+    """Greeting, movie, showtime: turns that never book."""
+    return conversation_for(u, movies)[:3]
+
+async def run_webhook(app, users: int, concurrency: int, movies: int, offset: int = 0,
+                      script_for=conversation_for):
+    """Run `users` scripted conversations, at most `concurrency` at a time."""
+    import httpx
+
+    turns, bookings = [], []
+    slots = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def conversation(u):
+            async with slots:
+                phone = f"whatsapp:+1555{offset + u:07d}"
+                for text in script_for(offset + u, movies):
+                    t = time.perf_counter()
+                    r = await client.post("/whatsapp", data={"Body": text, "From": phone})
+                    r.raise_for_status()
+                    (bookings if text == CONFIRM else turns).append(time.perf_counter() - t)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(conversation(u) for u in range(users)))
+        elapsed = time.perf_counter() - start
+    return turns, bookings, elapsed
+
+async def book_steadily(store, shows, rate: float, stop: asyncio.Event) -> int:
+    """
+    Book 2 best seats at `rate` per second, round-robin over `shows`, until
+    `stop` is set. Bookings that fell due while the loop was busy are made
+    on the next wakeup, so the rate holds under load.
+    """
+    booked = 0
+    i = 0
+    next_at = time.perf_counter()
+    while not stop.is_set():
+        while next_at <= time.perf_counter():
+            show = shows[i % len(shows)]
+            seats = show.best_seats(2)
+            if seats:
+                res = await store.book(show.showtime_id, seats, "bench@example.com", "Bench", f"+1999{i:07d}")
+                booked += res["success"]
+            i += 1
+            next_at += 1 / rate
+        await asyncio.sleep(next_at - time.perf_counter())
+    return booked
+
+async def turns_under_bookings(app, store, shows, args, movies: int, offset: int) -> list:
+    """Browsing turns alone, then the same load while bookings stream in (see module doc)."""
+    alone, _, elapsed = await run_webhook(app, args.users, args.concurrency, movies,
+                                          offset=offset, script_for=browse_for)
+    stop = asyncio.Event()
+    booker = asyncio.create_task(book_steadily(store, shows, args.booking_rate, stop))
+    try:
+        contended, _, contended_elapsed = await run_webhook(app, args.users, args.concurrency, movies,
+                                                            offset=offset + args.users,
+                                                            script_for=browse_for)
+    finally:
+        stop.set()
+        booked = await booker
+    print(f"{booked} bookings during the contended browsing run")
+    return [summarize("browse (alone)", alone, elapsed),
+            summarize("browse (+bookings)", contended, contended_elapsed)]
+
+def check_p99(alone: dict, contended: dict, tolerance: float, slack_ms: float) -> bool:
+    """True if browsing p99 under bookings is within `tolerance` (fraction) plus `slack_ms` of the solo p99."""
+    limit = alone["p99_ms"] * (1 + tolerance) + slack_ms
+    if contended["p99_ms"] > limit:
+        print(f"REGRESSION non-booking turns under bookings: p99 {alone['p99_ms']:.3f} -> "
+              f"{contended['p99_ms']:.3f} ms (limit {limit:.3f} ms)")
+        return False
+    return True
+
+async def run(args):
+    import logging
+    import main
+    import booking
+    import chatbot
+    import mem0_client
+    from conversation import Conversation
+    from fastpath import fastpath_stats
+    from llm_provider import FakeProvider
+    from session_store import Session
+
+    logging.getLogger().setLevel(logging.WARNING)  # per-message INFO logs would dominate
+    chatbot.llm_client.provider = FakeProvider(args.llm_latency, reply=bench_reply,
+                                               tail_rate=args.llm_tail_rate,
+                                               tail_latency=args.llm_tail_latency, seed=0)
+    main.mail_queue._connect = _fake_connect
+    mem0_client.STORE_DIR = os.path.join(os.getcwd(), "ltm_store")
+    rng = random.Random(0)
+    results = []
+
+    async with main.lifespan(main.app):
+        store = main.store
+        shows = list(store.inventory.shows.values())
+        print(f"catalog: {len(shows)} showtimes, {sum(len(s.seats) for s in shows)} seats")
+
+        # Full conversations through the webhook
+        movies = len(store.movie_list())
+        turns, bookings, elapsed = await run_webhook(main.app, args.users, args.concurrency, movies)
+        results.append(summarize("webhook (turn)", turns, elapsed))
+        results.append(summarize("webhook (booking)", bookings, elapsed))
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        await run_webhook(main.app, max(args.users // 10, 1), args.concurrency, movies,
+                          offset=args.users)
+        peak = tracemalloc.get_traced_memory()[1] - base
+        tracemalloc.stop()
+        results[-2]["peak_kib"] = results[-1]["peak_kib"] = peak / 1024
+
+        # Non-booking turns must not slow down while bookings are committed
+        results += await turns_under_bookings(main.app, store, shows, args, movies,
+                                              offset=args.users + max(args.users // 10, 1))
+
+        # Hot paths on their own
+        stages = ["greeting", "ask_time", "ask_seats", "confirm"]
+        sessions = []
+        for i in range(64):
+            show = rng.choice(shows)
+            sessions.append(Session(phone=f"+1666{i:07d}", stage=stages[i % 4], movieTitle=show.movie_title,
+                                    showtimeId=show.showtime_id,
+                                    stm=Conversation([{"user": "hi"}, {"bot": "Hello!"}] * 3)))
+        results.append(await measure(
+            "make_context", lambda i: main.context_builder.build(sessions[i % len(sessions)]),
+            args.iterations, args.iterations // 10))
+
+        results.append(await measure(
+            "pick_best_seats",
+            lambda i: booking.pick_best_seats(shows[i % len(shows)].available_seats(), 1 + i % 6,
+                                              shows[i % len(shows)].layout),
+            args.iterations, args.iterations // 10))
+
+        async def book(i):
+            show = shows[rng.randrange(len(shows))]
+            seats = show.best_seats(2)
+            if seats:
+                await store.book(show.showtime_id, seats, "bench@example.com", "Bench", f"+1777{i:07d}")
+        results.append(await measure("store.book", book, args.iterations, args.iterations // 10))
+
+        memory = {"summary": "bench", "stage": "feedback"}
+        results.append(await measure(
+            "mem0_set", lambda i: mem0_client.mem0_set(f"+1888{i % 500:07d}", memory),
+            args.iterations, args.iterations // 10))
+        results.append(await measure(
+            "mem0_get", lambda i: mem0_client.mem0_get(f"+1888{i % 500:07d}"),
+            args.iterations, args.iterations // 10))
+
+    print_table(results)
+    print(f"llm calls {chatbot.llm_stats['calls']}, hedges {chatbot.llm_stats['hedges']} "
+          f"(won {chatbot.llm_stats['hedge_wins']}), cache hits {chatbot.response_cache.hits}, "
+          f"fast path {fastpath_stats['hits']}/{fastpath_stats['hits'] + fastpath_stats['misses']}, "
+          f"emails {FakeSMTP.sent}")
+    return results
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--movies", type=int, default=5)
+    ap.add_argument("--screens", type=int, default=3)
+    ap.add_argument("--days", type=int, default=7)
+    ap.add_argument("--users", type=int, default=200, help="conversations driven through the webhook")
+    ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--llm-latency", type=float, default=0.05, help="fake LLM seconds per call")
+    ap.add_argument("--llm-tail-rate", type=float, default=0.0, help="fraction of fake LLM calls that are slow")
+    ap.add_argument("--llm-tail-latency", type=float, default=1.0, help="seconds a slow fake LLM call takes")
+    ap.add_argument("--iterations", type=int, default=2000, help="calls per hot-path benchmark")
+    ap.add_argument("--save", help="write results as JSON")
+    ap.add_argument("--baseline", help="JSON from an earlier --save to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 slowdown vs baseline")
+    ap.add_argument("--booking-rate", type=float, default=200,
+                    help="bookings per second during the contended browsing run")
+    ap.add_argument("--p99-tolerance", type=float, default=1.0,
+                    help="allowed browsing p99 slowdown under bookings (fraction of the solo p99)")
+    ap.add_argument("--p99-slack-ms", type=float, default=10.0,
+                    help="absolute allowance on top of --p99-tolerance, for timer noise")
+    args = ap.parse_args()
+
+    save = os.path.abspath(args.save) if args.save else None
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        from bench.catalog import write_catalog
+
+        path = os.path.join(tmp, "moviedb.xlsx")
+        write_catalog(path, movies=args.movies, screens=args.screens, days=args.days)
+        # Must be in place before the app modules read their configuration
+        os.environ.update(EXCEL_FILE=path, SESSION_BACKEND="memory", REPLY_MODE="sync")
+        os.chdir(tmp)  # journal, snapshot and LTM files stay in the temp directory
+        try:
+            results = asyncio.run(run(args))
+        finally:
+            os.chdir(cwd)
+
+    if save:
+        with open(save, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    by_name = {r["name"]: r for r in results}
+    ok = check_p99(by_name["browse (alone)"], by_name["browse (+bookings)"],
+                   args.p99_tolerance, args.p99_slack_ms)
+    if args.baseline and not compare(results, args.baseline, args.tolerance):
+        ok = False
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
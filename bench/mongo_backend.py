@@ -0,0 +1,131 @@
+# bench/mongo_backend.py
+"""
+End-to-end run of the app on the Mongo backend (STORAGE_BACKEND=mongo).
+
+Seeds a scratch database (seed.py demo movies and screens, `--days` of
+showtimes in either seat layout), starts the app against it with a fake LLM
+provider and a fake SMTP server, and drives `--users` full conversations
+(greeting -> movie -> time -> seats -> confirm, as in bench.load) through
+the /whatsapp webhook. Reports turn and booking throughput and latency,
+then checks the result:
+
+  * every conversation booked its seats (a bookings row each, after the
+    outbox relay when MONGO_BOOKING_MODE=single);
+  * no seat is in two bookings and every booked seat is marked unavailable;
+  * picking a movie, a showtime and seats were all answered by the fast
+    path, i.e. the picked movie's showtimes were loaded from Mongo in time.
+
+The scratch database is dropped afterwards; exits non-zero on any problem.
+
+    python -m bench.mongo_backend --mongo-uri mongodb://localhost:27017/?replicaSet=rs0
+                                  [--mode transaction] [--layout embedded]
+                                  [--users 200] [--concurrency 50] [--days 2]
+"""
+import os
+import sys
+import asyncio
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DB_NAME = "moviedb_bench_backend"
+
+async def seed(db, layout: str, days: int):
+    from seatmap import screen_layout, seat_map_for
+    from seed import MOVIES, SCREENS, batched, gen_showtimes
+
+    for name in ("movies", "screens", "showtimes", "bookings", "users"):
+        await db[name].delete_many({})
+    await db.movies.insert_many([dict(m) for m in MOVIES])
+    screens = [dict(s, layout=screen_layout(s["rows"], s["cols"])) for s in SCREENS]
+    await db.screens.insert_many(screens)
+    shows = []
+    by_screen = {s["_id"]: s for s in screens}
+    for batch in batched(gen_showtimes(MOVIES, screens, days=days, layout=layout), 500):
+        await db.showtimes.insert_many(batch, ordered=False)
+        shows += [(doc["_id"], seat_map_for(by_screen[doc["screenId"]]["layout"])) for doc in batch]
+    return shows
+
+async def run(args) -> list:
+    import logging
+    from motor.motor_asyncio import AsyncIOMotorClient
+    import main
+    import chatbot
+    import mem0_client
+    from booking import relay_booking_outbox
+    from fastpath import fastpath_stats
+    from llm_provider import FakeProvider
+    from bench.booking_modes import verify
+    from bench.load import FakeSMTP, _fake_connect, bench_reply, print_table, run_webhook, summarize
+
+    logging.getLogger().setLevel(logging.WARNING)
+    chatbot.llm_client.provider = FakeProvider(args.llm_latency, reply=bench_reply, seed=0)
+    main.mail_queue._connect = _fake_connect
+    mem0_client.STORE_DIR = os.path.join(os.getcwd(), "ltm_store")
+
+    client = AsyncIOMotorClient(args.mongo_uri)
+    db = client[DB_NAME]
+    try:
+        shows = await seed(db, args.layout, args.days)
+        print(f"seeded {len(shows)} {args.layout} showtimes, booking mode {args.mode}")
+
+        async with main.lifespan(main.app):
+            movies = len(main.store.movie_list())
+            turns, bookings, elapsed = await run_webhook(main.app, args.users, args.concurrency, movies)
+        results = [summarize("webhook (turn)", turns, elapsed),
+                   summarize("webhook (booking)", bookings, elapsed)]
+
+        # Whatever the requests left in showtime outboxes (single mode) is delivered by now
+        await relay_booking_outbox(db)
+        problems = await verify(db, shows)
+        booked = await db.bookings.count_documents({})
+        if booked != args.users:
+            problems.append(f"{booked} bookings for {args.users} conversations")
+        # movie, showtime and seat picks; greetings and confirmations go to the model
+        if fastpath_stats["hits"] < 3 * args.users:
+            problems.append(f"fast path answered {fastpath_stats['hits']} turns, "
+                            f"expected {3 * args.users} (movie, showtime and seat picks)")
+    finally:
+        await client.drop_database(DB_NAME)
+        client.close()
+
+    print_table(results)
+    print(f"bookings {booked}, llm calls {chatbot.llm_stats['calls']}, "
+          f"fast path {fastpath_stats['hits']}/{fastpath_stats['hits'] + fastpath_stats['misses']}, "
+          f"emails {FakeSMTP.sent}")
+    return problems
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--mongo-uri", default=os.getenv("MONGO_URI"))
+    ap.add_argument("--mode", choices=("transaction", "single"), default="transaction",
+                    help="MONGO_BOOKING_MODE (transaction needs a replica set)")
+    ap.add_argument("--layout", choices=("embedded", "compact"), default="embedded")
+    ap.add_argument("--days", type=int, default=2, help="days of showtimes to seed")
+    ap.add_argument("--users", type=int, default=200, help="conversations driven through the webhook")
+    ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--llm-latency", type=float, default=0.05, help="fake LLM seconds per call")
+    args = ap.parse_args()
+    if not args.mongo_uri:
+        raise SystemExit("Pass --mongo-uri or set MONGO_URI")
+
+    # Must be in place before the app modules read their configuration
+    os.environ.update(MONGO_URI=args.mongo_uri, MONGO_DB=DB_NAME, STORAGE_BACKEND="mongo",
+                      MONGO_BOOKING_MODE=args.mode, SESSION_BACKEND="memory", REPLY_MODE="sync")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # LTM files stay in the temp directory
+        try:
+            problems = asyncio.run(run(args))
+        finally:
+            os.chdir(cwd)
+
+    for p in problems[:20]:
+        print("FAIL", p)
+    print("OK" if not problems else f"{len(problems)} problems")
+    sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# bench/seed_layout.py
+"""
+Embedded seat arrays vs the compact layout (seatmap.py) for Mongo showtimes.
+
+Offline, for each layout it measures streamed generation of the schedule
+(time and peak memory), the BSON size of the showtime documents, and the
+size and build time of a 2-seat booking's guarded update. With a Mongo URI
+(--mongo-uri or MONGO_URI) it also seeds a scratch database per layout in
+batches, reports the collection's storage size and times guarded booking
+updates against it; the scratch databases are dropped afterwards.
+
+    python -m bench.seed_layout [--days 7 --screens 3 --cities 1] [--bookings 2000]
+                                [--mongo-uri mongodb://localhost:27017]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+
+import bson
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.load import print_table, summarize
+from booking import _seat_guard
+from seatmap import screen_layout, seat_map_for
+from seed import MOVIES, SCREENS, gen_screens, gen_showtimes, seed_showtimes
+
+LAYOUTS = ("embedded", "compact")
+
+def _seat_ids(doc, screen):
+    if "seats" in doc:
+        return [s["seat"] for s in doc["seats"]]
+    return seat_map_for(screen["layout"]).seats
+
+def measure_offline(layout: str, screens, days: int) -> dict:
+    """Generation time, peak memory and document sizes of one streamed schedule."""
+    start = time.perf_counter()
+    count = 0
+    for _ in gen_showtimes(MOVIES, screens, days=days, layout=layout):
+        count += 1
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    sizes = [len(bson.encode(doc)) for doc in gen_showtimes(MOVIES, screens, days=days, layout=layout)]
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+
+    # A typical booking: two adjacent seats in the middle of the screen
+    doc = next(gen_showtimes(MOVIES, screens, days=1, layout=layout))
+    seat_map = seat_map_for(screens[0]["layout"]) if layout == "compact" else None
+    mid = screens[0]["rows"] // 2 * screens[0]["cols"] + screens[0]["cols"] // 2
+    seats = _seat_ids(doc, screens[0])[mid:mid + 2]
+    n = 10000
+    t = time.perf_counter()
+    for _ in range(n):
+        query, update, array_filters = _seat_guard(doc["_id"], seats, seat_map)
+    guard_us = (time.perf_counter() - t) / n * 1e6
+    update_bytes = len(bson.encode({"q": query, "u": update, "arrayFilters": array_filters or []}))
+
+    return {"layout": layout, "showtimes": count, "gen_s": elapsed, "peak_kib": peak / 1024,
+            "doc_bytes": sum(sizes) / len(sizes), "total_kib": sum(sizes) / 1024,
+            "guard_us": guard_us, "update_bytes": update_bytes}
+
+def measure_mongo(uri: str, layout: str, screens, days: int, bookings: int, batch_size: int):
+    """Seed a scratch database and time guarded 2-seat bookings on it."""
+    from pymongo import MongoClient
+
+    client = MongoClient(uri)
+    name = f"moviedb_bench_{layout}"
+    client.drop_database(name)
+    db = client[name]
+    try:
+        db.screens.insert_many([dict(s) for s in screens])
+        start = time.perf_counter()
+        count = seed_showtimes(db.showtimes, gen_showtimes(MOVIES, screens, days=days, layout=layout),
+                               batch_size)
+        seed_s = time.perf_counter() - start
+        stats = db.command("collStats", "showtimes")
+
+        # Book random pairs until each showtime has seen a few bookings
+        rng = random.Random(0)
+        by_screen = {s["_id"]: s for s in screens}
+        shows = list(db.showtimes.find({}, {"screenId": 1, "seats.seat": 1}))
+        latencies = []
+        t0 = time.perf_counter()
+        for _ in range(bookings):
+            doc = rng.choice(shows)
+            screen = by_screen[doc["screenId"]]
+            seat_map = seat_map_for(screen["layout"]) if layout == "compact" else None
+            ids = _seat_ids(doc, screen)
+            i = rng.randrange(len(ids) - 1)
+            query, update, array_filters = _seat_guard(doc["_id"], ids[i:i + 2], seat_map)
+            t = time.perf_counter()
+            db.showtimes.update_one(query, update, array_filters=array_filters)
+            latencies.append(time.perf_counter() - t)
+        result = summarize(f"book ({layout})", latencies, time.perf_counter() - t0)
+        return {"layout": layout, "showtimes": count, "seed_s": seed_s,
+                "size_kib": stats["size"] / 1024, "storage_kib": stats["storageSize"] / 1024}, result
+    finally:
+        client.drop_database(name)
+        client.close()
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--days", type=int, default=7)
+    ap.add_argument("--screens", type=int, default=len(SCREENS), help="screens per city")
+    ap.add_argument("--cities", type=int, default=1)
+    ap.add_argument("--bookings", type=int, default=2000, help="guarded updates per layout (Mongo only)")
+    ap.add_argument("--batch-size", type=int, default=500)
+    ap.add_argument("--mongo-uri", default=os.getenv("MONGO_URI"))
+    args = ap.parse_args()
+
+    screens = gen_screens(SCREENS, args.screens, args.cities)
+    for s in screens:
+        s["layout"] = screen_layout(s["rows"], s["cols"])
+
+    print(f"{'layout':<10}{'shows':>8}{'gen s':>8}{'peak KiB':>10}{'doc B':>9}{'total KiB':>11}"
+          f"{'guard us':>10}{'update B':>10}")
+    for layout in LAYOUTS:
+        r = measure_offline(layout, screens, args.days)
+        print(f"{r['layout']:<10}{r['showtimes']:>8}{r['gen_s']:>8.2f}{r['peak_kib']:>10.1f}"
+              f"{r['doc_bytes']:>9.0f}{r['total_kib']:>11.1f}{r['guard_us']:>10.1f}{r['update_bytes']:>10}")
+
+    if not args.mongo_uri:
+        print("(no Mongo URI: skipped seeding and booking-update timings)")
+        return
+    print()
+    seeded, booked = [], []
+    for layout in LAYOUTS:
+        s, b = measure_mongo(args.mongo_uri, layout, screens, args.days, args.bookings, args.batch_size)
+        seeded.append(s)
+        booked.append(b)
+    print(f"{'layout':<10}{'shows':>8}{'seed s':>8}{'size KiB':>10}{'storage KiB':>13}")
+    for s in seeded:
+        print(f"{s['layout']:<10}{s['showtimes']:>8}{s['seed_s']:>8.2f}{s['size_kib']:>10.1f}{s['storage_kib']:>13.1f}")
+    print()
+    print_table(booked)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# bench/smtp_delivery.py
+"""
+MailQueue against a real (local) SMTP server.
+
+Starts an aiosmtpd server on localhost that accepts every message, except
+that every `--fail-every`th delivery attempt gets a transient 451 reply.
+Enqueues `--messages` booking emails concurrently into a MailQueue with
+`--pool` connections and a queue smaller than the burst (so enqueue has to
+wait), then calls drain() straight away. Checks that:
+
+  * drain() returned with the queue empty and every message delivered
+    exactly once (by recipient), the rejected ones after a retry;
+  * the workers reused their connections: no more SMTP sessions were
+    opened than the pool size plus one reconnect per retried error.
+
+Exits non-zero if any check fails.
+
+    python -m bench.smtp_delivery [--messages 500] [--pool 2] [--fail-every 50]
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+from collections import Counter
+
+from aiosmtpd.controller import Controller
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class RecordingHandler:
+    """Records delivered recipients and the client connections they came over."""
+
+    def __init__(self, fail_every: int):
+        self.fail_every = fail_every
+        self.attempts = 0
+        self.delivered = Counter()
+        self.peers = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        self.peers.add(session.peer)
+        self.attempts += 1
+        if self.fail_every and self.attempts % self.fail_every == 0:
+            return "451 Try again later"
+        self.delivered.update(envelope.rcpt_tos)
+        return "250 Message accepted for delivery"
+
+async def run(args, port: int, handler: RecordingHandler) -> list:
+    from mailer import MailQueue
+
+    queue = MailQueue(pool_size=args.pool, maxsize=args.queue_size, hostname="127.0.0.1", port=port,
+                      username=None, password=None, start_tls=False, retry_base=0.01)
+    queue.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        queue.enqueue_booking_email(f"user{i}@example.com", "Bench Movie", "20-09-2025 10:00",
+                                    ["A1", "A2"], name="Bench", booking_ref=str(i),
+                                    seat_prices={"A1": 250, "A2": 250})
+        for i in range(args.messages)
+    ))
+    enqueued = time.perf_counter() - start
+    await queue.drain(timeout=args.timeout)
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.messages} messages over {args.pool} connections: enqueued in {enqueued:.3f}s, "
+          f"drained in {elapsed:.3f}s ({args.messages / elapsed:.0f} msg/s); "
+          f"stats {queue.stats}, {len(handler.peers)} SMTP sessions")
+
+    problems = []
+    if queue.pending():
+        problems.append(f"{queue.pending()} messages still queued after drain()")
+    missing = [i for i in range(args.messages) if not handler.delivered[f"user{i}@example.com"]]
+    if missing:
+        problems.append(f"{len(missing)} messages never delivered (e.g. user{missing[0]})")
+    twice = [r for r, n in handler.delivered.items() if n > 1]
+    if twice:
+        problems.append(f"{len(twice)} messages delivered more than once")
+    if queue.stats["sent"] != args.messages or queue.stats["failed"]:
+        problems.append(f"queue stats {queue.stats} for {args.messages} messages")
+    if len(handler.peers) > args.pool + queue.stats["retried"]:
+        problems.append(f"{len(handler.peers)} SMTP sessions for a pool of {args.pool} "
+                        f"and {queue.stats['retried']} retries")
+    return problems
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--messages", type=int, default=500)
+    ap.add_argument("--pool", type=int, default=2, help="SMTP_POOL_SIZE")
+    ap.add_argument("--queue-size", type=int, default=50, help="MAIL_QUEUE_SIZE")
+    ap.add_argument("--fail-every", type=int, default=50, help="reply 451 to every Nth attempt (0: never)")
+    ap.add_argument("--timeout", type=float, default=60, help="seconds drain() may take")
+    args = ap.parse_args()
+
+    import logging
+    logging.getLogger().setLevel(logging.ERROR)  # one INFO line per email otherwise
+    os.environ.setdefault("EMAIL_USER", "moviebot@example.com")  # the From header; read on import
+    handler = RecordingHandler(args.fail_every)
+    controller = Controller(handler, hostname="127.0.0.1", port=_free_port())
+    controller.start()
+    try:
+        problems = asyncio.run(run(args, controller.port, handler))
+    finally:
+        controller.stop()
+
+    for p in problems:
+        print("FAIL", p)
+    print("OK: every message delivered" if not problems else f"{len(problems)} problems")
+    sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+    main()
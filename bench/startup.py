@@ -0,0 +1,64 @@
+# bench/startup.py
+"""
+Startup-time benchmark.
+
+Measures importing `main` (no data is loaded at import time) and loading the
+Excel backend cold (openpyxl, no snapshot) versus warm (binary snapshot).
+
+    python -m bench.startup [--workbook moviedb.xlsx] [--runs 5]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def _import_main_seconds(env: dict) -> float:
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+def _load_seconds(path: str) -> float:
+    from excel_store import ExcelStore
+    store = ExcelStore(path)
+    t = time.perf_counter()
+    store.load()
+    elapsed = time.perf_counter() - t
+    store.close()
+    return elapsed
+
+def _report(label: str, samples):
+    print(f"{label:<28} median {statistics.median(samples) * 1000:8.1f} ms"
+          f"   min {min(samples) * 1000:8.1f} ms   (n={len(samples)})")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--workbook", default=os.path.join(ROOT, "moviedb.xlsx"))
+    ap.add_argument("--runs", type=int, default=5)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "moviedb.xlsx")
+        shutil.copy(args.workbook, path)
+        env = dict(os.environ, EXCEL_FILE=path)
+
+        _report("import main", [_import_main_seconds(env) for _ in range(args.runs)])
+
+        snapshot = os.path.join(tmp, "moviedb.snapshot.pkl")
+        cold = []
+        for _ in range(args.runs):
+            if os.path.exists(snapshot):
+                os.remove(snapshot)
+            cold.append(_load_seconds(path))
+        _report("load (openpyxl, cold)", cold)
+        _report("load (snapshot, warm)", [_load_seconds(path) for _ in range(args.runs)])
+
+if __name__ == "__main__":
+    main()
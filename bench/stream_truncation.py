@@ -0,0 +1,117 @@
+# bench/stream_truncation.py
+"""
+Truncated LLM replies: a reply cut off inside `set` or `action` must never
+be acted on.
+
+First cuts a full booking reply at every offset and scans each prefix the
+way chatbot._read_json does (JsonObjectStream, streamed in small chunks,
+and extract_json_object for the non-streaming path). Checks that:
+
+  * a cut inside `set` or `action` raises StructureError (streaming) or
+    yields nothing (non-streaming), so the turn is retried;
+  * any other cut yields valid JSON whose `set`/`action`, when present,
+    are exactly the full reply's.
+
+Then runs chatbot.llm_reply against a FakeProvider whose first reply is cut
+at `"confirm_booking": tr` and checks that the turn was retried and the
+booking action came through, in both streaming and non-streaming mode.
+
+Exits non-zero if any check fails.
+
+    python -m bench.stream_truncation
+"""
+import os
+import sys
+import json
+import asyncio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FULL = ('Sure!\n{"reply": "Booking {your} seats now.", "set": {"name": "Asha", "email": "a@example.com"}, '
+        '"action": {"confirm_booking": true}}\n')
+
+def _field_spans(text: str) -> dict:
+    """Offsets from each whole field's key to just past its value (flat objects in FULL)."""
+    spans = {}
+    for key in ("set", "action"):
+        start = text.index(f'"{key}"')
+        spans[key] = (start, text.index("}", start) + 1)
+    return spans
+
+def check_cuts() -> list:
+    from chatbot import _FIELD_TYPES, _WHOLE_FIELDS
+    from json_stream import JsonObjectStream, StructureError, extract_json_object
+
+    full = json.loads(FULL[FULL.index("{"):FULL.rindex("}") + 1])
+    spans = _field_spans(FULL)
+    problems = []
+    for cut in range(len(FULL)):
+        text = FULL[:cut]
+        # A cut that ends before a field's value is complete but after its key began
+        inside = [k for k, (a, b) in spans.items() if a + 1 < cut < b]
+        for chunk in (1, 7, 64):
+            scanner = JsonObjectStream(_FIELD_TYPES, whole=_WHOLE_FIELDS)
+            try:
+                for i in range(0, len(text), chunk):
+                    if scanner.feed(text[i:i + chunk]):
+                        break
+                out = scanner.result()
+            except StructureError:
+                out = None
+            if inside and out is not None:
+                problems.append(f"cut at {cut} inside {inside[0]} (chunks of {chunk}) gave {out!r}")
+            elif not inside:
+                problems += _check_partial(out, full, f"cut at {cut} (chunks of {chunk})")
+        out = extract_json_object(text, _WHOLE_FIELDS)
+        if inside and out:
+            problems.append(f"cut at {cut} inside {inside[0]} (non-streaming) gave {out!r}")
+        elif not inside:
+            problems += _check_partial(out, full, f"cut at {cut} (non-streaming)")
+    return problems
+
+def _check_partial(out, full: dict, label: str) -> list:
+    if out is None:
+        return [f"{label}: raised outside set/action"]
+    if not out:
+        return []
+    try:
+        parsed = json.loads(out)
+    except ValueError:
+        return [f"{label}: invalid JSON {out!r}"]
+    return [f"{label}: {key} is {parsed[key]!r}" for key in ("set", "action")
+            if key in parsed and parsed[key] != full[key]]
+
+async def check_retry(stream: bool) -> list:
+    import chatbot
+    from llm_provider import FakeProvider
+
+    cut = FULL[:FULL.index('"confirm_booking": tr') + len('"confirm_booking": tr')]
+    replies = iter([cut, FULL])
+    provider = FakeProvider(0.0, reply=lambda prompt: next(replies, FULL), chunk_size=8)
+    chatbot.llm_client.provider = provider
+    chatbot.LLM_STREAM = stream
+    session = {"stage": "confirm", "phone": "+10000000000", "name": "Asha", "email": "a@example.com"}
+    out = await chatbot.llm_reply(f"yes please ({'stream' if stream else 'generate'})", "confirm",
+                                  {"stage": "confirm"}, session)
+    mode = "streaming" if stream else "non-streaming"
+    problems = []
+    if provider.calls != 2:
+        problems.append(f"{mode}: {provider.calls} model calls, expected a retry after the cut reply")
+    if not out.get("action", {}).get("confirm_booking"):
+        problems.append(f"{mode}: booking action lost, got {out!r}")
+    return problems
+
+def main():
+    import logging
+    logging.disable(logging.WARNING)  # each cut reply logs a warning otherwise
+    problems = check_cuts()
+    problems += asyncio.run(check_retry(stream=True))
+    problems += asyncio.run(check_retry(stream=False))
+    for p in problems[:20]:
+        print("FAIL", p)
+    print("OK: truncated actions are never acted on" if not problems else f"{len(problems)} problems")
+    sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+    main()
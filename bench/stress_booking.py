@@ -0,0 +1,198 @@
+# bench/stress_booking.py
+"""
+Concurrent booking stress test for the Excel backend: proves no seat is
+ever sold twice.
+
+Builds a small catalog in a temp directory and starts an ExcelStore on it.
+`--clients` concurrent bookers then keep trying random, overlapping seat
+sets (1-4 seats) on a few shows, while other phones hold seats through
+SeatHolds. The run is checked in memory and again after a restart (a new
+store loads the compacted workbook and journal) for:
+
+  * no seat in two successful bookings;
+  * every booked seat marked unavailable, and nothing else;
+  * no seat held by one phone booked by another;
+  * bookingIds unique.
+
+It also checks that a claim whose journal write fails is undone, and that
+the holds it dropped come back; likewise for a booking whose own record
+fails after its seats were claimed, also after a journal replay. Exits non-zero on any violation.
+
+    python -m bench.stress_booking [--clients 200] [--attempts 20] [--shows 3]
+"""
+import os
+import sys
+import random
+import asyncio
+import argparse
+import tempfile
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def _booked_seats(bookings):
+    """Counter of (showtimeId, seat) over the booking sheet."""
+    taken = Counter()
+    for b in bookings.to_dict(orient="records"):
+        taken.update((b["showtimeId"], s) for s in str(b["seats"]).split(","))
+    return taken
+
+def check(store, shows, held_by, winners) -> list:
+    problems = []
+    taken = _booked_seats(store.bookings)
+    problems += [f"{st}:{seat} sold {n} times" for (st, seat), n in taken.items() if n > 1]
+    ids = store.bookings["bookingId"].tolist()
+    if len(ids) != len(set(ids)):
+        problems.append("duplicate bookingIds")
+    for show_id in shows:
+        show = store.inventory.get(show_id)
+        booked = {seat for (st, seat) in taken if st == show_id}
+        unavailable = {s for s, a in zip(show.seats, show.available) if not a}
+        if booked != unavailable:
+            problems.append(f"{show_id}: {len(unavailable)} seats unavailable, {len(booked)} booked")
+    for (show_id, seat), holder in held_by.items():
+        owner = winners.get((show_id, seat))
+        if owner is not None and owner != holder:
+            problems.append(f"{show_id}:{seat} held by {holder} but booked by {owner}")
+    return problems
+
+async def stress(path: str, clients: int, attempts: int, n_shows: int) -> list:
+    from excel_store import ExcelStore
+    from holds import SeatHolds
+
+    rng = random.Random(0)
+    store = ExcelStore(path)
+    await store.start()
+    holds = SeatHolds(store.inventory, ttl=3600)
+    shows = list(store.inventory.shows)[:n_shows]
+
+    # A few phones hold seats that nobody else may take
+    held_by = {}
+    for h in range(n_shows * 3):
+        show_id = shows[h % n_shows]
+        seats = rng.sample(store.inventory.get(show_id).available_seats(), 2)
+        if holds.hold(f"+holder{h}", show_id, seats):
+            held_by.update({(show_id, s): f"+holder{h}" for s in seats})
+
+    winners = {}
+
+    async def client(c):
+        phone = f"+client{c}"
+        for _ in range(attempts):
+            show = store.inventory.get(rng.choice(shows))
+            seats = rng.sample(show.seats, rng.randint(1, 4))
+            await asyncio.sleep(rng.random() / 1000)
+            res = await store.book(show.showtime_id, seats, f"{phone}@example.com", phone, phone)
+            if res["success"]:
+                winners.update({(show.showtime_id, s): phone for s in seats})
+
+    async def holder_books(h):
+        # Holders book what they hold, competing with everyone else
+        held = holds.held(f"+holder{h}")
+        if held:
+            res = await store.book(held[0], held[1], f"h{h}@example.com", "holder", f"+holder{h}")
+            if res["success"]:
+                winners.update({(held[0], s): f"+holder{h}" for s in held[1]})
+
+    await asyncio.gather(*(client(c) for c in range(clients)),
+                         *(holder_books(h) for h in range(0, n_shows * 3, 2)))
+    problems = check(store, shows, held_by, winners)
+    sold = sum(_booked_seats(store.bookings).values())
+    print(f"{len(store.bookings)} bookings, {sold} seats sold, {len(held_by)} seats held")
+    await store.stop()
+
+    # Everything must survive the journal and compaction
+    reloaded = ExcelStore(path)
+    await asyncio.to_thread(reloaded.load)
+    problems += [f"after reload: {p}" for p in check(reloaded, shows, held_by, winners)]
+    reloaded.close()
+    return problems
+
+async def rollback(path: str) -> list:
+    """
+    A claim whose journal append fails is undone, and its dropped holds come
+    back; so is a booking whose own record fails after its seats were claimed,
+    in memory and after a journal replay.
+    """
+    from excel_store import ExcelStore
+    from holds import SeatHolds
+
+    store = ExcelStore(path)
+    await store.start()
+    holds = SeatHolds(store.inventory, ttl=3600)
+    free = [s for s in store.inventory.shows.values() if s.available_count() >= 2]
+    problems = []
+    tried = {}
+    append = store.journal.append
+
+    def failing_on(op):
+        def fail(record):
+            if record["op"] == op:
+                raise OSError("disk full")
+            append(record)
+        return fail
+
+    for show, op in zip(free, ("seats", "booking")):
+        seats = tried[show.showtime_id] = show.available_seats()[:2]
+        holds.hold("+owner", show.showtime_id, seats)
+        store.journal.append = failing_on(op)
+        if op == "seats":
+            try:
+                store.claim_seats(show.showtime_id, seats, owner="+owner")
+            except OSError:
+                pass
+        else:
+            res = await store.book(show.showtime_id, seats, "owner@example.com", "Owner", "+owner")
+            if res["success"]:
+                problems.append("booking reported success though its record failed")
+        store.journal.append = append
+
+        label = f"failed {op} record"
+        if not show.is_available(seats, owner="+owner"):
+            problems.append(f"{label} left seats booked")
+        if any(show.holds.get(s) != "+owner" for s in seats):
+            problems.append(f"{label} dropped the owner's holds")
+        if show.is_available(seats, owner="+someone-else"):
+            problems.append(f"held seats available to others after a {label}")
+
+    # As after a crash before the next compaction: workbook plus journal replay
+    await store.journal.flush()
+    replayed = ExcelStore(path)
+    await asyncio.to_thread(replayed.load)
+    for showtime_id, seats in tried.items():
+        if not replayed.inventory.get(showtime_id).is_available(seats):
+            problems.append(f"after replay: seats of a failed claim or booking on {showtime_id} still booked")
+    replayed.close()
+    await store.stop()
+    return problems
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--clients", type=int, default=200)
+    ap.add_argument("--attempts", type=int, default=20, help="bookings tried per client")
+    ap.add_argument("--shows", type=int, default=3, help="showtimes the clients compete for")
+    args = ap.parse_args()
+
+    import logging
+    logging.getLogger().setLevel(logging.WARNING)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        from bench.catalog import write_catalog
+
+        path = os.path.join(tmp, "moviedb.xlsx")
+        write_catalog(path, movies=2, screens=2, days=1)
+        os.chdir(tmp)
+        try:
+            problems = asyncio.run(stress(path, args.clients, args.attempts, args.shows))
+            problems += asyncio.run(rollback(path))
+        finally:
+            os.chdir(cwd)
+
+    for p in problems[:20]:
+        print("FAIL", p)
+    print("OK: no double bookings" if not problems else f"{len(problems)} problems")
+    sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+    main()
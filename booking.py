@@ -1,14 +1,20 @@
 # booking.py
 import re
 import logging
+from collections import OrderedDict
 from typing import List, Union, Optional, Dict, Any
+import numpy as np
+from bson import ObjectId
+from bson.int64 import Int64
 from pymongo import ReturnDocument
 
+from seatmap import SeatMap, seat_map_for
+
 logger = logging.getLogger(__name__)
 
 async def try_book_seats(db, showtime_id: str, seats: Union[int, List[str]],
-                         user_id: Optional[str] = None, user_email: Optional[str] = None
-                         ) -> Dict[str, Any]:
+                         user_id: Optional[str] = None, user_email: Optional[str] = None,
+                         seat_map: Optional[SeatMap] = None) -> Dict[str, Any]:
     """
     Attempt to book seats for a showtime atomically.
 
@@ -16,6 +22,9 @@ async def try_book_seats(db, showtime_id: str, seats: Union[int, List[str]],
         - List[str] : explicit seat IDs to book (e.g. ["A1","A2"])
         - int       : number of seats to allocate; function will pick best seats.
 
+    Works on embedded seat arrays and on compact showtimes (seatmap.py);
+    pass the screen's `seat_map` for the latter to save a layout lookup.
+
     Returns:
         {"success": bool, "message": str, "bookingId": Optional[str], "seats": Optional[List[str]]}
     """
@@ -29,18 +38,17 @@ async def try_book_seats(db, showtime_id: str, seats: Union[int, List[str]],
         async with db.client.start_session() as session:
             async with session.start_transaction():
                 # Read current showtime state inside the transaction
-                show = await db.showtimes.find_one({"_id": showtime_id}, session=session)
-                if not show:
+                state = await _seat_state(db, showtime_id, seat_map, session=session)
+                if state is None:
                     return {"success": False, "message": "Showtime not found."}
-
-                # Build list of currently available seat ids
-                available = [s for s in show.get("seats", []) if s.get("available", False)]
-                available_ids = [s["seat"] for s in available]
+                all_ids, types, flags, seat_map = state
+                available_ids = [s for s, free in zip(all_ids, flags) if free]
 
                 # If seats requested as integer, pick best seats now (inside transaction)
                 if isinstance(seats, int):
                     num = seats
-                    seats_to_book = pick_best_seats(available_ids, num)
+                    layout = layout_for(all_ids, types)
+                    seats_to_book = pick_best_seats(available_ids, num, layout=layout)
                     if not seats_to_book:
                         return {"success": False,
                                 "message": f"Not enough seats available. Requested {num}, available {len(available_ids)}."}
@@ -51,30 +59,21 @@ async def try_book_seats(db, showtime_id: str, seats: Union[int, List[str]],
                         return {"success": False, "message": "Invalid seats format; must be list or int."}
                     # check all requested seats exist & are available
                     seats = [str(s) for s in seats]
-                    missing = [s for s in seats if s not in available_ids]
+                    available_set = set(available_ids)
+                    missing = [s for s in seats if s not in available_set]
                     if missing:
                         return {"success": False,
                                 "message": f"Some seats are not available: {', '.join(missing)}"}
 
-                # Prepare a query that requires each seat to still be available
-                seat_checks = [{"seats": {"$elemMatch": {"seat": s, "available": True}}} for s in seats]
-                query = {"_id": showtime_id, "$and": seat_checks}
-
-                # Prepare arrayFilters and set updates to mark those seats unavailable
-                array_filters_named = []
-                set_updates = {}
-                for idx, s in enumerate(seats):
-                    name = f"elem{idx}"
-                    array_filters_named.append({f"{name}.seat": s})
-                    set_updates[f"seats.$[{name}].available"] = False
-
-                update_doc = {"$set": set_updates}
+                # Query requiring each seat to still be available, and the
+                # update marking those seats unavailable
+                query, update_doc, array_filters = _seat_guard(showtime_id, seats, seat_map)
 
                 # Use find_one_and_update - if None returned, the match failed (some seat became unavailable)
                 updated = await db.showtimes.find_one_and_update(
                     query,
                     update_doc,
-                    array_filters=array_filters_named,
+                    array_filters=array_filters,
                     session=session,
                     return_document=ReturnDocument.AFTER
                 )
@@ -98,41 +97,268 @@ async def try_book_seats(db, showtime_id: str, seats: Union[int, List[str]],
         return {"success": False, "message": f"DB error: {e}"}
 
 
-def pick_best_seats(available_ids: List[str], n: int) -> Optional[List[str]]:
-    """
-    Try to find `n` contiguous seats in the same row (if seat ids use a pattern like A12).
-    If contiguous not found, fallback to first-n available seats.
+# Everything a seat check reads, in either layout; never prices or the rest of the doc
+_SEAT_FIELDS = {"screenId": 1, "seats.seat": 1, "seats.type": 1, "seats.available": 1, "avail": 1}
 
-    Returns list of seat ids or None if not enough seats.
+async def _seat_state(db, showtime_id: str, seat_map: Optional[SeatMap] = None, session=None):
+    """
+    (seat ids, seat types, availability flags, seat map) of a showtime, or None
+    if it doesn't exist. The seat map is None for embedded seat arrays.
     """
-    if len(available_ids) < n:
+    show = await db.showtimes.find_one({"_id": showtime_id}, _SEAT_FIELDS, session=session)
+    if not show:
         return None
+    if "avail" in show:
+        if seat_map is None:
+            screen = await db.screens.find_one({"_id": show["screenId"]}, {"layout": 1}, session=session)
+            seat_map = seat_map_for(screen["layout"])
+        return seat_map.seats, seat_map.types, seat_map.unpack(show["avail"]), seat_map
+    seats = show.get("seats", [])
+    return ([s["seat"] for s in seats], [s.get("type") for s in seats],
+            [bool(s.get("available", False)) for s in seats], None)
+
+
+def _seat_guard(showtime_id: str, seats: List[str], seat_map: Optional[SeatMap] = None):
+    """Query matching the showtime only while every requested seat is still available,
+    the update marking them booked, and its arrayFilters (None for compact showtimes)."""
+    if seat_map is not None:
+        query: Dict[str, Any] = {"_id": showtime_id}
+        bits: Dict[str, Any] = {}
+        for r, mask in seat_map.masks(seats).items():
+            query[f"avail.{r}"] = {"$bitsAllSet": Int64(mask)}
+            bits[f"avail.{r}"] = {"and": Int64(~mask)}
+        return query, {"$bit": bits}, None
+    query = {"_id": showtime_id,
+             "$and": [{"seats": {"$elemMatch": {"seat": s, "available": True}}} for s in seats]}
+    array_filters = [{f"elem{idx}.seat": s} for idx, s in enumerate(seats)]
+    set_updates = {f"seats.$[elem{idx}].available": False for idx in range(len(seats))}
+    return query, {"$set": set_updates}, array_filters
+
+
+async def try_book_seats_single(db, showtime_id: str, seats: Union[int, List[str]],
+                                user_id: Optional[str] = None, user_email: Optional[str] = None,
+                                booking_id: Optional[str] = None,
+                                seat_map: Optional[SeatMap] = None) -> Dict[str, Any]:
+    """
+    Book seats with a single guarded document update, no multi-document transaction.
+
+    The seat update and the booking record land atomically in the showtime
+    document: the booking is pushed onto its `outbox` array by the same
+    update that marks the seats. It is then upserted into `bookings` under
+    its own id and pulled from the outbox; if that step fails,
+    `relay_booking_outbox` finishes it later. Passing the same `booking_id`
+    again is idempotent.
+
+    Same arguments and return shape as `try_book_seats`, except that
+    `seat_map` is required for compact showtimes when booking explicit seats
+    (no read happens before the update).
+    """
+    if not showtime_id:
+        return {"success": False, "message": "Missing showtime_id."}
+    if not seats:
+        return {"success": False, "message": "No seats requested."}
 
-    pattern = re.compile(r"^([A-Za-z]+)?\s*(\d+)$")
-    from collections import defaultdict
-    rows = defaultdict(list)
-
-    # Group seats by row prefix (letters) and keep column number + original id
-    for sid in available_ids:
-        m = pattern.match(sid.strip())
-        if m:
-            row = m.group(1) or ""
-            col = int(m.group(2))
-            rows[row].append((col, sid))
+    booking_id = booking_id or str(ObjectId())
+    try:
+        if isinstance(seats, int):
+            state = await _seat_state(db, showtime_id, seat_map)
+            if state is None:
+                return {"success": False, "message": "Showtime not found."}
+            all_ids, types, flags, seat_map = state
+            available_ids = [s for s, free in zip(all_ids, flags) if free]
+            layout = layout_for(all_ids, types)
+            picked = pick_best_seats(available_ids, seats, layout=layout)
+            if not picked:
+                return {"success": False,
+                        "message": f"Not enough seats available. Requested {seats}, available {len(available_ids)}."}
+            seats = picked
+        elif isinstance(seats, list):
+            seats = [str(s) for s in seats]
+            if seat_map is not None:
+                unknown = [s for s in seats if s not in seat_map.index]
+                if unknown:
+                    return {"success": False, "message": f"Some seats are not available: {', '.join(unknown)}"}
         else:
-            # treat as row "" with col 0 so they appear in fallback
-            rows[""].append((0, sid))
-
-    # Look for contiguous run of length n in any row
-    for row, lst in rows.items():
-        lst.sort(key=lambda x: x[0])
-        cols = [c for c, _ in lst]
-        seats_sorted = [s for _, s in lst]
-        for i in range(len(lst) - n + 1):
-            window_cols = cols[i:i + n]
-            contiguous = all(window_cols[j] + 1 == window_cols[j + 1] for j in range(len(window_cols) - 1))
-            if contiguous:
-                return seats_sorted[i:i + n]
-
-    # fallback - return first n available
-    return available_ids[:n]
+            return {"success": False, "message": "Invalid seats format; must be list or int."}
+
+        booking_doc = {
+            "_id": booking_id,
+            "userId": user_id,
+            "userEmail": user_email,
+            "showtimeId": showtime_id,
+            "seats": seats,
+        }
+        query, update_doc, array_filters = _seat_guard(showtime_id, seats, seat_map)
+        update_doc["$push"] = {"outbox": booking_doc}
+        r = await db.showtimes.update_one(query, update_doc, array_filters=array_filters)
+        if r.modified_count != 1:
+            # A retry of a booking that already went through is still a success
+            already_booked = (
+                await db.bookings.find_one({"_id": booking_id}, {"_id": 1})
+                or await db.showtimes.find_one({"_id": showtime_id, "outbox._id": booking_id}, {"_id": 1})
+            )
+            if already_booked:
+                return {"success": True, "bookingId": booking_id, "seats": seats}
+            return {"success": False,
+                    "message": "One or more seats were no longer available. Please refresh and try different seats."}
+
+        try:
+            await _deliver_booking(db, booking_doc)
+        except Exception:
+            # Seats and booking are already committed in the outbox; the relay will finish it
+            logger.exception("Booking %s left in outbox", booking_id)
+        return {"success": True, "bookingId": booking_id, "seats": seats}
+
+    except Exception as e:
+        logger.exception("DB error while attempting to book seats")
+        return {"success": False, "message": f"DB error: {e}"}
+
+
+async def _deliver_booking(db, booking_doc: Dict[str, Any]):
+    """Idempotently copy an outbox entry into `bookings`, then drop it from the outbox."""
+    await db.bookings.update_one({"_id": booking_doc["_id"]}, {"$setOnInsert": booking_doc}, upsert=True)
+    await db.showtimes.update_one({"_id": booking_doc["showtimeId"]},
+                                  {"$pull": {"outbox": {"_id": booking_doc["_id"]}}})
+
+
+async def relay_booking_outbox(db) -> int:
+    """Deliver bookings left in showtime outboxes (e.g. after a crash). Returns the number relayed."""
+    relayed = 0
+    async for show in db.showtimes.find({"outbox.0": {"$exists": True}}, {"outbox": 1}):
+        for booking_doc in show["outbox"]:
+            await _deliver_booking(db, booking_doc)
+            relayed += 1
+    return relayed
+
+
+_SEAT_RE = re.compile(r"^([A-Za-z]+)?\s*(\d+)$")
+
+# Seat-quality weights (seat types come from seatmap.row_type)
+TYPE_WEIGHTS = {"vip": 1.0, "premium": 0.6, "regular": 0.2}
+CENTER_WEIGHT = 1.0
+TYPE_WEIGHT = 0.5
+
+
+class SeatLayout:
+    """
+    Row/column grid of an auditorium, built once per seat map.
+
+    `grid[r, c]` is the position of the seat in `seats` (or -1 for no seat),
+    and `score[r, c]` its quality: centrality within the row plus a seat-type
+    bonus. Contiguous blocks are searched with prefix sums over the
+    availability mask, so a search costs O(rows * cols) array operations
+    instead of Python loops over every window.
+    """
+
+    __slots__ = ("seats", "index", "grid", "score", "pos_r", "pos_c", "extra")
+
+    def __init__(self, seats: List[str], types: Optional[List[str]] = None):
+        self.seats = list(seats)
+        self.index = {s: i for i, s in enumerate(self.seats)}
+        row_ids: Dict[str, int] = {}
+        pos_r, pos_c, extra = [], [], []
+        for i, sid in enumerate(self.seats):
+            m = _SEAT_RE.match(sid.strip())
+            if not m:
+                # Unparseable ids are never part of a block, only of the fallback
+                extra.append(i)
+                pos_r.append(-1)
+                pos_c.append(-1)
+                continue
+            pos_r.append(row_ids.setdefault((m.group(1) or "").upper(), len(row_ids)))
+            pos_c.append(int(m.group(2)))
+        self.pos_r = np.array(pos_r, dtype=np.int64)
+        self.pos_c = np.array(pos_c, dtype=np.int64)
+        self.extra = extra
+
+        n_rows = max(len(row_ids), 1)
+        n_cols = int(self.pos_c.max()) + 1 if len(self.pos_c) else 1
+        placed = self.pos_r >= 0
+        self.grid = np.full((n_rows, n_cols), -1, dtype=np.int64)
+        self.grid[self.pos_r[placed], self.pos_c[placed]] = np.flatnonzero(placed)
+
+        # Centrality: 1 at the middle of the row, 0 at the edges
+        cols = np.arange(n_cols, dtype=np.float64)
+        occupied = self.grid >= 0
+        first = np.where(occupied.any(axis=1), occupied.argmax(axis=1), 0)
+        last = np.where(occupied.any(axis=1), n_cols - 1 - occupied[:, ::-1].argmax(axis=1), 0)
+        mid = (first + last) / 2.0
+        half = np.maximum((last - first) / 2.0, 1.0)
+        centrality = 1.0 - np.abs(cols[None, :] - mid[:, None]) / half[:, None]
+
+        type_score = np.zeros(len(self.seats), dtype=np.float64)
+        if types is not None:
+            type_score = np.array([TYPE_WEIGHTS.get(str(t).lower(), 0.0) for t in types], dtype=np.float64)
+        seat_type = np.where(occupied, type_score[np.maximum(self.grid, 0)], 0.0)
+        self.score = np.where(occupied, CENTER_WEIGHT * centrality + TYPE_WEIGHT * seat_type, 0.0)
+
+    def mask_for(self, available_ids: List[str]) -> np.ndarray:
+        mask = np.zeros(len(self.seats), dtype=bool)
+        idx = [self.index[s] for s in available_ids if s in self.index]
+        mask[idx] = True
+        return mask
+
+    def best_block(self, available: np.ndarray, n: int) -> Optional[List[str]]:
+        """
+        Best `n` seats given a per-seat availability mask aligned with `seats`.
+
+        Prefers the highest-scoring run of `n` adjacent seats in one row; if no
+        row has such a run, returns the `n` best individual seats.
+        """
+        available = np.asarray(available, dtype=bool)
+        if n <= 0 or int(available.sum()) < n:
+            return None
+        grid_free = (self.grid >= 0) & available[np.maximum(self.grid, 0)]
+        n_cols = self.grid.shape[1]
+        if n <= n_cols:
+            free = np.zeros((grid_free.shape[0], n_cols + 1), dtype=np.int64)
+            np.cumsum(grid_free, axis=1, out=free[:, 1:])
+            gain = np.zeros(free.shape, dtype=np.float64)
+            np.cumsum(self.score, axis=1, out=gain[:, 1:])
+            full = (free[:, n:] - free[:, :-n]) == n
+            if full.any():
+                window = np.where(full, gain[:, n:] - gain[:, :-n], -np.inf)
+                r, c = np.unravel_index(int(np.argmax(window)), window.shape)
+                return [self.seats[i] for i in self.grid[r, c:c + n]]
+        # No contiguous run: best individual seats, then any unparseable ones
+        free_pos = self.grid[grid_free]
+        order = free_pos[np.argsort(-self.score[grid_free], kind="stable")]
+        picked = [self.seats[i] for i in order[:n]]
+        picked += [self.seats[i] for i in self.extra if available[i]][:n - len(picked)]
+        return picked if len(picked) == n else None
+
+
+LAYOUT_CACHE_SIZE = 256  # distinct seat maps kept; one per screen in practice
+
+_layouts: "OrderedDict[tuple, SeatLayout]" = OrderedDict()
+
+def layout_for(seats: List[str], types: Optional[List[str]] = None) -> SeatLayout:
+    """Shared SeatLayout per distinct seat map and seat types (LRU, one per screen in practice)."""
+    key = (tuple(seats), tuple(types) if types is not None else None)
+    layout = _layouts.get(key)
+    if layout is None:
+        layout = _layouts[key] = SeatLayout(seats, types)
+        if len(_layouts) > LAYOUT_CACHE_SIZE:
+            _layouts.popitem(last=False)
+    else:
+        _layouts.move_to_end(key)
+    return layout
+
+
+def pick_best_seats(available_ids: List[str], n: int,
+                    layout: Optional[SeatLayout] = None) -> Optional[List[str]]:
+    """
+    Pick the best `n` seats: the most central, highest-category run of `n`
+    adjacent seats in one row (for ids like A12), else the best `n` seats.
+
+    Pass the show's full `layout` to rank by seat type and to respect booked
+    seats as gaps; without it a layout is derived from `available_ids`.
+
+    Returns list of seat ids or None if not enough seats.
+    """
+    if n <= 0 or len(available_ids) < n:
+        return None
+    if layout is None:
+        # Derived from this availability set only; not worth caching
+        layout = SeatLayout(available_ids)
+    return layout.best_block(layout.mask_for(available_ids), n)
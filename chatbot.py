@@ -1,40 +1,175 @@
 # chatbot.py
 import os
+import re
+import copy
 import json
+import time
+import hashlib
+import asyncio
 import logging
+from contextlib import aclosing
 from dotenv import load_dotenv
+from collections import OrderedDict
 from pydantic import BaseModel, Field, ValidationError
-from typing import Dict, Any
-import google.generativeai as genai
+from typing import Callable, Dict, Any, Optional, Tuple
+
+import metrics
+from json_stream import JsonObjectStream, extract_json_object
+from llm_provider import LLM_TIMEOUT, CircuitOpenError, LLMClient, make_provider
 
 load_dotenv()
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", 30))  # seconds per turn, retries included
+LLM_STREAM = os.getenv("LLM_STREAM", "true").lower() == "true"  # parse the reply as it streams
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", 1024))  # 0 disables the reply cache
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 300))  # seconds
+
+# Provider calls go through the limits, hedging and circuit breaker in llm_provider
+llm_client = LLMClient(make_provider())
+
+# Provider round-trips: {"calls", "seconds", "hedges", "hedge_wins", "rejected"}
+llm_stats = llm_client.stats
+
+# Parts of the context that are personal to the user and never part of a cache key
+_PERSONAL_CONTEXT_KEYS = {"stm", "ltm"}
+# Session fields the prompt depends on that are shared between users on the same show
+_SHARED_SESSION_KEYS = ("movieTitle", "showtimeId", "seats")
+_IDENTITY_KEYS = ("name", "email", "phone")
+_NORMALIZE_RE = re.compile(r"[^\w\s]")
+
+class ResponseCache:
+    """
+    LRU + TTL cache of LLM replies.
+
+    Keyed on the normalized user message, the stage and a fingerprint of the
+    non-personal context slice and session state. The fingerprint covers the
+    movie/showtime inventory shown to the model, the session's movie, show
+    and chosen seats, and whether name and email are known, so any change in
+    them (seats booked, shows added) produces a new key and the old entry
+    simply ages out.
+    """
+
+    def __init__(self, maxsize: int = LLM_CACHE_SIZE, ttl: float = LLM_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()  # key -> (expires_at, value)
+
+    @staticmethod
+    def key(user_message: str, stage: str, context: dict, session: Optional[dict] = None) -> tuple:
+        normalized = " ".join(_NORMALIZE_RE.sub(" ", user_message.lower()).split())
+        shared = {k: v for k, v in context.items() if k not in _PERSONAL_CONTEXT_KEYS}
+        if session is not None:
+            shared["session"] = {k: session.get(k) for k in _SHARED_SESSION_KEYS}
+            shared["session"]["known"] = [k for k in _IDENTITY_KEYS[:2] if session.get(k)]
+        fingerprint = hashlib.blake2b(
+            json.dumps(shared, sort_keys=True, default=str).encode("utf-8"), digest_size=16
+        ).hexdigest()
+        return (normalized, stage, fingerprint)
+
+    def get(self, key: tuple) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return copy.deepcopy(entry[1])
+
+    def put(self, key: tuple, value: dict):
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, copy.deepcopy(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+response_cache = ResponseCache()
+
+def _cacheable(out: dict, session: dict) -> bool:
+    """
+    Only generic replies are shared: no actions, no personal details being
+    set, and nothing that names this user (before or after the reply's
+    `set` is applied).
+    """
+    if out.get("action"):
+        return False
+    to_set = out.get("set") or {}
+    if any(k in to_set for k in _IDENTITY_KEYS):
+        return False
+    reply = out.get("reply", "")
+    for key in _IDENTITY_KEYS:
+        value = session.get(key)
+        if value and str(value) in reply:
+            return False
+    return True
+
 class LLMOut(BaseModel):
     reply: str
     set: Dict[str, Any] = Field(default_factory=dict)
     action: Dict[str, Any] = Field(default_factory=dict)
 
+# Top-level LLMOut fields and the character their JSON value must start with
+_FIELD_TYPES = {"reply": '"', "set": "{", "action": "{"}
+# Fields a truncated reply may not lose part of: acting on half an action/set is worse than retrying
+_WHOLE_FIELDS = ("set", "action")
+
 def _extract_json_balanced(text: str) -> str:
-    text = text.strip()
-    start = text.find("{")
-    if start == -1:
-        return ""
-    depth = 0
-    for idx in range(start, len(text)):
-        ch = text[idx]
-        if ch == "{":
-            depth += 1
-        elif ch == "}":
-            depth -= 1
-            if depth == 0:
-                return text[start:idx + 1]
-    return ""
-
-async def llm_reply(user_message: str, stage: str, context: dict, session: dict) -> dict:
+    return extract_json_object(text, _WHOLE_FIELDS)
+
+async def _read_json(provider, prompt: str) -> str:
+    """
+    One provider call, returning the JSON object in its reply ("" if there is none).
+
+    With LLM_STREAM the response is scanned chunk by chunk as it arrives:
+    reading stops as soon as the object closes, a wrongly typed field aborts
+    the call at once (StructureError), and a reply cut off mid-stream keeps
+    its complete fields, unless it was cut inside `set` or `action`
+    (StructureError again, so the turn is retried).
+    """
+    if not LLM_STREAM:
+        raw = await provider.generate(prompt)
+        return _extract_json_balanced(raw)
+    scanner = JsonObjectStream(_FIELD_TYPES, whole=_WHOLE_FIELDS)
+    async with aclosing(provider.stream(prompt)) as chunks:
+        async for text in chunks:
+            if scanner.feed(text):
+                break
+    return scanner.result()
+
+async def _generate_json(prompt: str, timeout: float = LLM_TIMEOUT) -> str:
+    with metrics.span("llm_generate"):
+        return await llm_client.call(lambda provider: _read_json(provider, prompt), timeout=timeout)
+
+async def llm_reply(user_message: str, stage: str, context: dict, session: dict,
+                    fallback: Optional[Callable[[], Optional[dict]]] = None) -> dict:
+    """
+    The model's reply for this turn. When the model is unavailable (timeout,
+    provider error, circuit open) `fallback()` is used if it returns a reply,
+    e.g. a deterministic one built from the context, else a canned apology.
+    """
+    cache_key = ResponseCache.key(user_message, stage, context, session)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    out, ok = await _llm_reply(user_message, stage, context, session, fallback)
+    if ok and _cacheable(out, session):
+        response_cache.put(cache_key, out)
+    return out
+
+def _unavailable(fallback, canned: str) -> dict:
+    out = fallback() if fallback is not None else None
+    return out or {"reply": canned, "set": {}, "action": {}}
+
+async def _llm_reply(user_message: str, stage: str, context: dict, session: dict,
+                     fallback=None) -> Tuple[dict, bool]:
+    """Returns (reply, ok); ok is False for fallback replies."""
     system = (
         "You are MovieBot, a friendly WhatsApp assistant that books movie tickets. "
         "You MUST OUTPUT ONLY valid JSON with keys: 'reply' (string), 'set' (object), 'action' (object). "
@@ -42,44 +177,67 @@ async def llm_reply(user_message: str, stage: str, context: dict, session: dict)
         "- At 'greeting' stage → list all movies with numbering from context['movies']. "
         "- At 'ask_time' stage → ALWAYS list showtimes from context['showtimes'] in bullet points.\n"
         "- Each showtime line must include: startTime, duration, screenName, available_count, and price.\n"
-        "- At 'ask_seats' stage → ALWAYS list available seats from context['showtimes'][0]['seats'] in bullet points. \n"
+        "- At 'ask_seats' stage → ALWAYS list available seats from context['show']['seats'] in bullet points. "
+        "Seats are given as row ranges, e.g. 'A1-A12' means A1 to A12 are all free; "
+        "context['show']['prices'] gives the price of each seat type and the rows it covers.\n"
+        "- At 'confirm' stage → collect name and email if missing; once the user confirms, "
+        "set action.confirm_booking to true.\n"
         "Never just say 'checking availability', always display real data. "
         "If user says something irrelevant, politely redirect."
     )
 
     prompt_user = {
         "stage": stage,
-        "session": session,
+        # stm and ltm are in context; the history goes into the prompt once
+        "session": {k: v for k, v in session.items() if k not in _PERSONAL_CONTEXT_KEYS},
         "context": context,
         "user_message": user_message,
         "instructions": (
             "Produce ONLY a JSON object with keys 'reply' (string), 'set' (object), 'action' (object). "
-            "If no keys should be set, use {}. Use stage to decide what to ask next. Use ltm to personalize."
+            "If no keys should be set, use {}. Use stage to decide what to ask next. Use ltm to personalize. "
+            "context['stm'] is the conversation so far: recent messages, plus a summary of older ones."
         )
     }
 
     user_prompt = json.dumps(prompt_user, default=str)
+    metrics.prompt_bytes.observe(len(user_prompt.encode("utf-8")), stage=stage or "unknown")
 
     attempts = 2
+    deadline = time.monotonic() + LLM_DEADLINE
     for attempt in range(attempts):
         try:
-            model = genai.GenerativeModel("gemini-1.5-flash")
-            response = model.generate_content(f"{system}\nUser payload:\n{user_prompt}")
-            raw = response.text.strip()
-            jtxt = _extract_json_balanced(raw)
-            if not jtxt:
-                raise ValueError("No JSON object found in LLM output")
-            parsed = json.loads(jtxt)
-            validated = LLMOut.model_validate(parsed)
-            return validated.model_dump()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError
+            jtxt = await _generate_json(f"{system}\nUser payload:\n{user_prompt}",
+                                        timeout=min(LLM_TIMEOUT, remaining))
+            # Only an unusable structure gets here without a result; a reply
+            # truncated after its complete fields is accepted as it is (one cut
+            # inside set/action raised StructureError instead)
+            with metrics.span("llm_parse"):
+                if not jtxt:
+                    raise ValueError("No JSON object found in LLM output")
+                parsed = json.loads(jtxt)
+                validated = LLMOut.model_validate(parsed)
+            return validated.model_dump(), True
         except (json.JSONDecodeError, ValidationError, ValueError) as e:
             logger.warning("LLM returned invalid JSON (attempt %d/%d): %s", attempt + 1, attempts, e)
             if attempt < attempts - 1:
+                metrics.llm_retries.inc()
                 system += "\nIMPORTANT: Respond ONLY with valid JSON object, nothing else."
                 continue
-            return {"reply": "Sorry, I couldn't process that. Could you rephrase?", "set": {}, "action": {}}
+            metrics.llm_failures.inc(reason="invalid")
+            return {"reply": "Sorry, I couldn't process that. Could you rephrase?", "set": {}, "action": {}}, False
+        except asyncio.TimeoutError:
+            logger.warning("LLM call timed out (deadline %.1fs)", min(LLM_TIMEOUT, LLM_DEADLINE))
+            metrics.llm_failures.inc(reason="timeout")
+            return _unavailable(fallback, "Sorry, I'm a bit slow right now. Please try again in a moment."), False
+        except CircuitOpenError:
+            metrics.llm_failures.inc(reason="circuit_open")
+            return _unavailable(fallback, "Sorry, I'm having trouble right now. Please try again in a moment."), False
         except Exception:
             logger.exception("LLM error")
-            return {"reply": "Sorry, something went wrong on my side.", "set": {}, "action": {}}
+            metrics.llm_failures.inc(reason="error")
+            return _unavailable(fallback, "Sorry, something went wrong on my side."), False
 
 
@@ -0,0 +1,100 @@
+# conversation.py
+import os
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Union
+
+STM_BUDGET_BYTES = int(os.getenv("STM_BUDGET_BYTES", 3000))    # recent messages kept verbatim
+STM_MAX_MESSAGES = int(os.getenv("STM_MAX_MESSAGES", 40))      # hard cap, whatever their size
+STM_SUMMARY_BYTES = int(os.getenv("STM_SUMMARY_BYTES", 600))   # rolling summary of older messages
+SUMMARY_CLIP = 80  # characters kept of each message folded into the summary
+
+_SEP = " | "
+
+def _size(role: str, text: str) -> int:
+    # Serialized size of {"role": "text"} plus a separator, without running json.dumps
+    return len(role) + len(text.encode("utf-8")) + 9
+
+
+class Conversation:
+    """
+    Short-term memory of one chat.
+
+    Recent messages are kept verbatim in a bounded deque whose serialized
+    size stays within `budget` bytes (the latest message is always kept);
+    anything pushed out is folded into `summary`, a rolling one-line digest
+    of clipped older messages that itself drops its oldest part beyond
+    `summary_budget` bytes. Sizes are tracked per message as they are
+    appended, so a turn costs O(1) amortized instead of rebuilding the list.
+    """
+
+    __slots__ = ("messages", "budget", "summary_budget", "_sizes", "_bytes", "_summary", "_summary_bytes")
+
+    def __init__(self, messages: Iterable[Dict[str, str]] = (), summary: str = "",
+                 budget: int = STM_BUDGET_BYTES, max_messages: int = STM_MAX_MESSAGES,
+                 summary_budget: int = STM_SUMMARY_BYTES):
+        self.messages: Deque[Dict[str, str]] = deque(maxlen=max_messages)
+        self.budget = budget
+        self.summary_budget = summary_budget
+        self._sizes: Deque[int] = deque()
+        self._bytes = 0
+        self._summary: Deque[str] = deque()  # "role: clipped text" entries, oldest first
+        self._summary_bytes = 0
+        for part in summary.split(_SEP) if summary else ():
+            self._add_summary(part)
+        for message in messages:
+            for role, text in message.items():
+                self.append(role, text)
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def append(self, role: str, text: str):
+        """Add a message ("user" or "bot"), folding the oldest ones into the summary as needed."""
+        text = str(text)
+        if len(self.messages) == self.messages.maxlen:
+            self._fold_oldest()
+        size = _size(role, text)
+        self.messages.append({role: text})
+        self._sizes.append(size)
+        self._bytes += size
+        while self._bytes > self.budget and len(self.messages) > 1:
+            self._fold_oldest()
+
+    @property
+    def summary(self) -> str:
+        return _SEP.join(self._summary)
+
+    def _fold_oldest(self):
+        message = self.messages.popleft()
+        self._bytes -= self._sizes.popleft()
+        (role, text), = message.items()
+        text = " ".join(text.split())
+        if len(text) > SUMMARY_CLIP:
+            text = text[:SUMMARY_CLIP - 1] + "…"
+        self._add_summary(f"{role}: {text}")
+
+    def _add_summary(self, part: str):
+        self._summary.append(part)
+        self._summary_bytes += len(part.encode("utf-8")) + len(_SEP)
+        # Drop whole entries from the front, oldest first
+        while len(self._summary) > 1 and self._summary_bytes > self.summary_budget:
+            self._summary_bytes -= len(self._summary.popleft().encode("utf-8")) + len(_SEP)
+
+    def for_prompt(self) -> Dict[str, Any]:
+        """The history as it goes into the prompt: the summary (if any) and the recent messages."""
+        out: Dict[str, Any] = {"messages": list(self.messages)}
+        if self._summary:
+            out["summary"] = self.summary
+        return out
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"messages": list(self.messages), "summary": self.summary}
+
+    @classmethod
+    def from_dict(cls, data: Union[Dict[str, Any], List[Dict[str, str]], None]) -> "Conversation":
+        """Inverse of to_dict; also accepts the plain message list older sessions stored."""
+        if not data:
+            return cls()
+        if isinstance(data, list):
+            return cls(data)
+        return cls(data.get("messages", ()), data.get("summary", ""))
@@ -0,0 +1,36 @@
+# db.py
+import os
+import logging
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+MONGO_URI = os.getenv("MONGO_URI")
+MONGO_DB = os.getenv("MONGO_DB", "moviedb")
+MONGO_POOL_SIZE = int(os.getenv("MONGO_POOL_SIZE", 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 5))
+
+_client = None
+
+def get_db():
+    """Shared, connection-pooled Motor database handle; the client is created on first use."""
+    global _client
+    if _client is None:
+        if not MONGO_URI:
+            raise RuntimeError("MONGO_URI not set")
+        _client = AsyncIOMotorClient(
+            MONGO_URI,
+            maxPoolSize=MONGO_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            retryWrites=True,
+        )
+        logger.info("Mongo client created (pool %d-%d)", MONGO_MIN_POOL_SIZE, MONGO_POOL_SIZE)
+    return _client[MONGO_DB]
+
+def close_db():
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
@@ -0,0 +1,283 @@
+# excel_store.py
+import os
+import asyncio
+import logging
+import itertools
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import pandas as pd
+
+from excel_utils import EXCEL_FILE, load_workbook_cached, write_workbook
+from journal import BookingJournal
+from inventory import SeatInventory
+from io_pool import run_io
+from pricing import quote
+import metrics
+
+logger = logging.getLogger(__name__)
+
+COMPACT_INTERVAL = float(os.getenv("JOURNAL_COMPACT_INTERVAL", 30))
+COMPACT_BATCH = int(os.getenv("JOURNAL_COMPACT_BATCH", 50))
+
+class ExcelStore:
+    """
+    In-memory copy of moviedb.xlsx backed by an append-only booking journal.
+
+    Mutations are applied in memory and queued on the journal, whose writer
+    task persists them off the event loop; the workbook itself is only
+    rewritten by the background compactor, in batches. New booking and user
+    rows are collected as dicts and appended to their DataFrames in one go
+    when the frames are next read (at the latest, by the compactor).
+    Nothing is read until `start()`/`load()`; on load any journal records not
+    yet compacted are replayed.
+    """
+
+    def __init__(self, path: str = EXCEL_FILE, journal_path: str = None):
+        self.path = path
+        self.journal_path = journal_path or f"{os.path.splitext(path)[0]}.journal.jsonl"
+        self.inventory = SeatInventory()
+        self.journal = None
+        self._wakeup = asyncio.Event()
+        self._compactor = None
+        self._writer = None
+        self._writing = None  # in-flight workbook write (outlives a cancelled compactor)
+
+    def load(self):
+        """Read the workbook (from its binary snapshot when fresh) and replay the journal."""
+        frames = load_workbook_cached(self.path)
+        self.movies = frames["Moviename"]
+        self.screens = frames["screen"]
+        self._users = frames["user"]
+        self._bookings = frames["booking"]
+        self._new_rows: Dict[str, List[Dict[str, Any]]] = {"booking": [], "user": []}  # not yet in the frames
+        self.showtimes = frames["showtime"]
+        self.inventory.load_frame(self.showtimes)
+        self._users_by_phone = {
+            row["phone"]: row for row in self._users.to_dict(orient="records")
+        }
+        self._booked_ids = set(self._bookings["bookingId"].tolist()) \
+            if "bookingId" in self._bookings.columns else set()
+
+        self.journal = BookingJournal(self.journal_path)
+        replayed = 0
+        for record in self.journal.replay():
+            self._apply(record)
+            replayed += 1
+        if replayed:
+            logger.info("Replayed %d journal records into %s", replayed, self.path)
+        self._booking_ids = itertools.count(self._last_booking_id() + 1)
+
+    # ---------------- Backend interface ----------------
+
+    async def start(self):
+        await asyncio.to_thread(self.load)
+        self._writer = asyncio.create_task(self.journal.run_writer())
+        self._compactor = asyncio.create_task(self.run_compactor())
+
+    async def stop(self):
+        for task in (self._compactor, self._writer):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        if self._writing is not None:
+            await asyncio.wait([self._writing])
+        # Fold whatever is left in the journal into the workbook before exiting
+        if self.journal is not None:
+            await self.journal.settle()  # a rotation or write the cancelled tasks left running
+            await self.journal.flush()
+            await self.compact()
+        self.close()
+
+    def movie_list(self) -> List[Dict[str, Any]]:
+        return self.movies[["title", "rating"]].to_dict(orient="records")
+
+    async def refresh(self, session, picked_movie: Optional[str] = None):
+        """Everything is already in memory; nothing to fetch."""
+
+    async def get_user(self, phone) -> Optional[Dict[str, Any]]:
+        return self.find_user(phone)
+
+    async def book(self, showtime_id: str, seats: List[str], user_email: str,
+                   user_name: str, phone: str) -> Dict[str, Any]:
+        """
+        Book seats. Returns once the booking is committed in memory; the journal
+        writer persists it and the compactor folds it into Excel in the background.
+        """
+        show = self.inventory.get(showtime_id)
+        if show is None:
+            return {"success": False, "message": "Showtime not found"}
+
+        # No awaits from here on: the check, the claim and the journal appends run
+        # without yielding to another booking, so no per-show lock is needed
+        if not show.is_available(seats, owner=phone):
+            return {"success": False, "message": "Some seats are not available"}
+
+        new_booking = {
+            "bookingId": self.next_booking_id(),
+            "userId": user_email,
+            "showtimeId": showtime_id,
+            "seats": ",".join(seats),
+            "totalPrice": quote(show, seats)["total"],
+            "status": "confirmed",
+            "CreatedAt": datetime.now()
+        }
+
+        # Mark seats booked (compare-and-set), create the booking and save the
+        # user if new; each step is one O(1) journal append (buffered, no disk I/O)
+        dropped = show.holds_on(seats)
+        try:
+            if not self.claim_seats(showtime_id, seats, owner=phone):
+                return {"success": False, "message": "Some seats are not available"}
+        except Exception as e:
+            logger.error("Failed to journal seats: %s", e)
+            return {"success": False, "message": "Failed to save booking"}
+        try:
+            self.record({"op": "booking", "booking": new_booking})
+        except Exception as e:
+            logger.error("Failed to journal booking: %s", e)
+            self.release_seats(showtime_id, seats, dropped)
+            return {"success": False, "message": "Failed to save booking"}
+        if self.find_user(phone) is None:
+            # The booking is committed; a missing user row doesn't undo it
+            try:
+                self.record({"op": "user", "user": {"phone": phone, "name": user_name, "email": user_email}})
+            except Exception as e:
+                logger.error("Failed to journal user %s: %s", phone, e)
+
+        return {"success": True, "bookingId": new_booking["bookingId"], "seats": seats}
+
+    def _last_booking_id(self) -> int:
+        last = len(self.bookings)
+        if "bookingId" in self.bookings.columns:
+            ids = pd.to_numeric(self.bookings["bookingId"], errors="coerce").max()
+            if pd.notna(ids):
+                last = max(last, int(ids))
+        return last
+
+    def next_booking_id(self) -> int:
+        """Monotonic booking id; never reused, even if bookings are added concurrently."""
+        return next(self._booking_ids)
+
+    def find_user(self, phone) -> Optional[Dict[str, Any]]:
+        return self._users_by_phone.get(phone)
+
+    @property
+    def bookings(self) -> pd.DataFrame:
+        if self._new_rows["booking"]:
+            self._bookings = self._fold("booking", self._bookings)
+        return self._bookings
+
+    @property
+    def users(self) -> pd.DataFrame:
+        if self._new_rows["user"]:
+            self._users = self._fold("user", self._users)
+        return self._users
+
+    def _fold(self, sheet: str, df: pd.DataFrame) -> pd.DataFrame:
+        """Append the rows recorded for `sheet` since the last read, in one concat."""
+        rows, self._new_rows[sheet] = self._new_rows[sheet], []
+        return pd.concat([df, pd.DataFrame(rows)], ignore_index=True)
+
+    def frames(self) -> Dict[str, pd.DataFrame]:
+        return {
+            "Moviename": self.movies,
+            "screen": self.screens,
+            "user": self.users,
+            "booking": self.bookings,
+            "showtime": self.showtimes,
+        }
+
+    # ---------------- Mutations ----------------
+
+    def record(self, record: Dict[str, Any]):
+        """Queue a mutation on the journal, then apply it in memory."""
+        self.journal.append(record)
+        self._apply(record)
+        if self.journal.pending >= COMPACT_BATCH:
+            self._wakeup.set()
+
+    def claim_seats(self, showtime_id: str, seats: List[str], owner: Optional[str] = None) -> bool:
+        """
+        Atomically mark seats booked if they are all still free (or held by
+        `owner`), and journal it.
+
+        Returns False (and changes nothing) if any seat was taken in the meantime.
+        If journaling fails the claim is undone, holds on the seats included.
+        """
+        show = self.inventory.get(showtime_id)
+        dropped = show.holds_on(seats) if show is not None else {}
+        if not self.inventory.claim(showtime_id, seats, owner):
+            return False
+        try:
+            self.journal.append({"op": "seats", "showtimeId": showtime_id, "seats": seats, "available": False})
+        except Exception:
+            self.inventory.unclaim(showtime_id, seats, dropped)
+            raise
+        return True
+
+    def release_seats(self, showtime_id: str, seats: List[str], holds: Dict[str, str]):
+        """
+        Undo a `claim_seats` whose booking could not be journaled: free the seats
+        and put back the holds it dropped. The seats record is already queued, so
+        a compensating one is journaled too and a replay ends with them free.
+        """
+        self.inventory.unclaim(showtime_id, seats, holds)
+        self.journal.append({"op": "seats", "showtimeId": showtime_id, "seats": seats, "available": True})
+
+    def _apply(self, record: Dict[str, Any]):
+        op = record.get("op")
+        if op == "seats":
+            self.inventory.mark(record["showtimeId"], record["seats"], record["available"])
+        elif op == "booking":
+            booking = dict(record["booking"])
+            if booking["bookingId"] in self._booked_ids:
+                return
+            self._booked_ids.add(booking["bookingId"])
+            booking["CreatedAt"] = pd.Timestamp(booking["CreatedAt"])
+            self._new_rows["booking"].append(booking)
+        elif op == "user":
+            user = record["user"]
+            if user["phone"] in self._users_by_phone:
+                return
+            self._users_by_phone[user["phone"]] = user
+            self._new_rows["user"].append(user)
+        else:
+            logger.warning("Unknown journal op %r", op)
+
+    # ---------------- Compaction ----------------
+
+    async def compact(self) -> bool:
+        """Fold journalled records into the workbook. Returns True if it was rewritten."""
+        if not await self.journal.rotate():
+            return False
+        # Snapshot synchronously so the copy is consistent with the rotation point;
+        # anything recorded afterwards stays in the live journal.
+        self.inventory.sync_frame(self.showtimes)
+        snapshot = {name: df.copy() for name, df in self.frames().items()}
+        # Shielded: cancelling the compactor must not leave a write running unseen
+        self._writing = asyncio.ensure_future(run_io(write_workbook, snapshot, self.path))
+        with metrics.span("excel_write"):
+            await asyncio.shield(self._writing)
+        self.journal.commit_compaction()
+        logger.info("Compacted booking journal into %s", self.path)
+        return True
+
+    async def run_compactor(self, interval: float = COMPACT_INTERVAL):
+        """Background task: compact every `interval` seconds, or sooner once a batch fills up."""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.compact()
+            except Exception:
+                logger.exception("Journal compaction failed; will retry")
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
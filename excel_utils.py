@@ -1,55 +1,80 @@
 # excel_utils.py
+import os
+import pickle
+import logging
 import pandas as pd
-from datetime import datetime
 
-EXCEL_FILE = "moviedb.xlsx"
+logger = logging.getLogger(__name__)
 
-def save_booking_to_excel(booking_data: dict):
+EXCEL_FILE = os.getenv("EXCEL_FILE", "moviedb.xlsx")
+
+# Sheets making up the workbook, in the order they are written back
+SHEETS = ["Moviename", "screen", "user", "booking", "showtime"]
+
+def load_workbook(path: str = EXCEL_FILE) -> dict:
     """
-    Save booking entry into moviedb.xlsx -> 'booking' sheet
-    and update 'user' sheet if the user is new.
+    Read every sheet of the workbook.
+
+    Returns:
+        {sheet_name: DataFrame}
+    """
+    xls = pd.ExcelFile(path, engine="openpyxl")
+    return {name: pd.read_excel(xls, sheet_name=name) for name in SHEETS}
+
+def write_workbook(frames: dict, path: str = EXCEL_FILE):
     """
+    Write all sheets back to the workbook.
+
+    The workbook is written to a sibling temp file first and swapped in with
+    os.replace, so a crash mid-write never leaves a truncated moviedb.xlsx.
+    The startup snapshot is refreshed to match.
+    """
+    root, ext = os.path.splitext(path)
+    tmp = f"{root}.tmp{ext}"
+    with pd.ExcelWriter(tmp, engine="openpyxl") as writer:
+        for name in SHEETS:
+            frames[name].to_excel(writer, sheet_name=name, index=False)
+    os.replace(tmp, path)
     try:
-        # Load all sheets
-        xls = pd.ExcelFile(EXCEL_FILE, engine="openpyxl")
-        movies_df = pd.read_excel(xls, sheet_name="Moviename")
-        screens_df = pd.read_excel(xls, sheet_name="screen")
-        users_df = pd.read_excel(xls, sheet_name="user")
-        bookings_df = pd.read_excel(xls, sheet_name="booking")
-        showtimes_df = pd.read_excel(xls, sheet_name="showtime")
-
-        # --- Save Booking ---
-        new_booking = {
-            "bookingId": booking_data.get("bookingId"),
-            "userId": booking_data.get("email"),
-            "showtimeId": None,  # not provided here, already linked in chatbot
-            "seats": ",".join(booking_data.get("seats", [])),
-            "totalPrice": None,  # price is handled in chatbot
-            "status": "confirmed",
-            "CreatedAt": datetime.now()
-        }
-        bookings_df = pd.concat([bookings_df, pd.DataFrame([new_booking])], ignore_index=True)
-
-        # --- Save User (if new) ---
-        phone = booking_data.get("phone")
-        if phone not in users_df["phone"].astype(str).values:
-            new_user = {
-                "phone": phone,
-                "name": booking_data.get("name"),
-                "email": booking_data.get("email"),
-                "createdAt": datetime.now()
-            }
-            users_df = pd.concat([users_df, pd.DataFrame([new_user])], ignore_index=True)
-
-        # --- Write back everything ---
-        with pd.ExcelWriter(EXCEL_FILE, mode="a", if_sheet_exists="replace") as writer:
-            movies_df.to_excel(writer, sheet_name="Moviename", index=False)
-            screens_df.to_excel(writer, sheet_name="screen", index=False)
-            users_df.to_excel(writer, sheet_name="user", index=False)
-            bookings_df.to_excel(writer, sheet_name="booking", index=False)
-            showtimes_df.to_excel(writer, sheet_name="showtime", index=False)
-
-        print("Booking and user saved successfully into moviedb.xlsx")
+        write_snapshot(frames, path)
+    except Exception as e:
+        logger.warning("Could not refresh workbook snapshot: %s", e)
+
+def _snapshot_path(path: str) -> str:
+    return f"{os.path.splitext(path)[0]}.snapshot.pkl"
 
+def _stat_key(path: str) -> tuple:
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+def write_snapshot(frames: dict, path: str = EXCEL_FILE):
+    """Pickle the frames, keyed on the workbook's current mtime and size."""
+    snap = _snapshot_path(path)
+    tmp = f"{snap}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump({"key": _stat_key(path), "frames": frames}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, snap)
+
+def load_workbook_cached(path: str = EXCEL_FILE) -> dict:
+    """
+    Like load_workbook, but served from a binary snapshot next to the workbook
+    while the workbook is unchanged; openpyxl only runs when the snapshot is
+    missing or stale (and the snapshot is then refreshed).
+    """
+    snap = _snapshot_path(path)
+    try:
+        with open(snap, "rb") as f:
+            cached = pickle.load(f)
+        if cached.get("key") == _stat_key(path):
+            return cached["frames"]
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning("Ignoring unreadable workbook snapshot %s: %s", snap, e)
+
+    frames = load_workbook(path)
+    try:
+        write_snapshot(frames, path)
     except Exception as e:
-        print("Error saving booking:", e)
+        logger.warning("Could not write workbook snapshot %s: %s", snap, e)
+    return frames
@@ -0,0 +1,186 @@
+# fastpath.py
+import re
+import time
+import logging
+from typing import Any, Dict, List, Optional
+
+from pricing import quote
+
+logger = logging.getLogger(__name__)
+
+# {"hits", "misses", "seconds"} - seconds is time spent parsing locally
+fastpath_stats = {"hits": 0, "misses": 0, "seconds": 0.0}
+
+_NUMBER_RE = re.compile(r"^\s*#?(\d{1,3})\.?\s*$")
+_SEATS_RE = re.compile(r"^\s*[A-Za-z]\d{1,3}(?:\s*(?:,|\s|and)\s*[A-Za-z]\d{1,3})*\s*$", re.IGNORECASE)
+_SEAT_RE = re.compile(r"[A-Za-z]\d{1,3}")
+_CONFIRM_RE = re.compile(r"^\s*(yes|y|ok|okay|confirm|book|book it)\s*[.!]*\s*$", re.IGNORECASE)
+
+# Prefix of the deterministic replies sent while the LLM is unavailable
+DEGRADED_NOTE = "I can only handle short replies right now."
+
+def _out(reply: str, to_set: Dict[str, Any]) -> Dict[str, Any]:
+    return {"reply": reply, "set": to_set, "action": {}}
+
+def _from_price(price: Optional[int]) -> str:
+    return f"from ₹{price}" if price is not None else "price on request"
+
+def _showtime_lines(showtimes: List[Dict[str, Any]]) -> str:
+    return "\n".join(
+        f"{i}. {st['startTime']} | {st['duration']} min | {st['screenName']} | "
+        f"{st['available_count']} seats left | {_from_price(st['price'])} ({st['showtimeId']})"
+        for i, st in enumerate(showtimes, 1)
+    )
+
+def pick_movie(text: str, builder) -> Optional[Dict[str, Any]]:
+    """The movie a greeting-stage message picks from the menu (number or exact title), if any."""
+    movies = builder.movies()
+    m = _NUMBER_RE.match(text)
+    if m:
+        n = int(m.group(1))
+        return movies[n - 1] if 1 <= n <= len(movies) else None
+    wanted = text.strip().lower()
+    for movie in movies:
+        if str(movie["title"]).lower() == wanted:
+            return movie
+    return None
+
+def _pick_showtime(text: str, showtimes: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    m = _NUMBER_RE.match(text)
+    if m:
+        n = int(m.group(1))
+        return showtimes[n - 1] if 1 <= n <= len(showtimes) else None
+    wanted = text.strip().lower()
+    for st in showtimes:
+        if str(st["showtimeId"]).lower() == wanted:
+            return st
+    return None
+
+def _pick_seats(text: str, show, owner: Optional[str]) -> Optional[List[str]]:
+    m = _NUMBER_RE.match(text)
+    if m:
+        n = int(m.group(1))
+        if n < 1:
+            return None
+        return show.best_seats(n, owner)
+    if not _SEATS_RE.match(text):
+        return None
+    seats = list(dict.fromkeys(s.upper() for s in _SEAT_RE.findall(text)))
+    return seats if show.is_available(seats, owner) else None
+
+def _parse(text: str, session: dict, builder) -> Optional[Dict[str, Any]]:
+    stage = session.get("stage") or "greeting"
+    movie_title = session.get("movieTitle")
+    showtime_id = session.get("showtimeId")
+
+    if stage == "greeting":
+        movie = pick_movie(text, builder)
+        if not movie:
+            return None
+        showtimes = builder.showtimes(movie["title"])
+        if not showtimes:
+            return None
+        return _out(
+            f"Great choice! 🎬 Showtimes for {movie['title']}:\n{_showtime_lines(showtimes)}\n\n"
+            "Reply with the number of the showtime you'd like.",
+            {"movieTitle": movie["title"], "stage": "ask_time"},
+        )
+
+    if stage == "ask_time" and movie_title:
+        st = _pick_showtime(text, builder.showtimes(movie_title))
+        if not st or not st["available_count"]:
+            return None
+        seats = builder.seats(st["showtimeId"])["seats"]
+        return _out(
+            f"{movie_title} at {st['startTime']} on {st['screenName']}. Available seats:\n"
+            + "\n".join(f"• {r}" for r in seats)
+            + "\n\nReply with the seats you want (e.g. A1,A2) or just how many.",
+            {"showtimeId": st["showtimeId"], "stage": "ask_seats"},
+        )
+
+    if stage == "ask_seats" and showtime_id:
+        show = builder.store.inventory.get(showtime_id)
+        if show is None:
+            return None
+        seats = _pick_seats(text, show, session.get("phone"))
+        if not seats:
+            return None
+        missing = [label for key, label in (("name", "your name"), ("email", "your email"))
+                   if not session.get(key)]
+        if missing:
+            ask = f"Please share {' and '.join(missing)} to complete the booking."
+        else:
+            ask = f"Booking for {session['name']} ({session['email']}). Reply 'confirm' to book."
+        total = quote(show, seats)["total"]
+        priced = f" (total ₹{total})" if total is not None else ""
+        return _out(
+            f"Seats {', '.join(seats)} selected for {show.movie_title} at "
+            f"{show.start_time.strftime('%d-%m-%Y %H:%M')}{priced}. {ask}",
+            {"seats": seats, "stage": "confirm"},
+        )
+
+    return None
+
+def fallback_reply(text: str, session: dict, builder) -> Optional[Dict[str, Any]]:
+    """
+    Deterministic reply for when the LLM is unavailable: repeats the current
+    stage's options so the user can carry on with menu numbers and seat ids
+    (which the fast path handles), and books on a plain "yes" once name,
+    email and seats are known. None if there is nothing useful to show.
+    """
+    stage = session.get("stage") or "greeting"
+    movie_title = session.get("movieTitle")
+    showtime_id = session.get("showtimeId")
+    try:
+        if stage == "confirm":
+            if session.get("name") and session.get("email") and session.get("seats") and _CONFIRM_RE.match(text):
+                return {"reply": "Booking your seats now.", "set": {}, "action": {"confirm_booking": True}}
+            return None
+
+        if stage == "ask_seats" and showtime_id:
+            seats = builder.seats(showtime_id).get("seats")
+            if seats:
+                return _out(f"{DEGRADED_NOTE} Available seats:\n" + "\n".join(f"• {r}" for r in seats)
+                            + "\n\nReply with the seats you want (e.g. A1,A2) or just how many.", {})
+
+        if stage in ("ask_time", "ask_seats") and movie_title:
+            showtimes = builder.showtimes(movie_title)
+            if showtimes:
+                return _out(f"{DEGRADED_NOTE} Showtimes for {movie_title}:\n{_showtime_lines(showtimes)}\n\n"
+                            "Reply with the number of the showtime you'd like.", {"stage": "ask_time"})
+
+        movies = builder.movies()
+        if movies:
+            lines = "\n".join(f"{i}. {m['title']}" for i, m in enumerate(movies, 1))
+            return _out(f"{DEGRADED_NOTE} Movies showing:\n{lines}\n\nReply with the number of a movie.",
+                        {"stage": "greeting"})
+    except Exception:
+        logger.exception("Fallback reply failed")
+    return None
+
+def fastpath_summary(llm_seconds_per_call: float) -> Dict[str, Any]:
+    """Hit rate and LLM time saved, estimated from the mean LLM call latency."""
+    total = fastpath_stats["hits"] + fastpath_stats["misses"]
+    return {
+        "hits": fastpath_stats["hits"],
+        "misses": fastpath_stats["misses"],
+        "hit_rate": fastpath_stats["hits"] / total if total else 0.0,
+        "seconds_saved": fastpath_stats["hits"] * llm_seconds_per_call - fastpath_stats["seconds"],
+    }
+
+def fast_reply(text: str, session: dict, builder) -> Optional[Dict[str, Any]]:
+    """
+    Answer structured replies (menu numbers, showtime ids, seat lists) locally.
+
+    Returns an LLMOut-shaped dict, or None when the message is not an
+    unambiguous match for the current stage and should go to the LLM.
+    """
+    start = time.perf_counter()
+    try:
+        out = _parse(text, session, builder)
+    except Exception:
+        logger.exception("Fast-path parse failed; falling back to LLM")
+        out = None
+    fastpath_stats["seconds"] += time.perf_counter() - start
+    fastpath_stats["hits" if out else "misses"] += 1
+    return out
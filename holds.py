@@ -0,0 +1,103 @@
+# holds.py
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEAT_HOLD_TTL = float(os.getenv("SEAT_HOLD_TTL", 300))  # seconds a chosen seat stays held
+
+class SeatHolds:
+    """
+    Temporary holds on chosen seats, one hold per phone.
+
+    A hold is written into the show's `holds` map, so every availability view
+    (context, fast path, best-seat picking, booking) treats the seats as taken
+    for everyone else. Expiries sit in a min-heap; the reaper sleeps until the
+    earliest one instead of scanning all holds. Re-holding or releasing leaves
+    a stale heap entry behind, which is skipped by its sequence number.
+    """
+
+    def __init__(self, inventory, ttl: float = SEAT_HOLD_TTL):
+        self.inventory = inventory
+        self.ttl = ttl
+        self._owners: Dict[str, Tuple[str, List[str], int]] = {}  # phone -> (showtimeId, seats, seq)
+        self._heap: List[Tuple[float, int, str]] = []              # (expires_at, seq, phone)
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+
+    def hold(self, owner: str, showtime_id: str, seats: List[str]) -> bool:
+        """
+        Hold `seats` for `owner`, replacing any previous hold of theirs.
+        Returns False (keeping the previous hold) if a seat is booked or held by someone else.
+        """
+        show = self.inventory.get(showtime_id)
+        if show is None or not show.is_available(seats, owner):
+            return False
+        self.release(owner)
+        for s in seats:
+            show.holds[s] = owner
+        self._touch(show)
+
+        seq = next(self._seq)
+        expires_at = time.monotonic() + self.ttl
+        self._owners[owner] = (showtime_id, list(seats), seq)
+        if not self._heap or expires_at < self._heap[0][0]:
+            self._wakeup.set()
+        heapq.heappush(self._heap, (expires_at, seq, owner))
+        return True
+
+    def release(self, owner: str):
+        """Drop `owner`'s hold, if any. Seats they have since booked are left alone."""
+        entry = self._owners.pop(owner, None)
+        if entry is None:
+            return
+        showtime_id, seats, _ = entry
+        show = self.inventory.get(showtime_id)
+        if show is None:
+            return
+        released = False
+        for s in seats:
+            if show.holds.get(s) == owner:
+                del show.holds[s]
+                released = True
+        if released:
+            self._touch(show)
+
+    def held(self, owner: str) -> Optional[Tuple[str, List[str]]]:
+        entry = self._owners.get(owner)
+        return (entry[0], entry[1]) if entry else None
+
+    def _touch(self, show):
+        # Availability changed: invalidate fragments memoized on the version
+        show.version += 1
+        self.inventory.version += 1
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """Release every hold whose TTL has passed. Returns the number released."""
+        now = time.monotonic() if now is None else now
+        expired = 0
+        while self._heap and self._heap[0][0] <= now:
+            _, seq, owner = heapq.heappop(self._heap)
+            entry = self._owners.get(owner)
+            if entry is not None and entry[2] == seq:
+                self.release(owner)
+                expired += 1
+        return expired
+
+    async def run_reaper(self):
+        """Background task: sleep until the earliest expiry (or a sooner new hold), then release."""
+        while True:
+            self._wakeup.clear()
+            timeout = max(self._heap[0][0] - time.monotonic(), 0) if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            expired = self.expire()
+            if expired:
+                logger.info("Released %d expired seat holds", expired)
@@ -0,0 +1,196 @@
+# inventory.py
+import logging
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+import pandas as pd
+
+from booking import layout_for
+
+logger = logging.getLogger(__name__)
+
+class Show:
+    """
+    Seat state for a single showtime. `available` is a bytearray aligned with
+    `seats`; `holds` maps temporarily held seats to the phone holding them
+    (see holds.SeatHolds). Held seats count as unavailable to everyone else.
+    """
+
+    __slots__ = ("showtime_id", "movie_title", "screen_name", "start_time", "duration",
+                 "seats", "types", "prices", "available", "index", "rows", "version", "layout",
+                 "holds")
+
+    def __init__(self, showtime_id, movie_title, screen_name, start_time, duration,
+                 seats, types, prices, available, rows=None):
+        self.showtime_id = showtime_id
+        self.movie_title = movie_title
+        self.screen_name = screen_name
+        self.start_time = start_time
+        self.duration = duration
+        self.seats = seats                    # List[str]
+        self.types = types                    # List[str]
+        self.prices = prices                  # List[int]
+        self.available = available            # bytearray, 1 = free
+        self.index = {s: i for i, s in enumerate(seats)}
+        self.rows = rows                      # positions in the showtime DataFrame
+        self.version = 0
+        self.layout = layout_for(seats, types)  # shared by shows on the same screen
+        self.holds: Dict[str, str] = {}        # seat -> holder phone
+
+    def available_seats(self) -> List[str]:
+        holds = self.holds
+        return [s for s, a in zip(self.seats, self.available) if a and s not in holds]
+
+    def available_count(self) -> int:
+        # Only free seats are ever held
+        return self.available.count(1) - len(self.holds)
+
+    def is_available(self, seats: Iterable[str], owner: Optional[str] = None) -> bool:
+        """True if every seat is free and not held by anyone other than `owner`."""
+        idx = self.index
+        avail = self.available
+        holds = self.holds
+        for s in seats:
+            i = idx.get(s)
+            if i is None or not avail[i]:
+                return False
+            holder = holds.get(s)
+            if holder is not None and holder != owner:
+                return False
+        return True
+
+    def best_seats(self, n: int, owner: Optional[str] = None) -> Optional[List[str]]:
+        """Best block of `n` free seats not held by anyone other than `owner`
+        (see booking.SeatLayout)."""
+        mask = np.frombuffer(self.available, dtype=np.uint8).astype(bool)
+        for s, holder in self.holds.items():
+            if holder != owner:
+                mask[self.index[s]] = False
+        return self.layout.best_block(mask, n)
+
+    def claim(self, seats: List[str], owner: Optional[str] = None) -> bool:
+        """Compare-and-set: mark `seats` booked only if every one of them is still free
+        (seats held by `owner` count as free). Their holds are dropped."""
+        if not self.is_available(seats, owner):
+            return False
+        for s in seats:
+            self.holds.pop(s, None)
+        self.mark(seats, False)
+        return True
+
+    def holds_on(self, seats: Iterable[str]) -> Dict[str, str]:
+        """The holds (seat -> phone) on `seats`, as `claim` would drop them."""
+        return {s: self.holds[s] for s in seats if s in self.holds}
+
+    def unclaim(self, seats: List[str], holds: Dict[str, str]):
+        """Undo `claim`: free `seats` again and put back the holds it dropped."""
+        self.mark(seats, True)
+        self.holds.update(holds)
+
+    def mark(self, seats: Iterable[str], available: bool):
+        flag = 1 if available else 0
+        idx = self.index
+        for s in seats:
+            i = idx.get(s)
+            if i is not None:
+                self.available[i] = flag
+        self.version += 1
+
+
+class SeatInventory:
+    """
+    Seat availability indexed by showtimeId, plus a movie title -> showtimes index.
+
+    Built once from the `showtime` sheet (Excel backend) or filled show by show
+    with `upsert` (Mongo backend); lookups and seat marking only touch the
+    seats of one show. The DataFrame is only written back for persistence.
+    """
+
+    def __init__(self, showtimes_df: Optional[pd.DataFrame] = None):
+        self.shows: Dict[str, Show] = {}
+        self.by_movie: Dict[str, List[Show]] = {}
+        self.version = 0
+        if showtimes_df is not None:
+            self.load_frame(showtimes_df)
+
+    def load_frame(self, showtimes_df: pd.DataFrame):
+        seat_col = showtimes_df["seat"].astype(str).to_numpy()
+        type_col = showtimes_df["type"].to_numpy()
+        price_col = showtimes_df["price"].to_numpy()
+        avail_col = showtimes_df["available"].fillna(False).astype(bool).to_numpy()
+        for showtime_id, rows in showtimes_df.groupby("showtimeId", sort=False).indices.items():
+            first = showtimes_df.iloc[rows[0]]
+            show = Show(
+                showtime_id=showtime_id,
+                movie_title=first["movieTitle"],
+                screen_name=first["screenName"],
+                start_time=first["startTime"],
+                duration=first["duration"],
+                seats=seat_col[rows].tolist(),
+                types=type_col[rows].tolist(),
+                prices=price_col[rows].tolist(),
+                available=bytearray(avail_col[rows].astype(np.uint8).tobytes()),
+                rows=rows,
+            )
+            self.shows[showtime_id] = show
+            self.by_movie.setdefault(str(show.movie_title).lower(), []).append(show)
+
+        for shows in self.by_movie.values():
+            shows.sort(key=lambda s: s.start_time)
+        logger.info("Seat inventory loaded: %d showtimes", len(self.shows))
+
+    def upsert(self, show: Show) -> Show:
+        """
+        Add or refresh one show. An unchanged show keeps its current object and
+        version, so fragments memoized against it stay valid.
+        """
+        current = self.shows.get(show.showtime_id)
+        if current is not None:
+            if current.available == show.available and current.seats == show.seats:
+                return current
+            show.version = current.version + 1
+            show.holds = {s: o for s, o in current.holds.items() if show.is_available([s])}
+            movie_shows = self.by_movie.get(str(current.movie_title).lower(), [])
+            if current in movie_shows:
+                movie_shows.remove(current)
+        self.shows[show.showtime_id] = show
+        movie_shows = self.by_movie.setdefault(str(show.movie_title).lower(), [])
+        movie_shows.append(show)
+        movie_shows.sort(key=lambda s: s.start_time)
+        self.version += 1
+        return show
+
+    def get(self, showtime_id: str) -> Optional[Show]:
+        return self.shows.get(showtime_id)
+
+    def for_movie(self, movie_title: str) -> List[Show]:
+        return self.by_movie.get(movie_title.lower(), [])
+
+    def claim(self, showtime_id: str, seats: List[str], owner: Optional[str] = None) -> bool:
+        show = self.shows.get(showtime_id)
+        if show is None or not show.claim(seats, owner):
+            return False
+        self.version += 1
+        return True
+
+    def unclaim(self, showtime_id: str, seats: List[str], holds: Dict[str, str]):
+        show = self.shows.get(showtime_id)
+        if show is not None:
+            show.unclaim(seats, holds)
+            self.version += 1
+
+    def mark(self, showtime_id: str, seats: Iterable[str], available: bool) -> bool:
+        show = self.shows.get(showtime_id)
+        if show is None:
+            return False
+        show.mark(seats, available)
+        self.version += 1
+        return True
+
+    def sync_frame(self, showtimes_df: pd.DataFrame):
+        """Write seat availability back into the `available` column of the showtime sheet."""
+        avail = showtimes_df["available"].fillna(False).to_numpy(dtype=bool, copy=True)
+        for show in self.shows.values():
+            if show.rows is None:
+                continue
+            avail[show.rows] = np.frombuffer(bytes(show.available), dtype=np.uint8).astype(bool)
+        showtimes_df["available"] = avail
@@ -0,0 +1,14 @@
+# io_pool.py
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+IO_THREADS = int(os.getenv("IO_THREADS", 4))
+
+# Dedicated threads for file/SQLite I/O on the request path, kept apart from
+# the default executor so slow disk writes never starve other to_thread users
+_executor = ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix="io")
+
+async def run_io(fn, *args):
+    """Run a blocking I/O call on the I/O pool and await its result."""
+    return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
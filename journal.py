@@ -0,0 +1,150 @@
+# journal.py
+import os
+import json
+import asyncio
+import logging
+from typing import Any, Dict, Iterator, List
+
+from io_pool import run_io
+import metrics
+
+logger = logging.getLogger(__name__)
+
+class BookingJournal:
+    """
+    Append-only, line-per-record log of booking mutations.
+
+    Each record is a single JSON object terminated by a newline, so an append
+    costs the same whatever the size of the workbook. A compaction first
+    `rotate()`s the live file aside; until `commit_compaction()` is called the
+    rotated records are still returned by `replay()`, so a crash mid-compaction
+    loses nothing. Records must be idempotent because they can be replayed on
+    top of a workbook that already contains them.
+
+    `append` only serializes the record into a buffer; the writer task
+    (`run_writer`) writes and fsyncs buffered records in batches on the I/O
+    pool, so a request never waits on the disk. `flush()` forces the buffer
+    out, and `rotate()` flushes before moving the file aside. A file
+    operation on the I/O pool runs to completion even if its caller is
+    cancelled; the next flush/rotate (or `settle()`) waits for it before
+    touching the file again.
+    """
+
+    def __init__(self, path: str, fsync: bool = True):
+        self.path = path
+        self.rotated_path = f"{path}.compacting"
+        self.fsync = fsync
+        self.pending = 0  # records appended since the last rotate
+        self._fh = open(self.path, "a", encoding="utf-8")
+        self._buffer: List[str] = []    # serialized records not yet written
+        self._io_lock = asyncio.Lock()  # one batch write / rotation at a time
+        self._io = None                 # in-flight write / rotation (outlives a cancelled caller)
+        self._wakeup = asyncio.Event()
+
+    def append(self, record: Dict[str, Any]):
+        """Queue one record for the writer task. Serialization errors are raised here."""
+        self._buffer.append(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self.pending += 1
+        self._wakeup.set()
+
+    def _write(self, lines: List[str]):
+        self._fh.write("".join(lines))
+        self._fh.flush()
+        if self.fsync:
+            os.fsync(self._fh.fileno())
+
+    async def _run_io(self, fn, *args):
+        await self.settle()
+        self._io = asyncio.ensure_future(run_io(fn, *args))
+        # Shielded: a cancelled caller must not leave the file mid-write unseen
+        return await asyncio.shield(self._io)
+
+    async def settle(self):
+        """Wait for a write or rotation whose caller was cancelled while it ran."""
+        if self._io is not None and not self._io.done():
+            await asyncio.wait([self._io])
+
+    async def flush(self):
+        """Write and fsync everything appended so far."""
+        async with self._io_lock:
+            await self._flush_locked()
+
+    async def _flush_locked(self):
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        try:
+            with metrics.span("journal_write"):
+                await self._run_io(self._write, batch)
+        except Exception:
+            # Keep the records for the next attempt, ahead of anything newer
+            self._buffer[:0] = batch
+            raise
+
+    async def run_writer(self):
+        """Background task: group-commit appended records as they arrive."""
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Journal write failed; will retry")
+                await asyncio.sleep(1)
+                self._wakeup.set()
+
+    def replay(self) -> Iterator[Dict[str, Any]]:
+        """Yield every record not yet folded into the workbook, oldest first."""
+        for p in (self.rotated_path, self.path):
+            if not os.path.exists(p):
+                continue
+            with open(p, "r", encoding="utf-8") as f:
+                for lineno, line in enumerate(f, 1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn last line from a crash mid-append
+                        logger.warning("Skipping unreadable journal record %s:%d", p, lineno)
+
+    async def rotate(self) -> bool:
+        """
+        Flush, then move the live journal aside so it can be compacted.
+
+        Returns False when there is nothing to compact. If a previous
+        compaction never committed, its rotated file is kept and compacted
+        again; the live journal then stays in place and is simply replayed
+        on top at startup.
+        """
+        async with self._io_lock:
+            await self._flush_locked()
+            pending = self.pending
+            rotated = await self._run_io(self._rotate_files)
+            if rotated:
+                # Records appended while the files were swapped stay pending
+                self.pending -= pending
+            return rotated
+
+    def _rotate_files(self) -> bool:
+        if os.path.exists(self.rotated_path):
+            return True
+        if os.path.getsize(self.path) == 0:
+            return False
+        self._fh.close()
+        os.replace(self.path, self.rotated_path)
+        self._fh = open(self.path, "a", encoding="utf-8")
+        return True
+
+    def commit_compaction(self):
+        """Drop the rotated records once the workbook containing them is on disk."""
+        if os.path.exists(self.rotated_path):
+            os.remove(self.rotated_path)
+
+    def close(self):
+        """Write anything still buffered (writer task already stopped) and close."""
+        if self._buffer:
+            self._write(self._buffer)
+            self._buffer = []
+        self._fh.close()
@@ -0,0 +1,151 @@
+# json_stream.py
+import re
+from typing import Dict, Iterable, List, Optional, Set
+
+# Characters that matter to the scanner; everything else is skipped in bulk
+_SPECIAL = re.compile(r'[{}\[\]":,\\]')
+_NON_WS = re.compile(r"\S")
+_CLOSERS = {"}": "{", "]": "["}
+
+class StructureError(ValueError):
+    """The object can't turn into a valid reply, whatever text follows."""
+
+class JsonObjectStream:
+    """
+    Incremental scanner for the first top-level JSON object in a text stream.
+
+    Chunks are `feed()`-ed as they arrive; braces and brackets inside strings
+    (and escaped quotes) are handled, and `done` flips as soon as the object
+    closes, so the caller can stop reading the stream there. Text before the
+    object (prose, a ``` fence) is ignored.
+
+    `field_types` maps top-level keys to the character their value must start
+    with (e.g. {"reply": '"'}); a mismatch raises StructureError as soon as it
+    is seen instead of after the whole reply. Mismatched brackets raise too.
+
+    If the stream ends early, `result()` returns the object cut back to its
+    last complete top-level field, so a truncated tail never yields a
+    half-written value. For the keys in `whole` a cut-back isn't good enough
+    (dropping a half-written action would silently skip it): if the stream
+    ends inside one of them, `result()` raises StructureError instead.
+    """
+
+    def __init__(self, field_types: Optional[Dict[str, str]] = None, whole: Iterable[str] = ()):
+        self.field_types = field_types or {}
+        self.whole = frozenset(whole)
+        self.done = False
+        self.fields: Set[str] = set()  # top-level keys whose value is complete
+        self._buf = ""
+        self._pos = 0             # next unscanned offset in _buf
+        self._start = None        # offset of the opening brace
+        self._end = None          # offset just past the closing brace
+        self._stack: List[str] = []
+        self._in_string = False
+        self._skip = 0            # offset of the character after a backslash
+        self._key_start = None    # offset of the top-level key being read
+        self._key = None          # top-level key whose value comes next / is being read
+        self._value_at = None     # offset to look for the value's first character
+        self._last_field_end = None
+
+    def feed(self, chunk: str) -> bool:
+        """Scan `chunk`; returns True once the object is complete."""
+        if self.done or not chunk:
+            return self.done
+        self._buf += chunk
+        buf = self._buf
+        for m in _SPECIAL.finditer(buf, self._pos):
+            i = m.start()
+            if i < self._skip:
+                continue  # escaped character
+            if self._value_at is not None:
+                self._check_value(i)
+            ch = buf[i]
+
+            if self._start is None:
+                if ch == "{":
+                    self._start = i
+                    self._stack.append("{")
+                continue
+
+            if self._in_string:
+                if ch == "\\":
+                    self._skip = i + 2
+                elif ch == '"':
+                    self._in_string = False
+                    if self._key_start is not None:
+                        self._key = buf[self._key_start:i]
+                        self._key_start = None
+                    elif len(self._stack) == 1 and self._key is not None:
+                        self._field_done(i + 1)
+                continue
+
+            depth = len(self._stack)
+            if ch == '"':
+                self._in_string = True
+                if depth == 1 and self._key is None:
+                    self._key_start = i + 1
+            elif ch == ":":
+                if depth == 1:
+                    self._value_at = i + 1
+            elif ch == ",":
+                if depth == 1:
+                    if self._key is not None:  # number / true / false / null value
+                        self._field_done(i)
+            elif ch in "{[":
+                self._stack.append(ch)
+            elif ch in "}]":
+                if not self._stack or self._stack[-1] != _CLOSERS[ch]:
+                    raise StructureError(f"Unexpected {ch!r} at offset {i - self._start}")
+                self._stack.pop()
+                if not self._stack:
+                    self._end = i + 1
+                    self.done = True
+                    if self._key is not None:
+                        self.fields.add(self._key)
+                    break
+                if len(self._stack) == 1 and self._key is not None:
+                    self._field_done(i + 1)
+        else:
+            if self._value_at is not None:
+                self._check_value(len(buf))
+        self._pos = len(buf) if not self.done else self._end
+        return self.done
+
+    def _check_value(self, limit: int):
+        m = _NON_WS.search(self._buf, self._value_at, limit + 1)
+        if m is None:
+            return
+        self._value_at = None
+        expected = self.field_types.get(self._key)
+        if expected is not None and m.group() != expected:
+            raise StructureError(f"Field {self._key!r} must start with {expected!r}, got {m.group()!r}")
+
+    def _field_done(self, end: int):
+        self.fields.add(self._key)
+        self._key = None
+        self._last_field_end = end
+
+    def result(self) -> str:
+        """The object text; a truncated object is cut to its complete fields ("" if none)."""
+        if self._start is None:
+            return ""
+        if self.done:
+            return self._buf[self._start:self._end]
+        if self._key is not None and self._key in self.whole:
+            raise StructureError(f"Reply cut off inside {self._key!r}")
+        if self._key_start is not None:
+            partial = self._buf[self._key_start:]
+            if partial and any(key.startswith(partial) for key in self.whole):
+                raise StructureError(f"Reply cut off at key {partial!r}")
+        if self._last_field_end is None:
+            return ""
+        return self._buf[self._start:self._last_field_end] + "}"
+
+def extract_json_object(text: str, whole: Iterable[str] = ()) -> str:
+    """First top-level JSON object in `text` (string-aware), or "" (also if cut off inside a `whole` key)."""
+    scanner = JsonObjectStream(whole=whole)
+    try:
+        scanner.feed(text)
+        return scanner.result()
+    except StructureError:
+        return ""
@@ -0,0 +1,279 @@
+# llm_provider.py
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Optional, Set, TypeVar
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")                # gemini | fake (local, no API calls)
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-1.5-flash")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 16))  # in-flight provider calls
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 20))                # seconds per call, hedge included
+LLM_HEDGE = os.getenv("LLM_HEDGE", "true").lower() == "true"    # second request when the first is slow
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", 0.95))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", 0.5))  # seconds
+LLM_BREAKER_THRESHOLD = float(os.getenv("LLM_BREAKER_THRESHOLD", 0.5))  # failure rate that opens it
+LLM_BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", 20))           # recent calls considered
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", 30))     # seconds before a probe
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", 0.2))            # seconds, LLM_PROVIDER=fake
+
+T = TypeVar("T")
+
+class CircuitOpenError(RuntimeError):
+    """The provider is failing; the call was refused without being sent."""
+
+# ---------------- Providers ----------------
+# A provider is anything with `generate(prompt) -> str` and `stream(prompt)`
+# yielding text chunks; LLMClient adds the limits, hedging and breaker.
+
+class GeminiProvider:
+    """Google Gemini through the async generate_content API."""
+
+    def __init__(self, model_name: str = LLM_MODEL):
+        self.model_name = model_name
+        self._model = None
+
+    def _get_model(self):
+        """Model constructed on first use (the SDK import is slow, so it's deferred too)."""
+        if self._model is None:
+            import google.generativeai as genai
+            genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+            self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    async def generate(self, prompt: str) -> str:
+        response = await self._get_model().generate_content_async(prompt)
+        return response.text.strip()
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        response = await self._get_model().generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:  # a chunk without text parts (e.g. only a finish reason)
+                continue
+            yield text
+
+
+class FakeProvider:
+    """
+    Local stand-in for load tests and offline runs. Each call takes `latency`
+    seconds, or `tail_latency` with probability `tail_rate`, and fails with
+    probability `error_rate`; `reply(prompt)` produces the text (a generic
+    JSON reply by default). Streams arrive in `chunk_size` pieces.
+    """
+
+    DEFAULT_REPLY = '{"reply": "Hello! Which movie would you like to watch?", "set": {}, "action": {}}'
+
+    def __init__(self, latency: float = FAKE_LLM_LATENCY, reply: Optional[Callable[[str], str]] = None,
+                 tail_rate: float = 0.0, tail_latency: float = 0.0, error_rate: float = 0.0,
+                 chunk_size: int = 16, seed: Optional[int] = None):
+        self.latency = latency
+        self.reply = reply or (lambda prompt: self.DEFAULT_REPLY)
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.error_rate = error_rate
+        self.chunk_size = chunk_size
+        self.calls = 0
+        self._rng = random.Random(seed)
+
+    def _draw(self) -> float:
+        self.calls += 1
+        if self._rng.random() < self.error_rate:
+            raise RuntimeError("Injected provider error")
+        return self.tail_latency if self._rng.random() < self.tail_rate else self.latency
+
+    async def generate(self, prompt: str) -> str:
+        latency = self._draw()
+        await asyncio.sleep(latency)
+        return self.reply(prompt).strip()
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        latency = self._draw()
+        text = self.reply(prompt)
+        pieces = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+        for piece in pieces:
+            await asyncio.sleep(latency / len(pieces))
+            yield piece
+
+def make_provider(kind: str = LLM_PROVIDER):
+    if kind == "fake":
+        return FakeProvider()
+    if kind != "gemini":
+        logger.warning("Unknown LLM_PROVIDER %r, using Gemini", kind)
+    return GeminiProvider()
+
+# ---------------- Circuit breaker ----------------
+
+class CircuitBreaker:
+    """
+    Opens when at least `threshold` of the last `window` calls failed (after
+    a minimum of `window // 2` calls), refusing calls for `cooldown` seconds.
+    Then a single probe call is let through: success closes the breaker,
+    failure opens it for another cooldown.
+
+    `allow()` returns None to refuse a call, else a ticket ("probe" for the
+    half-open trial call, "call" otherwise) that goes back to `record` or
+    `release`. Only the probe's outcome moves the breaker out of half_open;
+    calls admitted before it opened no longer count once it has.
+    """
+
+    def __init__(self, threshold: float = LLM_BREAKER_THRESHOLD, window: int = LLM_BREAKER_WINDOW,
+                 cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.min_calls = max(window // 2, 1)
+        self.state = "closed"  # closed | open | half_open
+        self.opened = 0
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> Optional[str]:
+        if self.state == "open":
+            if time.monotonic() - self._opened_at < self.cooldown:
+                return None
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probing:
+                return None
+            self._probing = True
+            return "probe"
+        return "call"
+
+    def record(self, ok: bool, ticket: str = "call"):
+        if ticket == "probe":
+            self._probing = False
+            if self.state != "half_open":
+                return
+            if ok:
+                logger.info("LLM circuit closed")
+                self.state = "closed"
+                self._outcomes.clear()
+            else:
+                self._open()
+            return
+        if self.state != "closed":
+            return  # admitted before the breaker opened; only the probe decides now
+        self._outcomes.append(ok)
+        failures = self._outcomes.count(False)
+        if len(self._outcomes) >= self.min_calls and failures >= self.threshold * len(self._outcomes):
+            self._open()
+
+    def release(self, ticket: str = "call"):
+        """A call ended without a verdict (cancelled); if it was the probe, let the next one probe."""
+        if ticket == "probe":
+            self._probing = False
+
+    def _open(self):
+        logger.warning("LLM circuit open for %gs", self.cooldown)
+        self.state = "open"
+        self.opened += 1
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+
+# ---------------- Client ----------------
+
+class LLMClient:
+    """
+    Provider calls with a concurrency limit, a per-call timeout, hedging and
+    a circuit breaker.
+
+    `call(attempt, timeout)` runs `attempt(provider)` (which sends the prompt
+    and reads the reply). Once enough latencies are known, if the first
+    request hasn't finished after the recent LLM_HEDGE_QUANTILE latency, an
+    identical second one is sent (only while a concurrency slot is free) and
+    whichever succeeds first wins; the other is cancelled. Timeouts and
+    provider errors count against the breaker; ValueErrors (an unusable
+    reply) don't, since the provider did answer.
+    """
+
+    def __init__(self, provider, max_concurrency: int = LLM_MAX_CONCURRENCY, timeout: float = LLM_TIMEOUT,
+                 hedge: bool = LLM_HEDGE, hedge_quantile: float = LLM_HEDGE_QUANTILE,
+                 hedge_min_delay: float = LLM_HEDGE_MIN_DELAY, breaker: Optional[CircuitBreaker] = None):
+        self.provider = provider
+        self.timeout = timeout
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker = breaker or CircuitBreaker()
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._latencies: Deque[float] = deque(maxlen=200)  # recent successful attempts
+        # Provider round-trips: {"calls", "seconds"} plus hedges sent / won and calls refused
+        self.stats = {"calls": 0, "seconds": 0.0, "hedges": 0, "hedge_wins": 0, "rejected": 0}
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None while there is too little history."""
+        if not self.hedge or len(self._latencies) < 20:
+            return None
+        samples = sorted(self._latencies)
+        p = samples[min(len(samples) - 1, int(self.hedge_quantile * len(samples)))]
+        return max(p, self.hedge_min_delay)
+
+    async def _attempt(self, attempt: Callable[..., Awaitable[T]]) -> T:
+        async with self._slots:
+            start = time.perf_counter()
+            try:
+                result = await attempt(self.provider)
+            finally:
+                elapsed = time.perf_counter() - start
+                self.stats["calls"] += 1
+                self.stats["seconds"] += elapsed
+        self._latencies.append(elapsed)
+        return result
+
+    async def call(self, attempt: Callable[..., Awaitable[T]], timeout: Optional[float] = None) -> T:
+        ticket = self.breaker.allow()
+        if ticket is None:
+            self.stats["rejected"] += 1
+            raise CircuitOpenError("LLM circuit open")
+        timeout = self.timeout if timeout is None else timeout
+        primary = asyncio.create_task(self._attempt(attempt))
+        tasks: Set[asyncio.Task] = {primary}
+        try:
+            async with asyncio.timeout(timeout):
+                delay = self.hedge_delay() if self.breaker.state == "closed" else None
+                if delay is not None and delay < timeout:
+                    await asyncio.wait(tasks, timeout=delay)
+                    if not primary.done() and not self._slots.locked():
+                        self.stats["hedges"] += 1
+                        tasks.add(asyncio.create_task(self._attempt(attempt)))
+                winner = await self._first_success(tasks)
+        except ValueError:
+            self.breaker.record(True, ticket)
+            raise
+        except asyncio.CancelledError:
+            self.breaker.release(ticket)
+            raise
+        except Exception:
+            self.breaker.record(False, ticket)
+            raise
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()  # a losing attempt's error is expected, not unhandled
+        self.breaker.record(True, ticket)
+        if winner is not primary:
+            self.stats["hedge_wins"] += 1
+        return winner.result()
+
+    @staticmethod
+    async def _first_success(tasks: Set[asyncio.Task]) -> asyncio.Task:
+        """The first task to succeed; if all fail, the first failure is raised."""
+        pending = set(tasks)
+        first_error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task
+                first_error = first_error or task.exception()
+        raise first_error
@@ -14,30 +14,38 @@ EMAIL_USER = os.getenv("EMAIL_USER")
 EMAIL_PASS = os.getenv("EMAIL_PASS")
 SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
 SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 2))        # persistent SMTP connections
+MAIL_QUEUE_SIZE = int(os.getenv("MAIL_QUEUE_SIZE", 1000))   # enqueue waits once this many are pending
+MAIL_MAX_RETRIES = int(os.getenv("MAIL_MAX_RETRIES", 5))
+MAIL_RETRY_BASE = float(os.getenv("MAIL_RETRY_BASE", 1.0))  # seconds, doubled per attempt
 
-async def send_booking_email(
+def build_booking_email(
     to_email: str,
     movie_title: str,
     showtime: str,
     seats: list,
     name: str = None,
     phone: str = None,
-    price_per_seat: float = 15.0,  # Default, can be updated dynamically
+    seat_prices: dict = None,  # {seat: price}, from pricing.quote
     booking_ref: str = None
-):
+) -> MIMEMultipart:
     """
-    Send detailed booking confirmation email
+    Build detailed booking confirmation email
     """
-    try:
-        msg = MIMEMultipart()
-        msg["From"] = EMAIL_USER
-        msg["To"] = to_email
-        msg["Subject"] = f"🎬 Booking Confirmation - {movie_title}"
+    msg = MIMEMultipart()
+    msg["From"] = EMAIL_USER
+    msg["To"] = to_email
+    msg["Subject"] = f"🎬 Booking Confirmation - {movie_title}"
 
-        total_price = len(seats) * price_per_seat
-        seats_details = "\n".join([f"{seat} - ₹{price_per_seat}" for seat in seats])
+    if seat_prices:
+        seats_details = "\n".join([f"{seat} - ₹{seat_prices[seat]}" for seat in seats])
+        total_price = f"₹{sum(seat_prices[seat] for seat in seats)}"
+    else:
+        seats_details = "\n".join(seats)
+        total_price = "N/A"
 
-        body = f"""
+    body = f"""
 Hello {name or 'User'},
 
 Your booking for the movie "{movie_title}" is confirmed! ✅
@@ -49,7 +57,7 @@ Showtime: {showtime}
 Seats Booked:
 {seats_details}
 
-Total Price: ₹{total_price}
+Total Price: {total_price}
 
 📞 Contact: {phone or 'N/A'}
 
@@ -58,16 +66,125 @@ Enjoy your movie 🍿
 
 - MovieBot Team
 """
-        msg.attach(MIMEText(body, "plain"))
+    msg.attach(MIMEText(body, "plain"))
+    return msg
 
+async def send_booking_email(to_email: str, movie_title: str, showtime: str, seats: list, **kwargs):
+    """
+    Send one booking confirmation email over a fresh SMTP connection.
+    The webhook goes through MailQueue instead; this is kept for one-off sends.
+    """
+    try:
+        msg = build_booking_email(to_email, movie_title, showtime, seats, **kwargs)
         await aiosmtplib.send(
             msg,
             hostname=SMTP_HOST,
             port=SMTP_PORT,
             username=EMAIL_USER,
             password=EMAIL_PASS,
-            start_tls=True
+            start_tls=SMTP_STARTTLS
         )
         logger.info("Booking email sent to %s", to_email)
     except Exception as e:
         logger.error("Failed to send booking email: %s", str(e))
+
+
+def _is_permanent(exc: Exception) -> bool:
+    """Errors a retry cannot fix: malformed messages and 5xx SMTP replies."""
+    if isinstance(exc, aiosmtplib.SMTPResponseException):
+        return 500 <= exc.code < 600
+    return not isinstance(exc, (aiosmtplib.SMTPException, OSError, asyncio.TimeoutError))
+
+
+class MailQueue:
+    """
+    Bounded queue of outgoing emails served by a small pool of workers.
+
+    Each worker keeps one authenticated SMTP connection open and reuses it
+    for every message, reconnecting only after an error. Failed sends are
+    retried with exponential backoff. `enqueue` waits while the queue is
+    full, so a burst slows the webhook down instead of dropping mail, and
+    `drain` delivers everything still queued before shutdown.
+    """
+
+    def __init__(self, pool_size: int = SMTP_POOL_SIZE, maxsize: int = MAIL_QUEUE_SIZE,
+                 hostname: str = SMTP_HOST, port: int = SMTP_PORT,
+                 username: str = EMAIL_USER, password: str = EMAIL_PASS,
+                 start_tls: bool = SMTP_STARTTLS, max_retries: int = MAIL_MAX_RETRIES,
+                 retry_base: float = MAIL_RETRY_BASE):
+        self.pool_size = pool_size
+        self.maxsize = maxsize
+        self.smtp_args = {"hostname": hostname, "port": port, "username": username,
+                          "password": password, "start_tls": start_tls}
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.stats = {"sent": 0, "retried": 0, "failed": 0}
+        self._queue = None
+        self._workers = []
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.pool_size)]
+
+    async def enqueue(self, msg: MIMEMultipart):
+        await self._queue.put(msg)
+
+    async def enqueue_booking_email(self, to_email: str, movie_title: str, showtime: str,
+                                    seats: list, **kwargs):
+        await self.enqueue(build_booking_email(to_email, movie_title, showtime, seats, **kwargs))
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def drain(self, timeout: float = 30):
+        """Deliver what is queued (up to `timeout` seconds), then close the connections."""
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error("Mail drain timed out with %d messages undelivered", self._queue.qsize())
+        for w in self._workers:
+            w.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(**self.smtp_args)
+        await smtp.connect()  # STARTTLS and login happen here
+        return smtp
+
+    async def _worker(self, n: int):
+        smtp = None
+        try:
+            while True:
+                msg = await self._queue.get()
+                try:
+                    for attempt in range(self.max_retries + 1):
+                        try:
+                            if smtp is None or not smtp.is_connected:
+                                smtp = await self._connect()
+                            await smtp.send_message(msg)
+                            self.stats["sent"] += 1
+                            logger.info("Booking email sent to %s", msg["To"])
+                            break
+                        except Exception as e:
+                            if smtp is not None:
+                                smtp.close()
+                                smtp = None
+                            if attempt == self.max_retries or _is_permanent(e):
+                                self.stats["failed"] += 1
+                                logger.error("Failed to send booking email to %s: %s", msg["To"], e)
+                                break
+                            self.stats["retried"] += 1
+                            delay = min(self.retry_base * 2 ** attempt, 60)
+                            logger.warning("Email to %s failed (%s); retrying in %.1fs", msg["To"], e, delay)
+                            await asyncio.sleep(delay)
+                finally:
+                    self._queue.task_done()
+        finally:
+            if smtp is not None and smtp.is_connected:
+                try:
+                    await smtp.quit()
+                except Exception:
+                    smtp.close()
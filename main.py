@@ -1,38 +1,83 @@
 import os
 import asyncio
 import logging
-from datetime import datetime, timezone
-from fastapi import FastAPI, Form, Response
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Form
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import PlainTextResponse
 from twilio.twiml.messaging_response import MessagingResponse
 from dotenv import load_dotenv
-import pandas as pd
 
-from chatbot import llm_reply
-from mailer import send_booking_email
-from mem0_client import mem0_get, mem0_set
-from excel_utils import save_booking_to_excel
+from chatbot import llm_client, llm_reply, llm_stats, response_cache
+from fastpath import fallback_reply, fast_reply, fastpath_stats, fastpath_summary, pick_movie
+import metrics
+from mailer import MailQueue
+import mem0_client
+from mem0_client import mem0_aget
+from prompt_context import ContextBuilder
+from session_store import SessionStore
+from holds import SeatHolds
+from pricing import quote
+from replies import REPLY_MODE, ReplyPipeline
+from io_pool import run_io
 
 # ---------------- Setup ----------------
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("whatsapp_bot")
 
 load_dotenv()
-EXCEL_FILE = "moviedb.xlsx"
 
-# Load Excel sheets
-movies_df = pd.read_excel(EXCEL_FILE, sheet_name="Moviename", engine="openpyxl")
-screens_df = pd.read_excel(EXCEL_FILE, sheet_name="screen", engine="openpyxl")
-users_df = pd.read_excel(EXCEL_FILE, sheet_name="user", engine="openpyxl")
-bookings_df = pd.read_excel(EXCEL_FILE, sheet_name="booking", engine="openpyxl")
-showtimes_df = pd.read_excel(EXCEL_FILE, sheet_name="showtime", engine="openpyxl")
-
-# In-memory session store
-sessions = {}
+# Storage backend: Excel workbook + booking journal (default), or Mongo.
+# Only the selected backend's module is imported; data loads in the lifespan hook.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "excel")
+if STORAGE_BACKEND == "mongo":
+    from mongo_store import MongoStore
+    store = MongoStore()
+else:
+    from excel_store import ExcelStore
+    store = ExcelStore()
+
+context_builder = ContextBuilder(store)
+
+# Booking confirmation emails: bounded queue + pooled SMTP connections
+mail_queue = MailQueue()
+
+# TTL'd holds on seats a user has picked but not yet confirmed
+holds = SeatHolds(store.inventory)
+
+# Session store (in-process or shared SQLite, see SESSION_BACKEND)
+sessions = SessionStore()
+
+# Per-phone turn queue with burst coalescing; with REPLY_MODE=async the webhook acks
+# immediately and replies go out via the Messages API
+reply_pipeline = ReplyPipeline(lambda phone, text: handle_turn(phone, text))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await store.start()
+    metrics.start_profiler()
+    mail_queue.start()
+    reply_pipeline.start(send=REPLY_MODE == "async")
+    tasks = [
+        asyncio.create_task(mem0_client.run_flusher()),
+        asyncio.create_task(holds.run_reaper()),
+    ]
+    yield
+    await reply_pipeline.drain()
+    logger.info("Turns: %s", reply_pipeline.stats)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await run_io(mem0_client.flush)
+    calls = llm_stats["calls"]
+    logger.info("Fast path: %s", fastpath_summary(llm_stats["seconds"] / calls if calls else 0.0))
+    logger.info("LLM reply cache: %d hits, %d misses", response_cache.hits, response_cache.misses)
+    await mail_queue.drain()
+    logger.info("Mail: %s", mail_queue.stats)
+    await store.stop()
 
 # FastAPI app
-app = FastAPI(title="Movie Booking Bot")
+app = FastAPI(title="Movie Booking Bot", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -41,119 +86,60 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# ---------------- Helpers ----------------
+# ---------------- Metrics ----------------
+# Existing stats dicts are exported as-is; spans and counters live in metrics.py
+
+metrics.StatsCollector("moviebot_llm", "LLM calls, seconds spent in them, hedges and calls refused by the breaker",
+                       llm_stats)
+metrics.StatsCollector("moviebot_llm_circuit", "LLM circuit breaker state (1 = current)", lambda: {
+    state: int(llm_client.breaker.state == state) for state in ("closed", "open", "half_open")
+}, label="state", kind="gauge")
+metrics.StatsCollector("moviebot_fastpath", "Turns answered without the LLM", fastpath_stats)
+metrics.StatsCollector("moviebot_reply_cache", "LLM reply cache lookups",
+                       lambda: {"hits": response_cache.hits, "misses": response_cache.misses})
+metrics.StatsCollector("moviebot_mail", "Booking emails", mail_queue.stats)
+metrics.StatsCollector("moviebot_messages", "Incoming messages and turns", reply_pipeline.stats)
+metrics.StatsCollector("moviebot_queue_depth", "Work waiting in background queues", lambda: {
+    "mail": mail_queue.pending(),
+    "replies": reply_pipeline.pending(),
+    "journal": getattr(getattr(store, "journal", None), "pending", 0),
+}, label="queue", kind="gauge")
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
-async def append_stm(phone: str, message: dict, limit: int = 10):
-    """Append message to session STM (short-term memory)."""
-    session = sessions.get(phone, {})
-    stm = session.get("stm", [])
-    stm.append(message)
-    if len(stm) > limit:
-        stm = stm[-limit:]
-    session["stm"] = stm
-    sessions[phone] = session
+# ---------------- Helpers ----------------
 
 async def make_context(session: dict):
-    """Build context for LLM based on session."""
-    ctx = {}
-    ctx["movies"] = movies_df[["title", "rating"]].to_dict(orient="records")
-
-    movie_title = session.get("movieTitle")
-    if movie_title:
-        st = showtimes_df[showtimes_df["movieTitle"].str.lower() == movie_title.lower()]
-        st_list = []
-        for showtime_id, group in st.groupby("showtimeId"):
-            available = group[group["available"] == True]["seat"].astype(str).tolist()
-            st_list.append({
-                "showtimeId": showtime_id,
-                "startTime": group.iloc[0]["startTime"].strftime("%d-%m-%Y %H:%M"),
-                "duration": group.iloc[0]["duration"],
-                "screenName": group.iloc[0]["screenName"],
-                "available_count": len(available),
-                "price": group.iloc[0]["price"],
-                "seats": available,
-            })
-        ctx["showtimes"] = st_list
-
-    showtime_id = session.get("showtimeId")
-    if showtime_id:
-        show = showtimes_df[showtimes_df["showtimeId"] == showtime_id]
-        if not show.empty:
-            ctx["available_seats"] = show[show["available"] == True]["seat"].astype(str).tolist()
-
-    ctx["stm"] = session.get("stm", [])
-    ctx["ltm"] = mem0_get(session.get("phone")) or []
-    return ctx
-
-async def try_book_seats_excel(showtime_id, seats, user_email, user_name, phone):
-    """Book seats and save to Excel."""
-    global bookings_df, showtimes_df, users_df
+    """Build context for LLM based on session (only the slice its stage needs)."""
+    return context_builder.build(session)
 
+async def book_seats(showtime_id, seats, user_email, user_name, phone):
+    """Book seats on the configured backend and email the confirmation."""
     seats = [str(s) for s in seats]
-    st = showtimes_df[showtimes_df["showtimeId"] == showtime_id]
-    if st.empty:
-        return {"success": False, "message": "Showtime not found"}
-
-    available = st[st["available"] == True]["seat"].astype(str).tolist()
-    if not all(seat in available for seat in seats):
-        return {"success": False, "message": "Some seats are not available"}
-
-    # Mark seats booked
-    showtimes_df.loc[
-        (showtimes_df["showtimeId"] == showtime_id) & (showtimes_df["seat"].isin(seats)),
-        "available"
-    ] = False
-
-    # Create new booking
-    new_booking = {
-        "bookingId": len(bookings_df) + 1,
-        "userId": user_email,
-        "showtimeId": showtime_id,
-        "seats": ",".join(seats),
-        "totalPrice": len(seats) * st.iloc[0]["price"],
-        "status": "confirmed",
-        "CreatedAt": datetime.now()
-    }
-    bookings_df = pd.concat([bookings_df, pd.DataFrame([new_booking])], ignore_index=True)
-
-    # Save new user if not exists
-    if phone not in users_df["phone"].values:
-        new_user = {"phone": phone, "name": user_name, "email": user_email}
-        users_df = pd.concat([users_df, pd.DataFrame([new_user])], ignore_index=True)
-
-    # Save all sheets
-    try:
-        with pd.ExcelWriter(EXCEL_FILE, engine="openpyxl") as writer:
-            movies_df.to_excel(writer, sheet_name="Moviename", index=False)
-            screens_df.to_excel(writer, sheet_name="screen", index=False)
-            users_df.to_excel(writer, sheet_name="user", index=False)
-            bookings_df.to_excel(writer, sheet_name="booking", index=False)
-            showtimes_df.to_excel(writer, sheet_name="showtime", index=False)
-    except Exception as e:
-        logger.error("Failed to save Excel: %s", e)
-        return {"success": False, "message": "Failed to save booking"}
-
-    # Save booking to external Excel log
-    save_booking_to_excel({
-        "bookingId": new_booking["bookingId"],
-        "name": user_name,
-        "phone": phone,
-        "email": user_email,
-        "movie": st.iloc[0]["movieTitle"],
-        "showtime": st.iloc[0]["startTime"].strftime("%d-%m-%Y %H:%M"),
-        "seats": seats
-    })
-
-    # Send email asynchronously
-    asyncio.create_task(
-        send_booking_email(
-            user_email, st.iloc[0]["movieTitle"],
-            st.iloc[0]["startTime"].strftime("%d-%m-%Y %H:%M"),
-            seats, name=user_name, phone=phone
+    with metrics.span("booking"):
+        res = await store.book(showtime_id, seats, user_email, user_name, phone)
+    show = store.inventory.get(showtime_id)
+    if not res.get("success"):
+        if show is not None and not show.is_available(seats, phone):
+            metrics.booking_conflicts.inc(at="booking")
+        return res
+
+    movie_title = show.movie_title if show else showtime_id
+    showtime = show.start_time.strftime("%d-%m-%Y %H:%M") if show else ""
+    quoted = quote(show, res["seats"]) if show else None
+    # Itemized only when every seat has a price; otherwise the email lists the seats alone
+    seat_prices = quoted["seats"] if quoted and quoted["total"] is not None else None
+
+    # Queue the confirmation email; delivery happens on the mail workers
+    with metrics.span("email_enqueue"):
+        await mail_queue.enqueue_booking_email(
+            user_email, movie_title, showtime,
+            res["seats"], name=user_name, phone=phone, booking_ref=str(res["bookingId"]),
+            seat_prices=seat_prices
         )
-    )
-
-    return {"success": True, "bookingId": new_booking["bookingId"], "seats": seats}
+    return res
 
 # ---------------- Webhook ----------------
 
@@ -163,27 +149,58 @@ async def whatsapp_webhook(Body: str = Form(...), From: str = Form(...)):
     text = Body.strip()
     logger.info("Incoming message from %s: %s", phone, text)
 
+    # Turns for a phone run one at a time; a burst of messages becomes one turn
+    future = reply_pipeline.submit(phone, text)
+    if future is None:
+        logger.warning("Reply pipeline full, rejecting message from %s", phone)
+        return PlainTextResponse("Busy", status_code=503)
+
+    twiml = MessagingResponse()
+    if REPLY_MODE != "async":
+        reply_text = await future
+        if reply_text is not None:  # None: answered in a later message's response
+            twiml.message(reply_text)
+    # In fast-ack mode the reply goes out through the Messages API once the turn is done
+    return PlainTextResponse(str(twiml), media_type="application/xml")
+
+async def handle_turn(phone: str, text: str) -> str:
+    """Run one conversation turn for `phone` and return the reply text."""
+    with metrics.turn(phone):
+        return await _handle_turn(phone, text)
+
+async def _handle_turn(phone: str, text: str) -> str:
     # Get or create session
-    session = sessions.get(phone)
-    if not session:
-        session = {
-            "phone": phone,
-            "stage": "greeting",
-            "stm": [],
-            "ltm": mem0_get(phone),
-            "createdAt": datetime.now(timezone.utc)
-        }
-        user_row = users_df[users_df["phone"] == phone]
-        if not user_row.empty:
-            session["name"] = user_row.iloc[0]["name"]
-            session["email"] = user_row.iloc[0]["email"]
-        sessions[phone] = session
-
-    await append_stm(phone, {"user": text})
-    context = await make_context(session)
-
-    # Call LLM
-    llm_out = await llm_reply(text, session.get("stage"), context, session)
+    with metrics.span("session"):
+        session = await sessions.get(phone)
+        if session is None:
+            session = sessions.create(phone)
+            user = await store.get_user(phone)
+            if user is not None:
+                session.name = user["name"]
+                session.email = user["email"]
+        if session.ltm is None:
+            session.ltm = await mem0_aget(phone)
+
+    session.stm.append("user", text)
+
+    with metrics.span("refresh"):
+        # A movie picked from the greeting menu: its showtimes are needed for this very reply
+        picked = None
+        if (session.get("stage") or "greeting") == "greeting":
+            picked = pick_movie(text, context_builder)
+        await store.refresh(session, picked_movie=picked["title"] if picked else None)
+
+    # Structured replies (menu numbers, showtime ids, seat lists) skip the LLM
+    with metrics.span("fastpath"):
+        llm_out = fast_reply(text, session, context_builder)
+    if llm_out is None:
+        with metrics.span("context"):
+            context = await make_context(session)
+        with metrics.span("llm"):
+            llm_out = await llm_reply(text, session.get("stage"), context, session,
+                                      fallback=lambda: fallback_reply(text, session, context_builder))
+    else:
+        metrics.set_turn_path("fastpath")
     logger.debug("LLM output: %s", llm_out)
 
     # Update session from LLM output
@@ -195,6 +212,22 @@ async def whatsapp_webhook(Body: str = Form(...), From: str = Form(...)):
         if k in {"movieTitle", "showtimeId", "seats", "name", "email", "stage"}:
             session[k] = v
 
+    # Hold newly chosen seats until confirmation (or SEAT_HOLD_TTL)
+    if "seats" in to_set:
+        seats = session.get("seats")
+        if isinstance(seats, (str, int)):
+            seats = [str(seats)]
+        if session.get("showtimeId") and seats:
+            if not holds.hold(phone, session.get("showtimeId"), [str(s) for s in seats]):
+                metrics.booking_conflicts.inc(at="hold")
+                session["seats"] = None
+                session["stage"] = "ask_seats"
+                reply_text = "Sorry, some of those seats were just taken. Please pick different seats."
+        else:
+            holds.release(phone)
+    elif "showtimeId" in to_set:
+        holds.release(phone)
+
     # Advance stage if not explicitly set
     if "stage" not in to_set:
         # Automatic stage advancement handled inside LLM prompt
@@ -209,18 +242,17 @@ async def whatsapp_webhook(Body: str = Form(...), From: str = Form(...)):
         if isinstance(seats, (str, int)):
             seats = [str(seats)]
         if showtime_id and seats and email and name:
-            res = await try_book_seats_excel(showtime_id, seats, email, name, phone)
+            res = await book_seats(showtime_id, seats, email, name, phone)
             if res.get("success"):
+                holds.release(phone)
                 session["bookingId"] = res["bookingId"]
                 session["stage"] = "feedback"
                 reply_text = f"✅ Booking confirmed for {name}! Seats: {', '.join(seats)}. Confirmation sent to {email}."
             else:
                 reply_text = res.get("message", "Failed to book seats.")
 
-    await append_stm(phone, {"bot": reply_text})
-    sessions[phone] = session
+    session.stm.append("bot", reply_text)
+    with metrics.span("session_save"):
+        await sessions.put(session)
     logger.info("Replying to %s: %s", phone, reply_text)
-
-    twiml = MessagingResponse()
-    twiml.message(reply_text)
-    return PlainTextResponse(str(twiml), media_type="application/xml")
+    return reply_text
@@ -1,41 +1,142 @@
 import os
 import json
-from typing import Any, Dict, List
+import asyncio
+import threading
+from collections import deque
+from itertools import islice
+from typing import Any, Deque, Dict, List
 
-STORE_DIR = "ltm_store"
-os.makedirs(STORE_DIR, exist_ok=True)
+from io_pool import run_io
+
+STORE_DIR = "ltm_store"  # created on first write
+
+MAX_ITEMS = 1000  # entries kept per user
+FLUSH_INTERVAL = float(os.getenv("LTM_FLUSH_INTERVAL", 5))  # seconds
+
+# Read cache: last MAX_ITEMS entries per user, loaded once per process
+_cache: Dict[str, Deque[Dict[str, Any]]] = {}
+# Write-behind buffer: entries not yet appended to disk
+_pending: Dict[str, List[Dict[str, Any]]] = {}
+# Lines in each user's log file; the log is trimmed to MAX_ITEMS once it passes twice that
+_lines: Dict[str, int] = {}
+_lock = threading.Lock()
 
 def _path_for(user_key: str) -> str:
     safe = user_key.replace("+", "p").replace(":", "_").replace("/", "_")
-    return os.path.join(STORE_DIR, f"{safe}.json")
+    return os.path.join(STORE_DIR, f"{safe}.jsonl")
 
-def mem0_get(user_key: str, limit: int = 50) -> List[Dict[str, Any]]:
+def _write_lines(path: str, lines):
+    """Replace a log file with `lines` (written to a temp file first, so it is never half-written)."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+    os.replace(tmp, path)
+
+def _compact(path: str) -> int:
+    """Keep only the last MAX_ITEMS entries of a log. Returns the lines left."""
+    with open(path, "r", encoding="utf-8") as f:
+        tail = deque((line for line in f if line.strip()), maxlen=MAX_ITEMS)
+    _write_lines(path, tail)
+    return len(tail)
+
+def _load(user_key: str) -> Deque[Dict[str, Any]]:
+    """Read a user's history from disk (JSON Lines, or the legacy JSON array)."""
+    items: Deque[Dict[str, Any]] = deque(maxlen=MAX_ITEMS)
     p = _path_for(user_key)
-    if not os.path.exists(p):
-        return []
+    legacy = p[:-1]  # "<user>.json"
+    lines = 0
     try:
-        with open(p, "r", encoding="utf-8") as f:
-            arr = json.load(f)
-        return arr[-limit:]
+        if os.path.exists(p):
+            with open(p, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        items.append(json.loads(line))
+                        lines += 1
+        elif os.path.exists(legacy):
+            with open(legacy, "r", encoding="utf-8") as f:
+                items.extend(json.load(f))
+            lines = -1  # force a rewrite in the new format
     except Exception as e:
         print(f"mem0_get error for {user_key}: {e}")
+
+    # Trim the log once it holds well over MAX_ITEMS (or migrate a legacy file)
+    if lines < 0 or lines > 2 * MAX_ITEMS:
+        os.makedirs(STORE_DIR, exist_ok=True)
+        _write_lines(p, (json.dumps(item, ensure_ascii=False, default=str) + "\n" for item in items))
+        if os.path.exists(legacy):
+            os.remove(legacy)
+        lines = len(items)
+    _lines[user_key] = lines
+    return items
+
+def _history(user_key: str) -> Deque[Dict[str, Any]]:
+    items = _cache.get(user_key)
+    if items is None:
+        items = _cache[user_key] = _load(user_key)
+    return items
+
+def _tail(items: Deque[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+    """The last `limit` items, oldest first, without copying the whole history."""
+    tail = list(islice(reversed(items), limit))
+    tail.reverse()
+    return tail
+
+def mem0_get(user_key: str, limit: int = 50) -> List[Dict[str, Any]]:
+    if not user_key:
         return []
+    return _tail(_history(user_key), limit)
+
+async def mem0_aget(user_key: str, limit: int = 50) -> List[Dict[str, Any]]:
+    """mem0_get for the event loop: a user's first read goes to disk on the I/O pool."""
+    if not user_key:
+        return []
+    items = _cache.get(user_key)
+    if items is None:
+        loaded = await run_io(_load, user_key)
+        items = _cache.setdefault(user_key, loaded)  # keep a copy loaded concurrently
+    return _tail(items, limit)
 
 def mem0_set(user_key: str, memory: Dict[str, Any]) -> bool:
-    p = _path_for(user_key)
-    arr = []
-    if os.path.exists(p):
+    """Record a memory. It is visible to mem0_get immediately and written to disk by flush()."""
+    _history(user_key).append(memory)
+    with _lock:
+        _pending.setdefault(user_key, []).append(memory)
+    return True
+
+def flush() -> int:
+    """
+    Append buffered memories to their users' logs, trimming a log back to
+    MAX_ITEMS entries once it passes twice that. Returns the number written.
+    """
+    with _lock:
+        batch = dict(_pending)
+        _pending.clear()
+    written = 0
+    if batch:
+        os.makedirs(STORE_DIR, exist_ok=True)
+    for user_key, memories in batch.items():
+        path = _path_for(user_key)
         try:
-            with open(p, "r", encoding="utf-8") as f:
-                arr = json.load(f)
-        except Exception:
-            arr = []
-    arr.append(memory)
-    arr = arr[-1000:]
-    try:
-        with open(p, "w", encoding="utf-8") as f:
-            json.dump(arr, f, ensure_ascii=False, indent=2, default=str)
-        return True
-    except Exception as e:
-        print(f"mem0_set error for {user_key}: {e}")
-        return False
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(m, ensure_ascii=False, default=str) + "\n" for m in memories))
+            written += len(memories)
+        except Exception as e:
+            print(f"mem0_set error for {user_key}: {e}")
+            with _lock:
+                _pending.setdefault(user_key, [])[:0] = memories
+            continue
+        _lines[user_key] = _lines.get(user_key, 0) + len(memories)
+        if _lines[user_key] > 2 * MAX_ITEMS:
+            try:
+                _lines[user_key] = _compact(path)
+            except Exception as e:
+                print(f"mem0 compaction error for {user_key}: {e}")
+    return written
+
+async def run_flusher(interval: float = FLUSH_INTERVAL):
+    """Background task: flush buffered memories every `interval` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        if _pending:
+            await run_io(flush)
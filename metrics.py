@@ -0,0 +1,226 @@
+# metrics.py
+import os
+import sys
+import time
+import logging
+import threading
+import contextvars
+from collections import Counter as _Tally, deque
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SLOW_TURN_SECONDS = float(os.getenv("SLOW_TURN_SECONDS", 0))        # log turns slower than this (0: off)
+PROFILE_SLOW_TURNS = os.getenv("PROFILE_SLOW_TURNS", "false").lower() == "true"
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", 0.005))      # seconds between stack samples
+
+# Latency buckets (seconds), from sub-millisecond in-memory work up to slow LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# ---------------- Metric types ----------------
+# Updated from the event loop only, so no locking; render() may run concurrently
+# and at worst reads a sample one observation behind.
+
+_registry: List = []
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _fmt(value: float) -> str:
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+class Counter:
+    """Monotonic counter, optionally labelled."""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, v in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_fmt(v)}")
+        return lines
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus exposition format."""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+                break
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, series):
+                cumulative += n
+                le = _labels(self.labelnames, key, 'le="%s"' % _fmt(bound))
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _labels(self.labelnames, key, 'le="+Inf"')
+            labels = _labels(self.labelnames, key)
+            lines.append(f"{self.name}_bucket{le} {series[-1]}")
+            lines.append(f"{self.name}_sum{labels} {_fmt(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+class StatsCollector:
+    """
+    Exposes an existing stats dict (or a callable returning one) without
+    changing the code that updates it: each numeric entry becomes a sample
+    of `name{<label>="<key>"}`.
+    """
+
+    def __init__(self, name: str, help: str, source, label: str = "kind", kind: str = "counter"):
+        self.name = name
+        self.help = help
+        self.source = source
+        self.label = label
+        self.kind = kind
+        _registry.append(self)
+
+    def render(self) -> List[str]:
+        stats = self.source() if callable(self.source) else self.source
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, v in sorted(stats.items()):
+            if isinstance(v, (int, float)):
+                lines.append(f'{self.name}{{{self.label}="{_escape(key)}"}} {_fmt(v)}')
+        return lines
+
+def render() -> str:
+    """All registered metrics in the Prometheus text format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# ---------------- Pipeline metrics ----------------
+
+stage_seconds = Histogram("moviebot_stage_seconds", "Time spent per pipeline stage", ["stage"])
+turn_seconds = Histogram("moviebot_turn_seconds", "End-to-end time of one conversation turn", ["path"])
+llm_retries = Counter("moviebot_llm_retries_total", "LLM calls re-sent after an unusable reply")
+llm_failures = Counter("moviebot_llm_failures_total", "LLM turns answered with a canned fallback", ["reason"])
+booking_conflicts = Counter("moviebot_booking_conflicts_total",
+                            "Seats that were taken by someone else", ["at"])
+prompt_bytes = Histogram("moviebot_llm_prompt_bytes", "LLM prompt payload size", ["stage"],
+                         buckets=(512, 1024, 2048, 4096, 8192, 16384, 32768, 65536))
+
+# ---------------- Spans ----------------
+
+_turn: contextvars.ContextVar = contextvars.ContextVar("moviebot_turn", default=None)
+
+@contextmanager
+def span(stage: str):
+    """Time a stage into moviebot_stage_seconds, and into the current turn's breakdown."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=stage)
+        current = _turn.get()
+        if current is not None:
+            current["spans"].append((stage, elapsed))
+
+def set_turn_path(path: str):
+    """Label the current turn in moviebot_turn_seconds (e.g. "fastpath" or "llm")."""
+    current = _turn.get()
+    if current is not None:
+        current["path"] = path
+
+@contextmanager
+def turn(phone: str):
+    """
+    Wrap one conversation turn: records moviebot_turn_seconds and, for turns
+    slower than SLOW_TURN_SECONDS, logs the span breakdown (plus the hottest
+    sampled stacks when PROFILE_SLOW_TURNS is on).
+    """
+    current = {"path": "llm", "spans": []}
+    token = _turn.set(current)
+    start_wall, start = time.monotonic(), time.perf_counter()
+    try:
+        yield
+    finally:
+        _turn.reset(token)
+        elapsed = time.perf_counter() - start
+        turn_seconds.observe(elapsed, path=current["path"])
+        if SLOW_TURN_SECONDS and elapsed >= SLOW_TURN_SECONDS:
+            breakdown = ", ".join(f"{s}={t * 1000:.1f}ms" for s, t in current["spans"])
+            logger.warning("Slow turn for %s: %.3fs (%s)", phone, elapsed, breakdown)
+            if profiler is not None:
+                for frame, n in profiler.hottest(start_wall, time.monotonic()):
+                    logger.warning("  %4d samples  %s", n, frame)
+
+# ---------------- Sampling profiler ----------------
+
+class SamplingProfiler:
+    """
+    Samples the event-loop thread's stack every `interval` seconds from a
+    daemon thread, keeping the last `keep` samples. `hottest(t0, t1)` returns
+    the most frequent innermost app frames seen in a time window, which is
+    enough to see what a slow turn (or whatever else was blocking the loop
+    at the time) was doing.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL, keep: int = 20000):
+        self.interval = interval
+        self._samples: deque = deque(maxlen=keep)  # (monotonic, "file:line func")
+        self._target = threading.main_thread().ident
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self._target)
+            # Skip library frames so the sample points at our code
+            while frame is not None and "site-packages" in frame.f_code.co_filename:
+                frame = frame.f_back
+            if frame is not None:
+                code = frame.f_code
+                self._samples.append((time.monotonic(),
+                                      f"{os.path.basename(code.co_filename)}:{frame.f_lineno} {code.co_name}"))
+
+    def hottest(self, t0: float, t1: float, top: int = 5) -> List[Tuple[str, int]]:
+        tally = _Tally(where for t, where in list(self._samples) if t0 <= t <= t1)
+        return tally.most_common(top)
+
+profiler: Optional[SamplingProfiler] = None
+
+def start_profiler():
+    """Start the slow-turn profiler if PROFILE_SLOW_TURNS is set (needs SLOW_TURN_SECONDS)."""
+    global profiler
+    if PROFILE_SLOW_TURNS and profiler is None:
+        profiler = SamplingProfiler()
@@ -0,0 +1,168 @@
+# mongo_store.py
+import os
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from booking import try_book_seats, try_book_seats_single, relay_booking_outbox
+from db import get_db, close_db
+from inventory import SeatInventory, Show
+from seatmap import SeatMap, seat_map_for
+
+logger = logging.getLogger(__name__)
+
+# transaction: multi-document transaction (needs a replica set)
+# single: one guarded update per booking, booking record relayed via an outbox
+MONGO_BOOKING_MODE = os.getenv("MONGO_BOOKING_MODE", "transaction")
+OUTBOX_RELAY_INTERVAL = float(os.getenv("OUTBOX_RELAY_INTERVAL", 30))
+
+# Only the seat fields the bot needs, for embedded seat arrays or the compact
+# layout (prices + row bitmaps); skips anything else stored in a showtime
+_SHOW_PROJECTION = {
+    "movieId": 1, "screenId": 1, "startTime": 1, "duration": 1,
+    "seats.seat": 1, "seats.type": 1, "seats.price": 1, "seats.available": 1,
+    "prices": 1, "avail": 1,
+}
+
+class MongoStore:
+    """
+    Storage backend on the `moviedb` Mongo database (see seed.py).
+
+    Mongo is the source of truth. Before each LLM turn `refresh()` pulls the
+    showtimes the session's stage needs into a local SeatInventory, so the
+    context builder and fast path read the same structures as with Excel.
+    Bookings go through booking.try_book_seats, or try_book_seats_single
+    when MONGO_BOOKING_MODE=single. Showtimes may use either seat layout
+    from seed.py (embedded seat arrays or compact bitmaps), even mixed.
+    """
+
+    def __init__(self, db=None, booking_mode: str = MONGO_BOOKING_MODE):
+        self._db = db
+        self.booking_mode = booking_mode
+        self._relay = None
+        self.inventory = SeatInventory()
+        self._movies: List[Dict[str, Any]] = []
+        self._movie_ids: Dict[str, str] = {}    # lowercase title -> movie _id
+        self._movie_titles: Dict[str, str] = {}  # movie _id -> title
+        self._screens: Dict[str, str] = {}       # screen _id -> name
+        self._seat_maps: Dict[str, SeatMap] = {}  # screen _id -> compact layout
+        self._show_maps: Dict[str, SeatMap] = {}  # compact showtime _id -> its screen's layout
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = get_db()
+        return self._db
+
+    # ---------------- Backend interface ----------------
+
+    async def start(self):
+        async for m in self.db.movies.find({}, {"title": 1, "rating": 1}):
+            self._movies.append({"title": m["title"], "rating": m.get("rating")})
+            self._movie_ids[m["title"].lower()] = m["_id"]
+            self._movie_titles[m["_id"]] = m["title"]
+        async for s in self.db.screens.find({}, {"name": 1, "layout": 1}):
+            self._screens[s["_id"]] = s["name"]
+            if s.get("layout"):
+                self._seat_maps[s["_id"]] = seat_map_for(s["layout"])
+        logger.info("Mongo backend ready: %d movies, %d screens", len(self._movies), len(self._screens))
+        if self.booking_mode == "single":
+            self._relay = asyncio.create_task(self._run_relay())
+
+    async def stop(self):
+        if self._relay is not None:
+            self._relay.cancel()
+            try:
+                await self._relay
+            except asyncio.CancelledError:
+                pass
+        close_db()
+
+    async def _run_relay(self, interval: float = OUTBOX_RELAY_INTERVAL):
+        """Background task: deliver bookings a crashed request left in showtime outboxes."""
+        while True:
+            try:
+                relayed = await relay_booking_outbox(self.db)
+                if relayed:
+                    logger.info("Relayed %d bookings from showtime outboxes", relayed)
+            except Exception:
+                logger.exception("Outbox relay failed; will retry")
+            await asyncio.sleep(interval)
+
+    def movie_list(self) -> List[Dict[str, Any]]:
+        return self._movies
+
+    def _to_show(self, doc: dict) -> Show:
+        if "avail" in doc:
+            seat_map = self._seat_maps[doc["screenId"]]
+            self._show_maps[doc["_id"]] = seat_map
+            return Show(
+                showtime_id=doc["_id"],
+                movie_title=self._movie_titles.get(doc.get("movieId"), doc.get("movieId")),
+                screen_name=self._screens.get(doc.get("screenId"), doc.get("screenId")),
+                start_time=doc["startTime"],
+                duration=doc.get("duration"),
+                seats=seat_map.seats,
+                types=seat_map.types,
+                prices=seat_map.prices(doc.get("prices", {})),
+                available=seat_map.unpack(doc["avail"]),
+            )
+        seats = doc.get("seats", [])
+        return Show(
+            showtime_id=doc["_id"],
+            movie_title=self._movie_titles.get(doc.get("movieId"), doc.get("movieId")),
+            screen_name=self._screens.get(doc.get("screenId"), doc.get("screenId")),
+            start_time=doc["startTime"],
+            duration=doc.get("duration"),
+            seats=[s["seat"] for s in seats],
+            types=[s.get("type") for s in seats],
+            prices=[s.get("price") for s in seats],
+            available=bytearray(1 if s.get("available") else 0 for s in seats),
+        )
+
+    async def refresh(self, session, picked_movie: Optional[str] = None):
+        """
+        Load the showtimes the session's stage will look at into the inventory.
+        `picked_movie` is a movie the user has just chosen from the menu; its
+        showtimes are loaded too, so the fast path can list them this turn.
+        """
+        movie_title = session.get("movieTitle")
+        showtime_id = session.get("showtimeId")
+        if showtime_id and session.get("stage") != "ask_time":
+            doc = await self.db.showtimes.find_one({"_id": showtime_id}, _SHOW_PROJECTION)
+            if doc:
+                self.inventory.upsert(self._to_show(doc))
+        elif movie_title:
+            await self._load_movie(movie_title)
+        if picked_movie and picked_movie != movie_title:
+            await self._load_movie(picked_movie)
+
+    async def _load_movie(self, movie_title: str):
+        movie_id = self._movie_ids.get(movie_title.lower())
+        if movie_id is None:
+            return
+        async for doc in self.db.showtimes.find({"movieId": movie_id}, _SHOW_PROJECTION).sort("startTime", 1):
+            self.inventory.upsert(self._to_show(doc))
+
+    async def get_user(self, phone) -> Optional[Dict[str, Any]]:
+        return await self.db.users.find_one({"phone": phone}, {"name": 1, "email": 1, "phone": 1})
+
+    async def book(self, showtime_id: str, seats: List[str], user_email: str,
+                   user_name: str, phone: str) -> Dict[str, Any]:
+        show = self.inventory.get(showtime_id)
+        if show is not None and not show.is_available(seats, owner=phone):
+            # Held by another user in this process
+            return {"success": False, "message": "Some seats are not available"}
+        book = try_book_seats_single if self.booking_mode == "single" else try_book_seats
+        res = await book(self.db, showtime_id, seats, user_id=phone, user_email=user_email,
+                         seat_map=self._show_maps.get(showtime_id))
+        if not res.get("success"):
+            return res
+        # Keep the local view in step without waiting for the next refresh
+        self.inventory.mark(showtime_id, res["seats"], False)
+        await self.db.users.update_one(
+            {"phone": phone},
+            {"$setOnInsert": {"phone": phone, "name": user_name, "email": user_email}},
+            upsert=True,
+        )
+        return res
@@ -0,0 +1,87 @@
+# pricing.py
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+import numpy as np
+
+# ---------------- Pricing rules ----------------
+# Base price of the screen, adjusted by time slot, day type and seat type
+
+MIN_PRICE = 100
+
+SLOTS = ("morning", "day", "evening")   # before 13:00 / 13:00-18:00 / from 18:00
+SLOT_ADJUST = (-50, 0, 30)
+DAY_TYPES = ("weekday", "weekend")
+DAY_ADJUST = (0, 20)
+SEAT_TYPES = ("vip", "premium", "regular")
+SEAT_ADJUST = (100, 50, 0)
+
+def slot_index(hour):
+    """Time-slot index for an hour (scalar or numpy array)."""
+    return np.where(np.asarray(hour) < 13, 0, np.where(np.asarray(hour) >= 18, 2, 1))
+
+def day_index(weekday):
+    """Day-type index for a weekday number, Monday = 0 (scalar or numpy array)."""
+    return (np.asarray(weekday) >= 5).astype(int)
+
+
+class PriceTable:
+    """
+    Seat prices for every (screen, time slot, day type, seat type), computed
+    in one vectorized pass. Looking up a show's prices is then pure indexing.
+    """
+
+    def __init__(self, base_prices: Mapping[str, float]):
+        self.screens = {screen: i for i, screen in enumerate(base_prices)}
+        base = np.asarray(list(base_prices.values()), dtype=float)
+        table = (base[:, None, None, None]
+                 + np.asarray(SLOT_ADJUST)[None, :, None, None]
+                 + np.asarray(DAY_ADJUST)[None, None, :, None]
+                 + np.asarray(SEAT_ADJUST)[None, None, None, :])
+        self.table = np.maximum(table, MIN_PRICE).astype(int)  # [screen, slot, day, seat type]
+
+    def for_show(self, screen: str, start_time: datetime) -> Dict[str, int]:
+        """{seat type: price} for one show."""
+        row = self.table[self.screens[screen], slot_index(start_time.hour), day_index(start_time.weekday())]
+        return dict(zip(SEAT_TYPES, row.tolist()))
+
+# ---------------- Quotes ----------------
+
+def seat_price(value) -> Optional[int]:
+    """A stored seat price as an int, or None when it is missing (None/NaN, e.g. a seat type the show has no price for)."""
+    if value is None or value != value:
+        return None
+    return int(value)
+
+def quote(show, seats: Iterable[str]) -> Dict[str, Any]:
+    """
+    Price a seat selection on a show from its per-seat prices: O(1) per seat,
+    so mixed vip/premium/regular selections add up correctly.
+
+    Returns {"seats": {seat: price}, "total": int}. A seat without a price
+    is quoted as None, and so is the total.
+    """
+    prices = show.prices
+    index = show.index
+    lines = {s: seat_price(prices[index[s]]) for s in seats}
+    missing = None in lines.values()
+    return {"seats": lines, "total": None if missing else sum(lines.values())}
+
+def cheapest(show) -> Optional[int]:
+    """The lowest seat price on a show (None if no seat has a price)."""
+    prices = [p for p in map(seat_price, show.prices) if p is not None]
+    return min(prices) if prices else None
+
+def price_bands(show) -> List[Dict[str, Any]]:
+    """One entry per seat type in the show: its rows and price, e.g. {"type": "vip", "rows": "A-B", "price": 350}."""
+    bands: Dict[str, Dict[str, Any]] = {}
+    for seat, seat_type, price in zip(show.seats, show.types, show.prices):
+        row = seat.rstrip("0123456789")
+        band = bands.get(seat_type)
+        if band is None:
+            bands[seat_type] = {"type": seat_type, "rows": [row], "price": seat_price(price)}
+        elif band["rows"][-1] != row:
+            band["rows"].append(row)
+    for band in bands.values():
+        rows = band["rows"]
+        band["rows"] = rows[0] if len(rows) == 1 else f"{rows[0]}-{rows[-1]}"
+    return list(bands.values())
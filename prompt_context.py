@@ -0,0 +1,136 @@
+# prompt_context.py
+import os
+import re
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List
+
+from pricing import cheapest, price_bands
+
+logger = logging.getLogger(__name__)
+
+LTM_CONTEXT_LIMIT = int(os.getenv("LTM_CONTEXT_LIMIT", 10))
+CONTEXT_CACHE_SIZE = 512  # memoized fragments kept per kind (movies / shows), LRU
+
+_SEAT_RE = re.compile(r"^([A-Za-z]*)(\d+)$")
+
+def seat_ranges(seats: List[str]) -> List[str]:
+    """
+    Collapse seat ids into row ranges, e.g. ["A1","A2","A3","A5"] -> ["A1-A3", "A5"].
+    Seats are expected in layout order; ids that don't look like <row><number> are kept as-is.
+    """
+    out = []
+    run_row, run_start, run_end = None, None, None
+
+    def flush():
+        if run_row is not None:
+            out.append(f"{run_row}{run_start}" if run_start == run_end
+                       else f"{run_row}{run_start}-{run_row}{run_end}")
+
+    for sid in seats:
+        m = _SEAT_RE.match(sid)
+        if not m:
+            flush()
+            run_row = None
+            out.append(sid)
+            continue
+        row, col = m.group(1), int(m.group(2))
+        if row == run_row and col == run_end + 1:
+            run_end = col
+            continue
+        flush()
+        run_row, run_start, run_end = row, col, col
+    flush()
+    return out
+
+
+def _remember(cache: "OrderedDict[str, tuple]", key: str, entry: tuple):
+    """Store `entry` as the newest under `key` (replacing a stale one) and evict the oldest."""
+    cache[key] = entry
+    cache.move_to_end(key)
+    if len(cache) > CONTEXT_CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+class ContextBuilder:
+    """
+    Stage-aware LLM context.
+
+    Only the slice the current stage needs is included: the movie list while a
+    movie is being picked, a showtime summary while a time is being picked,
+    and seat ranges of the one chosen show while seats are being picked.
+    Rendered fragments are memoized per movie / show (LRU, CONTEXT_CACHE_SIZE
+    each) and rebuilt only when the seat inventory for them changes.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._movies = None
+        self._showtimes: "OrderedDict[str, tuple]" = OrderedDict()  # movie -> (versions, fragment)
+        self._seats: "OrderedDict[str, tuple]" = OrderedDict()      # showtimeId -> (version, fragment)
+
+    def movies(self) -> List[Dict[str, Any]]:
+        if self._movies is None:
+            self._movies = self.store.movie_list()
+        return self._movies
+
+    def showtimes(self, movie_title: str) -> List[Dict[str, Any]]:
+        shows = self.store.inventory.for_movie(movie_title)
+        versions = tuple(show.version for show in shows)
+        key = movie_title.lower()
+        cached = self._showtimes.get(key)
+        if cached and cached[0] == versions:
+            self._showtimes.move_to_end(key)
+            return cached[1]
+        fragment = [{
+            "showtimeId": show.showtime_id,
+            "startTime": show.start_time.strftime("%d-%m-%Y %H:%M"),
+            "duration": show.duration,
+            "screenName": show.screen_name,
+            "available_count": show.available_count(),
+            "price": cheapest(show),  # per-type prices come with the show
+        } for show in shows]
+        _remember(self._showtimes, key, (versions, fragment))
+        return fragment
+
+    def seats(self, showtime_id: str) -> Dict[str, Any]:
+        show = self.store.inventory.get(showtime_id)
+        if show is None:
+            return {}
+        cached = self._seats.get(showtime_id)
+        if cached and cached[0] == show.version:
+            self._seats.move_to_end(showtime_id)
+            return cached[1]
+        available = show.available_seats()
+        fragment = {
+            "showtimeId": show.showtime_id,
+            "movieTitle": show.movie_title,
+            "startTime": show.start_time.strftime("%d-%m-%Y %H:%M"),
+            "screenName": show.screen_name,
+            "prices": price_bands(show),
+            "available_count": len(available),
+            "seats": seat_ranges(available),
+        }
+        _remember(self._seats, showtime_id, (show.version, fragment))
+        return fragment
+
+    def build(self, session: dict) -> Dict[str, Any]:
+        stage = session.get("stage") or "greeting"
+        movie_title = session.get("movieTitle")
+        showtime_id = session.get("showtimeId")
+
+        ctx = {}
+        if stage == "greeting" or not movie_title:
+            ctx["movies"] = self.movies()
+        if movie_title and (stage == "ask_time" or not showtime_id):
+            ctx["showtimes"] = self.showtimes(movie_title)
+        if showtime_id and stage != "ask_time":
+            ctx["show"] = self.seats(showtime_id)
+            if stage != "ask_seats":
+                # Past seat selection only the show summary is needed
+                ctx["show"] = {k: v for k, v in ctx["show"].items() if k != "seats"}
+
+        stm = session.get("stm")
+        ctx["stm"] = stm.for_prompt() if stm is not None else {"messages": []}
+        ctx["ltm"] = (session.get("ltm") or [])[-LTM_CONTEXT_LIMIT:]
+        return ctx
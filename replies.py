@@ -0,0 +1,200 @@
+# replies.py
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+REPLY_MODE = os.getenv("REPLY_MODE", "sync")            # sync (reply in TwiML) | async (fast ack)
+REPLY_SENDER = os.getenv("REPLY_SENDER", "twilio")      # twilio | log (offline / load tests)
+REPLY_WORKERS = int(os.getenv("REPLY_WORKERS", 32))     # turns processed concurrently
+REPLY_QUEUE_SIZE = int(os.getenv("REPLY_QUEUE_SIZE", 10000))  # queued messages before 503s
+# Seconds of quiet before a turn runs. In sync mode the webhook waits for the turn, so by default
+# nothing is held back there: only messages that arrive while the phone's previous turn runs are joined.
+COALESCE_WINDOW = float(os.getenv("COALESCE_WINDOW", 0.5 if REPLY_MODE == "async" else 0))
+COALESCE_MAX = int(os.getenv("COALESCE_MAX", 5))              # messages joined into one turn at most
+TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
+TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
+TWILIO_WHATSAPP_NUMBER = os.getenv("TWILIO_WHATSAPP_NUMBER")
+
+FALLBACK_REPLY = "Sorry, something went wrong. Please try again."
+
+# ---------------- Senders ----------------
+
+class TwilioSender:
+    """Sends replies through Twilio's Messages API."""
+
+    def __init__(self, account_sid: str = TWILIO_ACCOUNT_SID, auth_token: str = TWILIO_AUTH_TOKEN,
+                 from_number: str = TWILIO_WHATSAPP_NUMBER):
+        from twilio.rest import Client  # only needed in async reply mode
+        if not (account_sid and auth_token and from_number):
+            raise RuntimeError("REPLY_MODE=async needs TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN "
+                               "and TWILIO_WHATSAPP_NUMBER (or REPLY_SENDER=log)")
+        self.client = Client(account_sid, auth_token)
+        self.from_ = from_number if from_number.startswith("whatsapp:") else f"whatsapp:{from_number}"
+
+    async def send(self, phone: str, text: str):
+        # The Twilio client is blocking (requests); keep it off the event loop
+        await asyncio.to_thread(
+            self.client.messages.create, from_=self.from_, to=f"whatsapp:{phone}", body=text
+        )
+
+
+class LogSender:
+    """
+    Logs replies instead of sending them, for running the pipeline offline.
+    `latency` simulates the Messages API round-trip; the last few replies are
+    kept in `sent` for inspection.
+    """
+
+    def __init__(self, latency: float = 0.0, keep: int = 1000):
+        self.latency = latency
+        self.sent: Deque[tuple] = deque(maxlen=keep)
+
+    async def send(self, phone: str, text: str):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent.append((phone, text))
+        logger.info("Reply to %s (not sent): %s", phone, text)
+
+def make_sender(kind: str = REPLY_SENDER):
+    if kind == "log":
+        return LogSender()
+    if kind != "twilio":
+        logger.warning("Unknown REPLY_SENDER %r, using Twilio", kind)
+    return TwilioSender()
+
+# ---------------- Pipeline ----------------
+
+class ReplyPipeline:
+    """
+    Per-phone turn queue in front of the conversation handler.
+
+    Every message lands in its phone's inbox and only one worker serves a
+    phone at a time, so a user's turns never race on the session and run in
+    the order they arrived, while different users are processed in parallel.
+    Messages arriving within `coalesce_window` seconds of each other are
+    joined into a single turn (one LLM call); with no window, only those
+    that arrived while the phone's previous turn was running are. The reply
+    resolves the future of the last message in the batch, earlier ones get
+    None.
+
+    In fast-ack mode (`start(send=True)`) the webhook returns right after
+    `submit` and replies are delivered through `sender`; otherwise the
+    webhook awaits the future and puts the reply in its TwiML.
+    """
+
+    def __init__(self, handler: Callable[[str, str], Awaitable[str]], sender=None,
+                 workers: int = REPLY_WORKERS, maxsize: int = REPLY_QUEUE_SIZE,
+                 coalesce_window: float = COALESCE_WINDOW, coalesce_max: int = COALESCE_MAX):
+        self.handler = handler
+        self.sender = sender
+        self.workers = workers
+        self.maxsize = maxsize
+        self.coalesce_window = coalesce_window
+        self.coalesce_max = coalesce_max
+        self.send = False
+        self.stats = {"received": 0, "turns": 0, "coalesced": 0,
+                      "sent": 0, "failed": 0, "rejected": 0}
+        self._inboxes: Dict[str, Deque[tuple]] = {}  # phone -> (text, future, arrived_at)
+        self._ready = None                            # phones with an inbox and no worker
+        self._queued = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = []
+
+    def start(self, send: bool = True):
+        self.send = send
+        if send and self.sender is None:
+            self.sender = make_sender()
+        self._ready = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, phone: str, text: str) -> Optional[asyncio.Future]:
+        """
+        Queue a message. Returns a future for the reply (None if the message
+        was folded into a later one's turn), or None if the pipeline is full.
+        """
+        if self._queued >= self.maxsize:
+            self.stats["rejected"] += 1
+            return None
+        self.stats["received"] += 1
+        self._queued += 1
+        self._idle.clear()
+        inbox = self._inboxes.get(phone)
+        if inbox is None:
+            # No inbox means no worker owns this phone: hand it to one
+            inbox = self._inboxes[phone] = deque()
+            self._ready.put_nowait(phone)
+        future = asyncio.get_running_loop().create_future()
+        inbox.append((text, future, time.monotonic()))
+        return future
+
+    def pending(self) -> int:
+        return self._queued
+
+    async def drain(self, timeout: float = 30):
+        """Finish queued turns (up to `timeout` seconds), then stop the workers."""
+        if self._ready is None:
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error("Reply drain timed out with %d messages unhandled", self._queued)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            phone = await self._ready.get()
+            inbox = self._inboxes[phone]
+            while inbox:
+                await self._debounce(inbox)
+                batch = [inbox.popleft() for _ in range(min(len(inbox), self.coalesce_max))]
+                try:
+                    await self._serve(phone, batch)
+                finally:
+                    self._queued -= len(batch)
+            # Inbox drained; the next message for this phone starts a new one
+            del self._inboxes[phone]
+            if not self._queued:
+                self._idle.set()
+
+    async def _debounce(self, inbox: Deque[tuple]):
+        """Wait until the phone has been quiet for the window (at most 3 windows in all)."""
+        if self.coalesce_window <= 0:
+            return
+        deadline = inbox[0][2] + 3 * self.coalesce_window
+        while len(inbox) < self.coalesce_max:
+            wait = min(inbox[-1][2] + self.coalesce_window, deadline) - time.monotonic()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    async def _serve(self, phone: str, batch: List[tuple]):
+        self.stats["turns"] += 1
+        self.stats["coalesced"] += len(batch) - 1
+        text = "\n".join(t for t, _, _ in batch)
+        try:
+            reply = await self.handler(phone, text)
+        except Exception:
+            logger.exception("Turn for %s failed", phone)
+            reply = FALLBACK_REPLY
+        for i, (_, future, _) in enumerate(batch):
+            if not future.done():  # the webhook may have gone away
+                future.set_result(reply if i == len(batch) - 1 else None)
+        if not self.send:
+            return
+        try:
+            await self.sender.send(phone, reply)
+            self.stats["sent"] += 1
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.error("Failed to send reply to %s: %s", phone, e)
@@ -0,0 +1,87 @@
+# seatmap.py
+from typing import Dict, Iterable, List, Mapping, Optional
+import numpy as np
+from bson.int64 import Int64
+
+# ---------------- Compact seat layout ----------------
+# A showtime in the compact layout stores no seat list: the screen document
+# carries a fixed `layout` ({"rows": [{"row": "A", "type": "vip", "cols": 12}, ...]})
+# and the showtime only `prices` ({seat type: price}) plus `avail`, one int64
+# bitmap per row where bit c-1 set means seat <row><c> is free. Booking checks
+# and flips bits in place with $bitsAllSet / $bit, no array filters.
+
+MAX_COLS = 63  # bits per row that stay clear of the int64 sign bit
+
+def row_type(r: int, rows: int) -> str:
+    """Seat category of row `r`: first 2 rows VIP, last 2 regular, premium in between."""
+    if r < 2:
+        return "vip"
+    if r < rows - 2:
+        return "premium"
+    return "regular"
+
+def screen_layout(rows: int, cols: int) -> Dict[str, list]:
+    """Layout document for a rows x cols screen (same seats and types as seed.gen_seats)."""
+    if cols > MAX_COLS:
+        raise ValueError(f"At most {MAX_COLS} seats per row, got {cols}")
+    return {"rows": [{"row": chr(65 + r), "type": row_type(r, rows), "cols": cols} for r in range(rows)]}
+
+
+class SeatMap:
+    """
+    Seat ids, types and bit positions of one screen layout, derived once.
+
+    `unpack` turns a showtime's row bitmaps into the per-seat availability
+    bytearray the inventory uses, and `masks` turns a seat selection into the
+    per-row bits a booking has to find set and clear.
+    """
+
+    __slots__ = ("rows", "seats", "types", "index", "_row", "_col")
+
+    def __init__(self, layout: Mapping):
+        self.rows = layout["rows"]
+        seats, types, row_idx, col_idx = [], [], [], []
+        for r, row in enumerate(self.rows):
+            if row["cols"] > MAX_COLS:
+                raise ValueError(f"At most {MAX_COLS} seats per row, got {row['cols']}")
+            for c in range(row["cols"]):
+                seats.append(f"{row['row']}{c + 1}")
+                types.append(row["type"])
+                row_idx.append(r)
+                col_idx.append(c)
+        self.seats = seats
+        self.types = types
+        self.index = {s: i for i, s in enumerate(seats)}
+        self._row = np.array(row_idx, dtype=np.int64)
+        self._col = np.array(col_idx, dtype=np.int64)
+
+    def full(self) -> List[Int64]:
+        """Row bitmaps with every seat free (a freshly seeded showtime)."""
+        return [Int64((1 << row["cols"]) - 1) for row in self.rows]
+
+    def unpack(self, avail: Iterable[int]) -> bytearray:
+        bits = np.asarray([int(v) for v in avail], dtype=np.int64)
+        return bytearray(((bits[self._row] >> self._col) & 1).astype(np.uint8).tobytes())
+
+    def prices(self, by_type: Mapping[str, int]) -> List[Optional[int]]:
+        return [by_type.get(t) for t in self.types]
+
+    def masks(self, seats: Iterable[str]) -> Dict[int, int]:
+        """{row index: bits of the requested seats}; KeyError on a seat not in the layout."""
+        masks: Dict[int, int] = {}
+        for s in seats:
+            i = self.index[s]
+            r = int(self._row[i])
+            masks[r] = masks.get(r, 0) | (1 << int(self._col[i]))
+        return masks
+
+
+_seat_maps: Dict[tuple, SeatMap] = {}
+
+def seat_map_for(layout: Mapping) -> SeatMap:
+    """Shared SeatMap per distinct layout (one per screen in practice)."""
+    key = tuple((row["row"], row["type"], row["cols"]) for row in layout["rows"])
+    seat_map = _seat_maps.get(key)
+    if seat_map is None:
+        seat_map = _seat_maps[key] = SeatMap(layout)
+    return seat_map
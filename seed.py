@@ -1,18 +1,36 @@
 import os
+import time
+import argparse
+from itertools import islice
 from datetime import datetime, timezone, timedelta
 from pprint import pprint
 from dotenv import load_dotenv
-from pymongo import MongoClient
 import random
 
+from pricing import PriceTable
+from seatmap import row_type, screen_layout, seat_map_for
+
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI")
-if not MONGO_URI:
-    raise SystemExit("MONGO_URI not found in .env")
+SEED_BATCH_SIZE = int(os.getenv("SEED_BATCH_SIZE", 500))  # showtimes per insert_many
+
+# ---------- Demo data ----------
+MOVIES = [
+    {"_id": "m1", "title": "Dil Chahta Hai", "durationMin": 150, "language": "Hindi", "genre": ["Drama","Friendship"], "rating": 8.0},
+    {"_id": "m2", "title": "3 Idiots", "durationMin": 170, "language": "Hindi", "genre": ["Comedy","Drama"], "rating": 8.5},
+    {"_id": "m3", "title": "Andhadhun", "durationMin": 140, "language": "Hindi", "genre": ["Thriller","Mystery"], "rating": 8.2},
+    {"_id": "m4", "title": "Zindagi Na Milegi Dobara", "durationMin": 155, "language": "Hindi", "genre": ["Adventure","Drama"], "rating": 8.3},
+    {"_id": "m5", "title": "Chhichhore", "durationMin": 145, "language": "Hindi", "genre": ["Comedy","Drama"], "rating": 7.9}
+]
+
+SCREENS = [
+    {"_id": "s1", "name": "Screen 1", "rows": 10, "cols": 12, "basePrice": 250},
+    {"_id": "s2", "name": "Screen 2", "rows": 8, "cols": 10, "basePrice": 200},
+    {"_id": "s3", "name": "Screen 3", "rows": 6, "cols": 8, "basePrice": 180}
+]
 
-client = MongoClient(MONGO_URI)
-db = client["moviedb"]
+BASE_DATE = datetime(2025, 9, 20, tzinfo=timezone.utc)
 
 # ---------- Helpers ----------
 def gen_seats(rows, cols):
@@ -25,12 +43,7 @@ def gen_seats(rows, cols):
     seats = []
     for r in range(rows):
         row_char = chr(65 + r)  # A, B, C...
-        if r < 2:
-            seat_type = "vip"
-        elif r < rows - 2:
-            seat_type = "premium"
-        else:
-            seat_type = "regular"
+        seat_type = row_type(r, rows)
 
         for c in range(1, cols + 1):
             seats.append({
@@ -40,94 +53,128 @@ def gen_seats(rows, cols):
             })
     return seats
 
-def calc_price(base_price, start_time, seat_type):
-    """Dynamic pricing with seat category multiplier"""
-    price = base_price
-
-    # Morning discount (before 1pm)
-    if start_time.hour < 13:
-        price -= 50
-    # Evening premium (after 6pm)
-    elif start_time.hour >= 18:
-        price += 30
-    # Weekend surcharge
-    if start_time.weekday() >= 5:
-        price += 20
-
-    # Seat type multiplier
-    if seat_type == "premium":
-        price += 50
-    elif seat_type == "vip":
-        price += 100
-
-    return max(price, 100)
-
-# ---------- Main ----------
-def main():
-    print("Clearing old data...")
-    db.movies.delete_many({})
-    db.screens.delete_many({})
-    db.showtimes.delete_many({})
-    db.users.delete_many({})
-    db.bookings.delete_many({})
-
-    # 5 Movies
-    movies = [
-        {"_id": "m1", "title": "Dil Chahta Hai", "durationMin": 150, "language": "Hindi", "genre": ["Drama","Friendship"], "rating": 8.0},
-        {"_id": "m2", "title": "3 Idiots", "durationMin": 170, "language": "Hindi", "genre": ["Comedy","Drama"], "rating": 8.5},
-        {"_id": "m3", "title": "Andhadhun", "durationMin": 140, "language": "Hindi", "genre": ["Thriller","Mystery"], "rating": 8.2},
-        {"_id": "m4", "title": "Zindagi Na Milegi Dobara", "durationMin": 155, "language": "Hindi", "genre": ["Adventure","Drama"], "rating": 8.3},
-        {"_id": "m5", "title": "Chhichhore", "durationMin": 145, "language": "Hindi", "genre": ["Comedy","Drama"], "rating": 7.9}
-    ]
-    db.movies.insert_many(movies)
-
-    # 3 Screens
-    screens = [
-        {"_id": "s1", "name": "Screen 1", "rows": 10, "cols": 12, "basePrice": 250},
-        {"_id": "s2", "name": "Screen 2", "rows": 8, "cols": 10, "basePrice": 200},
-        {"_id": "s3", "name": "Screen 3", "rows": 6, "cols": 8, "basePrice": 180}
-    ]
-    db.screens.insert_many(screens)
-
-    print("Generating 7-day showtimes...")
-    base_date = datetime(2025, 9, 20, tzinfo=timezone.utc)
-    showtimes = []
+def gen_screens(screens, per_city=None, cities=1):
+    """
+    `per_city` screens in each of `cities` cities, cycling through the
+    `screens` templates. With one city and no more screens than templates
+    the templates are returned as they are (ids s1, s2, ...).
+    """
+    per_city = per_city or len(screens)
+    if cities == 1 and per_city <= len(screens):
+        return [dict(s) for s in screens[:per_city]]
+    out = []
+    for c in range(cities):
+        for k in range(per_city):
+            template = screens[k % len(screens)]
+            out.append(dict(template, _id=f"s{len(out) + 1}", name=f"Screen {k + 1}", city=f"City {c + 1}"))
+    return out
+
+def gen_showtimes(movies, screens, days=7, base_date=BASE_DATE, layout="embedded"):
+    """
+    Daily schedule for `days` days: each screen runs shows from 10:00 until
+    23:00 with a 20 min gap, assigning movies round-robin. Yields showtime
+    documents one at a time.
+
+    layout="embedded": every document carries its priced seat list.
+    layout="compact": documents carry {seat type: price} and one availability
+    bitmap per row instead; the seats themselves are in the screen's layout
+    document (seatmap.py).
+    """
     st_id = 1
-
-    movie_cycle = movies[:]  # for round-robin assignment
     movie_idx = 0
+    # Prices per (screen, slot, day type, seat type), computed once for the whole schedule
+    table = PriceTable({screen["_id"]: screen["basePrice"] for screen in screens})
+    seat_maps = {screen["_id"]: seat_map_for(screen_layout(screen["rows"], screen["cols"]))
+                 for screen in screens} if layout == "compact" else {}
 
-    for day_offset in range(7):  # 7 days
+    for day_offset in range(days):
         date = base_date + timedelta(days=day_offset)
 
         for screen in screens:
             start_time = date.replace(hour=10, minute=0)
 
-            while start_time.hour < 23:
+            while start_time.date() == date.date() and start_time.hour < 23:
                 # Round-robin movie assignment
-                movie = movie_cycle[movie_idx % len(movie_cycle)]
+                movie = movies[movie_idx % len(movies)]
                 movie_idx += 1
 
-                # Generate seats for this show
-                all_seats = gen_seats(screen["rows"], screen["cols"])
-                priced_seats = []
-                for seat in all_seats:
-                    seat["price"] = calc_price(screen["basePrice"], start_time, seat["type"])
-                    priced_seats.append(seat)
-
-                showtimes.append({
+                doc = {
                     "_id": f"st{st_id}",
                     "movieId": movie["_id"],
                     "screenId": screen["_id"],
                     "startTime": start_time,
                     "duration": movie["durationMin"],
-                    "seats": priced_seats
-                })
+                }
+                prices = table.for_show(screen["_id"], start_time)
+                if layout == "compact":
+                    doc["prices"] = prices
+                    doc["avail"] = seat_maps[screen["_id"]].full()
+                else:
+                    # Generate seats for this show
+                    all_seats = gen_seats(screen["rows"], screen["cols"])
+                    for seat in all_seats:
+                        seat["price"] = prices[seat["type"]]
+                    doc["seats"] = all_seats
+                yield doc
                 st_id += 1
 
                 start_time += timedelta(minutes=movie["durationMin"] + 20)
 
-    db.showtimes.insert_many(showtimes)
+def batched(docs, size):
+    """Lists of up to `size` items from an iterator, so a schedule never sits in memory whole."""
+    it = iter(docs)
+    while batch := list(islice(it, size)):
+        yield batch
+
+def seed_showtimes(collection, showtimes, batch_size=SEED_BATCH_SIZE) -> int:
+    """Insert generated showtimes in bounded batches; returns the number inserted."""
+    count = 0
+    for batch in batched(showtimes, batch_size):
+        collection.insert_many(batch, ordered=False)
+        count += len(batch)
+    return count
+
+# ---------- Main ----------
+def main():
+    ap = argparse.ArgumentParser(description="Seed the moviedb Mongo database with demo data.")
+    ap.add_argument("--days", type=int, default=7)
+    ap.add_argument("--screens", type=int, default=len(SCREENS), help="screens per city")
+    ap.add_argument("--cities", type=int, default=1)
+    ap.add_argument("--layout", choices=("embedded", "compact"), default="embedded",
+                    help="seat storage: seat arrays per showtime, or per-screen layout + bitmaps")
+    ap.add_argument("--batch-size", type=int, default=SEED_BATCH_SIZE)
+    args = ap.parse_args()
+
+    if not MONGO_URI:
+        raise SystemExit("MONGO_URI not found in .env")
+    from pymongo import MongoClient  # not needed by the generators (bench/ imports them)
+    client = MongoClient(MONGO_URI)
+    db = client["moviedb"]
+
+    print("Clearing old data...")
+    db.movies.delete_many({})
+    db.screens.delete_many({})
+    db.showtimes.delete_many({})
+    db.users.delete_many({})
+    db.bookings.delete_many({})
+
+    # 5 Movies
+    movies = MOVIES
+    db.movies.insert_many([dict(m) for m in movies])
+
+    screens = gen_screens(SCREENS, args.screens, args.cities)
+    screen_docs = [dict(s) for s in screens]
+    if args.layout == "compact":
+        for doc in screen_docs:
+            doc["layout"] = screen_layout(doc["rows"], doc["cols"])
+    db.screens.insert_many(screen_docs)
+
+    print(f"Generating {args.days}-day showtimes ({args.layout} seats, "
+          f"{len(screens)} screens in {args.cities} cities)...")
+    start = time.perf_counter()
+    count = seed_showtimes(db.showtimes, gen_showtimes(movies, screens, days=args.days, layout=args.layout),
+                           args.batch_size)
+    print(f"Inserted {count} showtimes in {time.perf_counter() - start:.1f}s")
 
     # Demo Users
     users = [
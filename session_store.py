@@ -0,0 +1,200 @@
+# session_store.py
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from conversation import Conversation
+from io_pool import run_io
+
+logger = logging.getLogger(__name__)
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")  # memory | sqlite
+SESSION_DB = os.getenv("SESSION_DB", "sessions.db")
+SESSION_TTL = float(os.getenv("SESSION_TTL", 30 * 60))  # idle seconds before a session expires
+SESSION_MAX = int(os.getenv("SESSION_MAX", 10000))  # sessions kept per process / database
+
+@dataclass(slots=True)
+class Session:
+    """
+    Conversation state for one phone number.
+
+    Supports the dict-style access (`get`, `[]`, `items`) the webhook, context
+    builder and LLM prompt already use; unset fields are left out of `items()`.
+    """
+    phone: str
+    stage: str = "greeting"
+    stm: Conversation = field(default_factory=Conversation)
+    ltm: Optional[List[Dict[str, Any]]] = None  # cached from mem0, not persisted
+    createdAt: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    name: Optional[str] = None
+    email: Optional[str] = None
+    movieTitle: Optional[str] = None
+    showtimeId: Optional[str] = None
+    seats: Any = None
+    bookingId: Any = None
+
+    def get(self, key: str, default=None):
+        value = getattr(self, key, None)
+        return default if value is None else value
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key: str, value):
+        if key not in _FIELD_NAMES:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return getattr(self, key, None) is not None
+
+    def items(self):
+        return [(f, getattr(self, f)) for f in _FIELD_NAMES if getattr(self, f) is not None]
+
+    def to_json(self) -> str:
+        data = {k: v for k, v in self.items() if k != "ltm"}
+        data["stm"] = self.stm.to_dict()
+        data["createdAt"] = self.createdAt.isoformat()
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+    @classmethod
+    def from_json(cls, raw: str) -> "Session":
+        data = json.loads(raw)
+        data["createdAt"] = datetime.fromisoformat(data["createdAt"])
+        data["stm"] = Conversation.from_dict(data.get("stm"))
+        return cls(**{k: v for k, v in data.items() if k in _FIELD_NAMES})
+
+_FIELD_NAMES = tuple(f.name for f in fields(Session))
+
+
+class MemorySessionBackend:
+    """Per-process sessions with idle-TTL and LRU eviction."""
+
+    blocking = False  # plain dict work, safe to call on the event loop
+
+    def __init__(self, ttl: float = SESSION_TTL, max_size: int = SESSION_MAX):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # phone -> (last_seen, Session)
+
+    def get(self, phone: str) -> Optional[Session]:
+        entry = self._entries.get(phone)
+        if entry is None:
+            return None
+        if entry[0] + self.ttl < time.monotonic():
+            del self._entries[phone]
+            return None
+        return entry[1]
+
+    def put(self, session: Session):
+        now = time.monotonic()
+        self._entries[session.phone] = (now, session)
+        self._entries.move_to_end(session.phone)
+        # Least recently seen first: drop expired sessions, then anything over the cap
+        while self._entries:
+            last_seen, _ = next(iter(self._entries.values()))
+            if last_seen + self.ttl >= now and len(self._entries) <= self.max_size:
+                break
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteSessionBackend:
+    """
+    Sessions in a local SQLite database (WAL mode), so several uvicorn workers
+    on the same host serve a phone number from the same state.
+    """
+
+    SWEEP_EVERY = 200  # puts between expiry / size sweeps
+    blocking = True    # disk I/O: SessionStore runs calls on the I/O pool
+
+    def __init__(self, path: str = SESSION_DB, ttl: float = SESSION_TTL, max_size: int = SESSION_MAX):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " phone TEXT PRIMARY KEY, data TEXT NOT NULL, last_seen REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions(last_seen)")
+
+    def get(self, phone: str) -> Optional[Session]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data FROM sessions WHERE phone = ? AND last_seen >= ?",
+                (phone, time.time() - self.ttl),
+            ).fetchone()
+        return Session.from_json(row[0]) if row else None
+
+    def put(self, session: Session):
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO sessions (phone, data, last_seen) VALUES (?, ?, ?) "
+                "ON CONFLICT(phone) DO UPDATE SET data = excluded.data, last_seen = excluded.last_seen",
+                (session.phone, session.to_json(), time.time()),
+            )
+            self._puts += 1
+            if self._puts % self.SWEEP_EVERY == 0:
+                self._sweep()
+
+    def _sweep(self):
+        self._db.execute("DELETE FROM sessions WHERE last_seen < ?", (time.time() - self.ttl,))
+        self._db.execute(
+            "DELETE FROM sessions WHERE phone IN "
+            "(SELECT phone FROM sessions ORDER BY last_seen DESC LIMIT -1 OFFSET ?)",
+            (self.max_size,),
+        )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class SessionStore:
+    """
+    Session lookup in front of a pluggable backend. Calls into a blocking
+    backend (SQLite) run on the I/O pool so they never stall the event loop.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or make_backend()
+
+    async def get(self, phone: str) -> Optional[Session]:
+        if self.backend.blocking:
+            return await run_io(self.backend.get, phone)
+        return self.backend.get(phone)
+
+    def create(self, phone: str) -> Session:
+        return Session(phone=phone)
+
+    async def put(self, session: Session):
+        if self.backend.blocking:
+            await run_io(self.backend.put, session)
+        else:
+            self.backend.put(session)
+
+    def __len__(self) -> int:
+        return len(self.backend)
+
+def make_backend(kind: str = SESSION_BACKEND):
+    if kind == "sqlite":
+        return SQLiteSessionBackend()
+    if kind != "memory":
+        logger.warning("Unknown SESSION_BACKEND %r, using in-memory sessions", kind)
+    return MemorySessionBackend()